@@ -0,0 +1,45 @@
+"""add balance_checkpoints for point-in-time balances
+
+Revision ID: 43a1a66502d4
+Revises: 7f392b64ac3f
+Create Date: 2026-10-19 15:21:09.331742
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "43a1a66502d4"
+down_revision: Union[str, None] = "7f392b64ac3f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # every account's balance as of transaction_id, written at each tick
+    op.create_table(
+        "balance_checkpoints",
+        sa.Column("transaction_id", sa.BigInteger, primary_key=True),
+        sa.Column("account", sa.String, primary_key=True),
+        sa.Column("balance", sa.Integer, nullable=False),
+    )
+    # an as-of read finds its last transaction by time, then scans postings by transaction range
+    op.create_index(
+        "ix_journal_transactions_created_at",
+        "journal_transactions",
+        ["created_at", "transaction_id"],
+    )
+    op.create_index(
+        "ix_journal_postings_transaction_id", "journal_postings", ["transaction_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_journal_postings_transaction_id", table_name="journal_postings")
+    op.drop_index(
+        "ix_journal_transactions_created_at", table_name="journal_transactions"
+    )
+    op.drop_table("balance_checkpoints")
@@ -0,0 +1,50 @@
+"""add idempotency_keys table
+
+Revision ID: 6cfed3ff88a8
+Revises: f8c6706bf23b
+Create Date: 2026-10-19 10:41:55.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6cfed3ff88a8"
+down_revision: Union[str, None] = "f8c6706bf23b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # one row per delivery, claimed in the same transaction as its ledger writes
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("endpoint", sa.String(32), nullable=False),
+        sa.Column("order_id", sa.Integer, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+        sa.PrimaryKeyConstraint("endpoint", "order_id"),
+    )
+    # deliveries already in the ledgers stay deduplicated
+    op.execute(
+        """
+        INSERT INTO idempotency_keys (endpoint, order_id)
+        SELECT 'barrels.deliver', order_id FROM liquid_ledger WHERE transaction_type = 'BARREL_DELIVERY'
+        UNION
+        SELECT 'barrels.deliver', order_id FROM gold_ledger WHERE transaction_type = 'BARREL_PURCHASE'
+        UNION
+        SELECT 'bottler.deliver', order_id FROM potion_ledger WHERE transaction_type = 'POTION_DELIVERY'
+        UNION
+        SELECT 'bottler.deliver', order_id FROM liquid_ledger WHERE transaction_type = 'POTION_DELIVERY'
+        UNION
+        SELECT 'inventory.deliver', order_id FROM capacity_order_ledger
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,57 @@
+"""add carts.age_ticks and cart_archive
+
+Revision ID: 73541e661bba
+Revises: 7429a2bc017a
+Create Date: 2026-10-19 19:12:48.227051
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "73541e661bba"
+down_revision: Union[str, None] = "7429a2bc017a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ticks an open cart has lived through; the cart reaper deletes it past CART_TTL_TICKS
+    op.add_column(
+        "carts",
+        sa.Column("age_ticks", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index(
+        "ix_carts_open_age_ticks",
+        "carts",
+        ["age_ticks"],
+        postgresql_where=sa.text("NOT is_checked_out"),
+    )
+    op.create_index("ix_carts_created_at", "carts", ["created_at"])
+    op.create_index("ix_sale_analytics_cart_id", "sale_analytics", ["cart_id"])
+
+    # checked-out carts, one row per item, moved out of carts once their sale is in sale_analytics
+    op.create_table(
+        "cart_archive",
+        sa.Column("cart_id", sa.Integer, primary_key=True),
+        sa.Column("sku", sa.String, primary_key=True),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("customer_name", sa.String),
+        sa.Column("character_class", sa.String),
+        sa.Column("created_at", sa.DateTime),
+        sa.Column(
+            "archived_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+    )
+    op.create_index("ix_cart_archive_created_at", "cart_archive", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("cart_archive")
+    op.drop_index("ix_sale_analytics_cart_id", table_name="sale_analytics")
+    op.drop_index("ix_carts_created_at", table_name="carts")
+    op.drop_index("ix_carts_open_age_ticks", table_name="carts")
+    op.drop_column("carts", "age_ticks")
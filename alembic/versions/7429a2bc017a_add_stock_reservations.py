@@ -0,0 +1,44 @@
+"""add stock_reservations
+
+Revision ID: 7429a2bc017a
+Revises: 76b3af93479a
+Create Date: 2026-10-19 18:05:37.604219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7429a2bc017a"
+down_revision: Union[str, None] = "76b3af93479a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # stock held for a cart's item from add-to-cart until checkout or expires_at
+    op.create_table(
+        "stock_reservations",
+        sa.Column(
+            "cart_id",
+            sa.Integer,
+            sa.ForeignKey("carts.cart_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("sku", sa.String, primary_key=True),
+        sa.Column("quantity", sa.Integer, nullable=False),
+        sa.Column("expires_at", sa.DateTime, nullable=False),
+    )
+    op.create_index(
+        "ix_stock_reservations_sku", "stock_reservations", ["sku", "expires_at"]
+    )
+    op.create_index(
+        "ix_stock_reservations_expires_at", "stock_reservations", ["expires_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stock_reservations")
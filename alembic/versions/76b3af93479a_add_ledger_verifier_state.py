@@ -0,0 +1,37 @@
+"""add ledger_verifier_state
+
+Revision ID: 76b3af93479a
+Revises: 43a1a66502d4
+Create Date: 2026-10-19 16:40:52.118304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "76b3af93479a"
+down_revision: Union[str, None] = "43a1a66502d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # a single row: the last journal transaction verified, the hash chain up to it and
+    # the balances after it, so each verifier run only reads what was posted since
+    op.create_table(
+        "ledger_verifier_state",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("transaction_id", sa.BigInteger, nullable=False),
+        sa.Column("digest", sa.String, nullable=False),
+        sa.Column("balances", sa.Text, nullable=False),
+        sa.Column(
+            "verified_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ledger_verifier_state")
@@ -0,0 +1,127 @@
+"""add double-entry journal and account_balances
+
+Revision ID: 7f392b64ac3f
+Revises: 93b1ed1e0005
+Create Date: 2026-10-19 12:02:47.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7f392b64ac3f"
+down_revision: Union[str, None] = "93b1ed1e0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # one row per business event: a delivery, a sale or a reset
+    op.create_table(
+        "journal_transactions",
+        sa.Column("transaction_id", sa.BigInteger, primary_key=True),
+        sa.Column("order_id", sa.Integer, nullable=False),
+        sa.Column("transaction_type", sa.String, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+    )
+    op.create_index(
+        "ix_journal_transactions_order_id", "journal_transactions", ["order_id"]
+    )
+
+    # gold, ml:<color>, sku:<sku> and capacity:<kind>, each balanced by its world: twin
+    op.create_table(
+        "journal_postings",
+        sa.Column("posting_id", sa.BigInteger, primary_key=True),
+        sa.Column(
+            "transaction_id",
+            sa.BigInteger,
+            sa.ForeignKey("journal_transactions.transaction_id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("account", sa.String, nullable=False),
+        sa.Column("delta", sa.Integer, nullable=False),
+    )
+    op.create_index(
+        "ix_journal_postings_account", "journal_postings", ["account", "transaction_id"]
+    )
+
+    # running balance per account, updated in the same statement as the postings
+    op.create_table(
+        "account_balances",
+        sa.Column("account", sa.String, primary_key=True),
+        sa.Column("balance", sa.Integer, nullable=False, server_default="0"),
+    )
+
+    # one journal transaction per (order_id, event) across the four ledgers
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE journal_backfill AS
+        SELECT order_id,
+            CASE transaction_type WHEN 'BARREL_PURCHASE' THEN 'BARREL_DELIVERY' ELSE transaction_type END AS event,
+            'gold' AS account, gold_delta AS delta, created_at
+        FROM gold_ledger
+        UNION ALL
+        SELECT order_id, CASE transaction_type WHEN 'POTION_CREATION' THEN 'POTION_DELIVERY' ELSE transaction_type END,
+            account, delta, created_at
+        FROM liquid_ledger
+        CROSS JOIN LATERAL (VALUES
+            ('ml:red', red_ml_delta), ('ml:green', green_ml_delta),
+            ('ml:blue', blue_ml_delta), ('ml:dark', dark_ml_delta)
+        ) AS ml(account, delta)
+        UNION ALL
+        SELECT order_id, CASE transaction_type WHEN 'POTION_CREATION' THEN 'POTION_DELIVERY' ELSE transaction_type END,
+            'sku:' || sku, quantity_delta, created_at
+        FROM potion_ledger
+        UNION ALL
+        SELECT order_id, CASE WHEN order_id = -1 THEN 'GAME_RESET' ELSE 'INVENTORY_UPGRADE' END,
+            account, delta, created_at
+        FROM capacity_order_ledger
+        CROSS JOIN LATERAL (VALUES
+            ('capacity:potions', potion_capacity_increase), ('capacity:ml', ml_capacity_increase)
+        ) AS capacity(account, delta)
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO journal_transactions (order_id, transaction_type, created_at)
+        SELECT order_id, event, MIN(created_at)
+        FROM journal_backfill
+        GROUP BY order_id, event
+        ORDER BY MIN(created_at), order_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO journal_postings (transaction_id, account, delta)
+        SELECT jt.transaction_id, side.account, side.delta
+        FROM (
+            SELECT order_id, event, account, SUM(delta) AS delta
+            FROM journal_backfill
+            GROUP BY order_id, event, account
+            HAVING SUM(delta) <> 0
+        ) b
+        JOIN journal_transactions jt ON jt.order_id = b.order_id AND jt.transaction_type = b.event
+        CROSS JOIN LATERAL (VALUES (b.account, b.delta), ('world:' || b.account, -b.delta)) AS side(account, delta)
+        ORDER BY jt.transaction_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO account_balances (account, balance)
+        SELECT account, SUM(delta)
+        FROM journal_postings
+        GROUP BY account
+        """
+    )
+    op.execute("DROP TABLE journal_backfill")
+
+
+def downgrade() -> None:
+    op.drop_table("account_balances")
+    op.drop_table("journal_postings")
+    op.drop_table("journal_transactions")
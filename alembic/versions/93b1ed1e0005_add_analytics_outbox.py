@@ -0,0 +1,36 @@
+"""add analytics_outbox table
+
+Revision ID: 93b1ed1e0005
+Revises: 6cfed3ff88a8
+Create Date: 2026-10-19 11:26:03.418852
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "93b1ed1e0005"
+down_revision: Union[str, None] = "6cfed3ff88a8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # analytics events written by checkout and ticks, applied in job_id order by the analytics worker
+    op.create_table(
+        "analytics_outbox",
+        sa.Column("job_id", sa.BigInteger, primary_key=True),
+        sa.Column("kind", sa.String(16), nullable=False),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("analytics_outbox")
@@ -0,0 +1,38 @@
+"""add potion_prices table
+
+Revision ID: a3755d349a62
+Revises: 202405161501
+Create Date: 2026-10-19 09:12:41.228310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3755d349a62"
+down_revision: Union[str, None] = "202405161501"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # one row per (version, sku); a new version is written every tick
+    op.create_table(
+        "potion_prices",
+        sa.Column("version", sa.Integer, nullable=False),
+        sa.Column("sku", sa.String(20), nullable=False),
+        sa.Column("price", sa.Integer, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+        sa.PrimaryKeyConstraint("version", "sku"),
+        sa.ForeignKeyConstraint(["sku"], ["potions.sku"], ondelete="CASCADE"),
+        sa.CheckConstraint("price >= 1 AND price <= 500", name="check_price_range"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("potion_prices")
@@ -0,0 +1,45 @@
+"""add game snapshot tables
+
+Revision ID: f8c6706bf23b
+Revises: a3755d349a62
+Create Date: 2026-10-19 10:02:17.513942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f8c6706bf23b"
+down_revision: Union[str, None] = "a3755d349a62"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "game_snapshots",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.text("CURRENT_TIMESTAMP")
+        ),
+    )
+    # every row of one game table, as a jsonb array, per snapshot
+    op.create_table(
+        "game_snapshot_tables",
+        sa.Column("snapshot_name", sa.String(64), nullable=False),
+        sa.Column("table_name", sa.String, nullable=False),
+        sa.Column("rows", postgresql.JSONB, nullable=False),
+        sa.PrimaryKeyConstraint("snapshot_name", "table_name"),
+        sa.ForeignKeyConstraint(
+            ["snapshot_name"], ["game_snapshots.name"], ondelete="CASCADE"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("game_snapshot_tables")
+    op.drop_table("game_snapshots")
@@ -0,0 +1,320 @@
+"""
+Endpoint benchmark suite over seeded ledgers.
+
+Seeds the database at POSTGRES_URI (a local, migrated, disposable database --
+every table is truncated) with a given number of ledger rows, drives each hot
+endpoint through the FastAPI TestClient and records latency percentiles and
+queries per call to a JSON file. Compare two result files to catch regressions.
+
+    uv run python -m scripts.bench_endpoints --rows 10000 1000000 10000000
+    uv run python -m scripts.bench_endpoints --compare base.json head.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from scripts.stats import summarize
+
+SKUS = [
+    "RED_BENCH",
+    "GREEN_BENCH",
+    "BLUE_BENCH",
+    "DARK_BENCH",
+    "PURPLE_BENCH",
+    "TEAL_BENCH",
+]
+RECIPES = [
+    (100, 0, 0, 0),
+    (0, 100, 0, 0),
+    (0, 0, 100, 0),
+    (0, 0, 0, 100),
+    (50, 0, 50, 0),
+    (0, 50, 50, 0),
+]
+CLASSES = ["Warrior", "Wizard", "Rogue", "Cleric", "Druid", "Paladin"]
+DAYS = [
+    "Edgeday",
+    "Bloomday",
+    "Aracanaday",
+    "Hearthday",
+    "Crownday",
+    "Blesseday",
+    "Soulday",
+]
+
+
+def seed(engine, rows: int):
+    """
+    Fills the ledgers with roughly `rows` rows split evenly across gold, potion
+    and liquid ledgers. Half of the gold and potion rows are sales tied to
+    checked-out carts so search and the tick analytics have data to join.
+    """
+    from src.storage import postgres
+
+    per_ledger = max(rows // 3, 2)
+    sales = per_ledger // 2
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                """
+            TRUNCATE gold_ledger, potion_ledger, liquid_ledger, capacity_order_ledger,
+                stock_reservations, cart_items, carts, cart_archive, sale_analytics, time_analytics, potion_prices, analytics_outbox,
+                journal_postings, journal_transactions, account_balances, balance_checkpoints, ledger_verifier_state
+            RESTART IDENTITY CASCADE
+            """
+            )
+        )
+        for sku, (r, g, b, d) in zip(SKUS, RECIPES):
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potions (sku, name, price, red_ml, green_ml, blue_ml, dark_ml, is_active)
+                    VALUES (:sku, :name, 50, :r, :g, :b, :d, TRUE)
+                    ON CONFLICT (sku) DO UPDATE SET is_active = TRUE
+                    """
+                ),
+                {
+                    "sku": sku,
+                    "name": sku.lower().replace("_", " "),
+                    "r": r,
+                    "g": g,
+                    "b": b,
+                    "d": d,
+                },
+            )
+        params = {
+            "sales": sales,
+            "per_ledger": per_ledger,
+            "skus": SKUS,
+            "classes": CLASSES,
+        }
+        statements = [
+            """
+            INSERT INTO carts (customer_name, character_class, is_checked_out, created_at)
+            SELECT 'customer_' || (n % 5000), (:classes)[1 + n % 6], TRUE, NOW() - n * INTERVAL '1 second'
+            FROM generate_series(1, :sales) n
+            """,
+            """
+            INSERT INTO cart_items (cart_id, sku, quantity)
+            SELECT n, (:skus)[1 + n % 6], 1 + n % 3
+            FROM generate_series(1, :sales) n
+            """,
+            """
+            INSERT INTO gold_ledger (order_id, gold_delta, transaction_type, created_at)
+            SELECT n, 50 * (1 + n % 3), 'POTION_SALE', NOW() - n * INTERVAL '1 second'
+            FROM generate_series(1, :sales) n
+            """,
+            """
+            INSERT INTO gold_ledger (order_id, gold_delta, transaction_type, created_at)
+            SELECT n, -10, 'BARREL_PURCHASE', NOW() - n * INTERVAL '1 second'
+            FROM generate_series(:sales + 1, :per_ledger) n
+            """,
+            """
+            INSERT INTO gold_ledger (order_id, gold_delta, transaction_type)
+            VALUES (-1, 1000000000, 'GAME_RESET')
+            """,
+            """
+            INSERT INTO potion_ledger (order_id, line_item_id, sku, quantity_delta, transaction_type, created_at)
+            SELECT n, 1, (:skus)[1 + n % 6], -(1 + n % 3), 'POTION_SALE', NOW() - n * INTERVAL '1 second'
+            FROM generate_series(1, :sales) n
+            """,
+            """
+            INSERT INTO potion_ledger (order_id, line_item_id, sku, quantity_delta, transaction_type, created_at)
+            SELECT n, 1, (:skus)[1 + n % 6], 5, 'POTION_DELIVERY', NOW() - n * INTERVAL '1 second'
+            FROM generate_series(:sales + 1, :per_ledger) n
+            """,
+            """
+            INSERT INTO liquid_ledger
+            (order_id, red_ml_delta, green_ml_delta, blue_ml_delta, dark_ml_delta, transaction_type, created_at)
+            SELECT n, 500, 500, 500, 500, 'BARREL_DELIVERY', NOW() - n * INTERVAL '1 second'
+            FROM generate_series(1, :per_ledger) n
+            """,
+            """
+            INSERT INTO capacity_order_ledger (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
+            VALUES (-1, 1000000, 100000000, 0)
+            """,
+        ]
+        for statement in statements:
+            connection.execute(sqlalchemy.text(statement), params)
+        for day_index, day in enumerate(DAYS):
+            for hour in range(0, 24, 2):
+                connection.execute(
+                    sqlalchemy.text(
+                        """
+                        INSERT INTO time_analytics (day_of_week, hour_of_day, total_sales, total_gold, visitor_count)
+                        VALUES (:day, :hour, :sales, :gold, :visitors)
+                        """
+                    ),
+                    {
+                        "day": day,
+                        "hour": hour,
+                        "sales": 5 + (day_index + hour) % 7,
+                        "gold": 250.0,
+                        "visitors": 10,
+                    },
+                )
+        # the ledgers above were written directly, so post their journal in one pass
+        for rebuild in postgres.REBUILD_JOURNAL_SQL:
+            connection.execute(rebuild)
+        connection.execute(sqlalchemy.text("ANALYZE"))
+
+
+def new_cart(client: TestClient, n: int) -> int:
+    response = client.post(
+        "/carts/",
+        json={
+            "customer_id": str(n),
+            "customer_name": f"bench_{n}",
+            "character_class": CLASSES[n % len(CLASSES)],
+            "level": 1 + n % 20,
+        },
+    )
+    cart_id = response.json()["cart_id"]
+    client.post(f"/carts/{cart_id}/items/{SKUS[n % len(SKUS)]}", json={"quantity": 1})
+    return cart_id
+
+
+def scenarios():
+    """
+    (name, setup, request) triples; setup runs untimed before each request.
+    """
+    return [
+        ("get_inventory", None, lambda c, n, _: c.get("/inventory/audit")),
+        ("create_catalog", None, lambda c, n, _: c.get("/catalog/")),
+        (
+            "search_orders",
+            None,
+            lambda c, n, _: c.get(
+                "/carts/search/", params={"search_page": f"{n * 10}_10"}
+            ),
+        ),
+        (
+            "search_orders_by_customer",
+            None,
+            lambda c, n, _: c.get(
+                "/carts/search/",
+                params={"customer_name": f"customer_{n}", "search_page": "0_10"},
+            ),
+        ),
+        (
+            "checkout",
+            new_cart,
+            lambda c, n, cart_id: c.post(
+                f"/carts/{cart_id}/checkout", json={"payment": "gold"}
+            ),
+        ),
+        (
+            "post_time",
+            None,
+            lambda c, n, _: c.post(
+                "/info/current_time", json={"day": DAYS[n % 7], "hour": (n * 2) % 24}
+            ),
+        ),
+    ]
+
+
+def run_benchmarks(client: TestClient, iterations: int) -> dict:
+    results = {}
+    for name, setup, request in scenarios():
+        latencies, queries, errors = [], [], 0
+        for n in range(iterations):
+            state = setup(client, n) if setup else None
+            start = time.perf_counter()
+            response = request(client, n, state)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            breakdown = response.headers.get("x-query-breakdown")
+            if breakdown:
+                queries.append(json.loads(breakdown)["queries"])
+        results[name] = {
+            **summarize(latencies),
+            "errors": errors,
+            "queries_per_call": sum(queries) / len(queries) if queries else None,
+        }
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base_path: str, head_path: str, threshold: float) -> int:
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+
+    regressions = 0
+    print(f"{base['commit']} -> {head['commit']} (threshold {threshold:.0%})")
+    for rows, head_results in head["results"].items():
+        base_results = base["results"].get(rows, {})
+        for endpoint, stats in head_results.items():
+            before = base_results.get(endpoint)
+            if before is None:
+                continue
+            for metric in ("p50_ms", "p95_ms", "queries_per_call"):
+                old, new = before.get(metric), stats.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                flag = "REGRESSION" if change > threshold else ""
+                regressions += bool(flag)
+                print(
+                    f"{rows:>10} {endpoint:<28}{metric:<18}{old:>10.2f}{new:>10.2f}{change:>+9.1%} {flag}"
+                )
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"))
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed relative slowdown"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        base_path, head_path = args.compare
+        sys.exit(compare(base_path, head_path, args.threshold))
+
+    from src import database as db
+    from src.api.server import app
+
+    api_key = os.getenv("API_KEY", "092304")
+    client = TestClient(app, headers={"access_token": api_key, "x-debug-queries": "1"})
+
+    output = {"commit": git_commit(), "iterations": args.iterations, "results": {}}
+    for rows in args.rows:
+        print(f"seeding {rows} ledger rows...", flush=True)
+        seed(db.engine, rows)
+        output["results"][str(rows)] = run_benchmarks(client, args.iterations)
+        for endpoint, stats in output["results"][str(rows)].items():
+            print(
+                f"{rows:>10} {endpoint:<28}p50 {stats['p50_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms"
+                f"  queries {stats['queries_per_call']}"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
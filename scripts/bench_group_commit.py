@@ -0,0 +1,94 @@
+"""
+Checkout throughput under a burst, with and without ledger group commit.
+
+Resets the database at POSTGRES_URI (a local, migrated, disposable database --
+ledgers and carts are truncated), stocks one potion, opens a cart per checkout
+and then checks them all out from concurrent threads, once committing every
+checkout on its own and once through the LedgerWriter.
+
+    uv run python -m scripts.bench_group_commit --checkouts 2000 --concurrency 32
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.stats import summarize
+from src import database as db
+from src.storage.base import CHECKOUT_OK
+from src.storage.ledger_writer import LedgerWriter
+from src.storage.postgres import PostgresStorage
+
+SKU = "RED_BENCH"
+
+
+def prepare(storage: PostgresStorage, checkouts: int) -> list[int]:
+    storage.reset()
+    storage.add_potion(SKU, "red bench", 50, [100, 0, 0, 0])
+    # negative order ids stay clear of the cart ids checkouts write to the same ledgers
+    storage.record_barrel_delivery(-2, 0, checkouts * 100, 0, 0, 0)
+    storage.record_potion_delivery(
+        -3,
+        [([100, 0, 0, 0], checkouts)],
+        {"red_ml": -checkouts * 100, "green_ml": 0, "blue_ml": 0, "dark_ml": 0},
+    )
+    carts = []
+    for n in range(checkouts):
+        cart_id = storage.create_cart(f"bench_{n}", "Wizard")
+        # reserved for longer than any burst takes
+        storage.set_cart_item(cart_id, SKU, 1, 3600)
+        carts.append(cart_id)
+    return carts
+
+
+def burst(storage: PostgresStorage, carts: list[int], concurrency: int) -> dict:
+    latencies: list[float] = []
+
+    def checkout(cart_id: int) -> bool:
+        start = time.perf_counter()
+        outcome = storage.checkout(cart_id, {})
+        latencies.append(time.perf_counter() - start)
+        return outcome.status == CHECKOUT_OK
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        ok = sum(pool.map(checkout, carts))
+    elapsed = time.perf_counter() - started
+    return {"ok": ok, "per_second": len(carts) / elapsed, **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    engine = db.get_engine()
+    plain = PostgresStorage(engine)
+    grouped = PostgresStorage(
+        engine,
+        ledger_writer=LedgerWriter(engine, args.window_ms / 1000, args.max_batch),
+    )
+
+    results = {}
+    for mode, storage in (("single", plain), ("grouped", grouped)):
+        carts = prepare(plain, args.checkouts)
+        results[mode] = burst(storage, carts, args.concurrency)
+    grouped.ledger_writer.stop()
+
+    print(f"{'commit':<10}{'ok':>8}{'checkouts/s':>14}{'p50 ms':>10}{'p99 ms':>10}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<10}{r['ok']:>8}{r['per_second']:>14.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        )
+    if results["single"]["per_second"]:
+        print(
+            f"grouped/single throughput: {results['grouped']['per_second'] / results['single']['per_second']:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Microbenchmark of JSON encode/decode cost per endpoint, no database needed.
+
+Encode serializes the response model the way FastAPI does for a route with a
+response_model, then renders it with the stock JSONResponse and with the app's
+default ORJSONResponse. Decode compares FastAPI's body parsing (json.loads +
+validation of the parsed python objects) with JsonBody, which validates the raw
+bytes with pydantic-core in one pass.
+
+    uv run python -m scripts.bench_serialization --sizes 10 100 1000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from src.api.barrels import Barrel, BarrelOrder
+from src.api.carts import Customer, LineItem, SearchResponse
+from src.api.catalog import CatalogItem
+from src.serialization import JsonBody
+
+
+def search_page(n: int) -> SearchResponse:
+    now = datetime.now(timezone.utc).isoformat()[:19] + "Z"
+    return SearchResponse(
+        previous="0_10",
+        next=f"{n}_{n}",
+        results=[
+            LineItem(
+                line_item_id=i,
+                item_sku=f"{1 + i % 3} red potions",
+                customer_name=f"customer_{i}",
+                line_item_total=50 * (1 + i % 3),
+                timestamp=now,
+            )
+            for i in range(n)
+        ],
+    )
+
+
+def barrel_plan(n: int) -> List[BarrelOrder]:
+    return [BarrelOrder(sku=f"BARREL_{i}", quantity=1 + i % 10) for i in range(n)]
+
+
+def catalog(n: int) -> List[CatalogItem]:
+    return [
+        CatalogItem(
+            sku=f"POTION_{i}",
+            name=f"potion {i}",
+            quantity=1 + i,
+            price=50,
+            potion_type=[100, 0, 0, 0],
+        )
+        for i in range(n)
+    ]
+
+
+def barrels_body(n: int) -> bytes:
+    return json.dumps(
+        [
+            {
+                "sku": f"BARREL_{i}",
+                "ml_per_barrel": 500,
+                "potion_type": [0.5, 0.5, 0, 0],
+                "price": 100,
+                "quantity": 10,
+            }
+            for i in range(n)
+        ]
+    ).encode()
+
+
+def customers_body(n: int) -> bytes:
+    return json.dumps(
+        [
+            {
+                "customer_id": str(i),
+                "customer_name": f"customer_{i}",
+                "character_class": "Wizard",
+                "level": 1 + i % 20,
+            }
+            for i in range(n)
+        ]
+    ).encode()
+
+
+# (endpoint, response_model, build response content for n items)
+RESPONSES = [
+    ("GET /carts/search/", SearchResponse, search_page),
+    ("POST /barrels/plan", List[BarrelOrder], barrel_plan),
+    ("GET /catalog/", List[CatalogItem], catalog),
+]
+
+# (endpoint, annotation, build raw body for n items)
+BODIES = [
+    ("POST /barrels/deliver", List[Barrel], barrels_body),
+    ("POST /barrels/plan", List[Barrel], barrels_body),
+    ("POST /carts/visits", List[Customer], customers_body),
+]
+
+
+def encode(response_class, adapter: TypeAdapter, content):
+    return response_class(adapter.dump_python(content, mode="json"))
+
+
+def parse_then_validate(adapter: TypeAdapter, raw: bytes):
+    return adapter.validate_python(json.loads(raw))
+
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'encode':<24}{'items':>7}{'json us':>12}{'orjson us':>12}{'speedup':>9}")
+    for name, response_model, build in RESPONSES:
+        adapter: TypeAdapter[Any] = TypeAdapter(response_model)
+        for n in args.sizes:
+            content = build(n)
+            stock = per_call_us(
+                partial(encode, JSONResponse, adapter, content), args.iterations
+            )
+            fast = per_call_us(
+                partial(encode, ORJSONResponse, adapter, content), args.iterations
+            )
+            print(f"{name:<24}{n:>7}{stock:>12.1f}{fast:>12.1f}{stock / fast:>8.2f}x")
+
+    print(
+        f"\n{'decode':<24}{'items':>7}{'fastapi us':>12}{'JsonBody us':>12}{'speedup':>9}"
+    )
+    for name, annotation, build in BODIES:
+        adapter = TypeAdapter(annotation)
+        body = JsonBody(annotation)
+        for n in args.sizes:
+            raw = build(n)
+            stock = per_call_us(
+                partial(parse_then_validate, adapter, raw), args.iterations
+            )
+            fast = per_call_us(
+                partial(body.adapter.validate_json, raw), args.iterations
+            )
+            print(f"{name:<24}{n:>7}{stock:>12.1f}{fast:>12.1f}{stock / fast:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
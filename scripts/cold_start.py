@@ -0,0 +1,79 @@
+"""
+Measures serverless cold start: how long a fresh interpreter takes to import
+src.api.server, and then to answer its first request. Each sample runs in its
+own process so nothing is cached between runs. Results go to a JSON file so
+cold start can be tracked across commits; --budget-ms fails the run when the
+median import gets slower than the budget.
+
+    uv run python -m scripts.cold_start --runs 20
+    uv run python -m scripts.cold_start --budget-ms 800 --output cold_start.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from scripts.bench_endpoints import git_commit
+from scripts.stats import summarize
+
+# runs in the child process; prints import and first request seconds as JSON
+PROBE = """
+import json, time
+start = time.perf_counter()
+from src.api.server import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(app)
+client_ready = time.perf_counter()
+client.get("/")
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_request": done - client_ready}))
+"""
+
+
+def sample(env: dict) -> dict:
+    output = subprocess.check_output([sys.executable, "-c", PROBE], env=env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default="cold_start.json")
+    parser.add_argument(
+        "--budget-ms", type=float, help="maximum allowed median import time"
+    )
+    args = parser.parse_args()
+
+    # stay off the network: the probe only hits "/", which needs no database
+    env = dict(os.environ, STORAGE_BACKEND=os.getenv("STORAGE_BACKEND", "memory"))
+    samples = [sample(env) for _ in range(args.runs)]
+    result = {
+        "commit": git_commit(),
+        "runs": args.runs,
+        "import": summarize([s["import"] for s in samples]),
+        "first_request": summarize([s["first_request"] for s in samples]),
+    }
+
+    for phase in ("import", "first_request"):
+        stats = result[phase]
+        print(
+            f"{phase:<15}p50 {stats['p50_ms']:>8.1f}ms  p95 {stats['p95_ms']:>8.1f}ms  p99 {stats['p99_ms']:>8.1f}ms"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"wrote {args.output}")
+
+    if args.budget_ms is not None and result["import"]["p50_ms"] > args.budget_ms:
+        print(
+            f"cold start import over budget: {result['import']['p50_ms']:.1f}ms > {args.budget_ms:.1f}ms"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Compares requests/second of the sync and async database modes at high concurrency.
+
+Starts the shop with uvicorn once per mode (DB_ASYNC=false, then DB_ASYNC=true),
+hammers the read endpoints with concurrent clients for a fixed duration and
+prints a side-by-side summary. Needs a migrated database at POSTGRES_URI.
+
+    uv run python -m scripts.load_test --concurrency 200 --duration 15
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from scripts.stats import percentile
+
+ENDPOINTS = [
+    ("GET", "/catalog/"),
+    ("GET", "/inventory/audit"),
+    ("GET", "/carts/search/?search_page=0_10"),
+]
+
+
+async def run_load(
+    base_url: str, api_key: str, concurrency: int, duration: float
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient, worker_id: int):
+        nonlocal errors
+        i = worker_id
+        while time.perf_counter() < deadline:
+            method, path = ENDPOINTS[i % len(ENDPOINTS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        headers={"access_token": api_key},
+        limits=limits,
+        timeout=30.0,
+    ) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def wait_for_server(base_url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(base_url + "/", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+def run_mode(async_mode: bool, args) -> dict:
+    env = dict(os.environ, DB_ASYNC="true" if async_mode else "false")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.api.server:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_for_server(base_url)
+        return asyncio.run(
+            run_load(base_url, args.api_key, args.concurrency, args.duration)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per mode")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", "092304"))
+    args = parser.parse_args()
+
+    results = {"sync": run_mode(False, args), "async": run_mode(True, args)}
+
+    print(
+        f"{'mode':<8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+    )
+    for mode, r in results.items():
+        print(
+            f"{mode:<8}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+        )
+    if results["sync"]["rps"]:
+        print(
+            f"async/sync throughput: {results['async']['rps'] / results['sync']['rps']:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
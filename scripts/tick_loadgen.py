@@ -0,0 +1,290 @@
+"""
+Offline stand-in for the Potion Exchange: replays realistic ticks against a
+running shop and reports throughput, tail latency and error rates.
+
+Each tick posts the time, bursts /carts/visits, then every customer polls the
+catalog, creates a cart, adds items and checks out while extra pollers hit
+/catalog/. After the customer phase the bottler, barrel and capacity
+plan/deliver calls run like the scheduler would issue them. With --ramp, one
+tick is played per customer count until the shop falls over.
+
+    uv run python -m scripts.tick_loadgen --url http://127.0.0.1:3000 --customers 100
+    uv run python -m scripts.tick_loadgen --ramp 25 50 100 200 400 --classes Warrior=3,Wizard=1
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from scripts.stats import summarize
+
+DAYS = [
+    "Edgeday",
+    "Bloomday",
+    "Aracanaday",
+    "Hearthday",
+    "Crownday",
+    "Blesseday",
+    "Soulday",
+]
+WHOLESALE_CATALOG = [
+    {
+        "sku": "SMALL_RED_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [1, 0, 0, 0],
+        "price": 100,
+        "quantity": 10,
+    },
+    {
+        "sku": "SMALL_GREEN_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [0, 1, 0, 0],
+        "price": 100,
+        "quantity": 10,
+    },
+    {
+        "sku": "SMALL_BLUE_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [0, 0, 1, 0],
+        "price": 120,
+        "quantity": 10,
+    },
+    {
+        "sku": "SMALL_DARK_BARREL",
+        "ml_per_barrel": 500,
+        "potion_type": [0, 0, 0, 1],
+        "price": 150,
+        "quantity": 10,
+    },
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(
+        self, client: httpx.AsyncClient, name: str, method: str, path: str, **kwargs
+    ):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        self.latencies[name].append(time.perf_counter() - start)
+        if failed:
+            self.errors[name] += 1
+        return response if not failed else None
+
+
+def parse_classes(raw: str) -> tuple[list[str], list[float]]:
+    classes, weights = [], []
+    for entry in raw.split(","):
+        name, _, weight = entry.partition("=")
+        classes.append(name.strip())
+        weights.append(float(weight or 1))
+    return classes, weights
+
+
+async def customer(client, recorder: Recorder, visitor: dict, rng: random.Random):
+    catalog = await recorder.call(client, "catalog", "GET", "/catalog/")
+    cart = await recorder.call(client, "create_cart", "POST", "/carts/", json=visitor)
+    if cart is None:
+        return
+    cart_id = cart.json()["cart_id"]
+    items = catalog.json() if catalog is not None else []
+    for item in rng.sample(items, k=min(len(items), rng.randint(1, 2))):
+        await recorder.call(
+            client,
+            "set_item_quantity",
+            "POST",
+            f"/carts/{cart_id}/items/{item['sku']}",
+            json={"quantity": rng.randint(1, min(3, item["quantity"]))},
+        )
+    await recorder.call(
+        client,
+        "checkout",
+        "POST",
+        f"/carts/{cart_id}/checkout",
+        json={"payment": "gold"},
+    )
+
+
+async def catalog_poller(client, recorder: Recorder, polls: int):
+    for _ in range(polls):
+        await recorder.call(client, "catalog", "GET", "/catalog/")
+
+
+async def scheduler_calls(client, recorder: Recorder, order_id: int):
+    bottle_plan = await recorder.call(client, "bottler_plan", "POST", "/bottler/plan")
+    if bottle_plan is not None and bottle_plan.json():
+        await recorder.call(
+            client,
+            "bottler_deliver",
+            "POST",
+            f"/bottler/deliver/{order_id}",
+            json=bottle_plan.json(),
+        )
+
+    barrel_plan = await recorder.call(
+        client, "barrels_plan", "POST", "/barrels/plan", json=WHOLESALE_CATALOG
+    )
+    if barrel_plan is not None and barrel_plan.json():
+        by_sku = {barrel["sku"]: barrel for barrel in WHOLESALE_CATALOG}
+        delivered = [
+            {**by_sku[order["sku"]], "quantity": order["quantity"]}
+            for order in barrel_plan.json()
+            if order["sku"] in by_sku
+        ]
+        await recorder.call(
+            client,
+            "barrels_deliver",
+            "POST",
+            f"/barrels/deliver/{order_id + 1}",
+            json=delivered,
+        )
+
+    capacity_plan = await recorder.call(
+        client, "capacity_plan", "POST", "/inventory/plan"
+    )
+    if capacity_plan is not None:
+        await recorder.call(
+            client,
+            "capacity_deliver",
+            "POST",
+            f"/inventory/deliver/{order_id + 2}",
+            json=capacity_plan.json(),
+        )
+    await recorder.call(client, "audit", "GET", "/inventory/audit")
+
+
+async def play_tick(args, tick: int, customers: int, classes, weights) -> dict:
+    rng = random.Random(args.seed + tick)
+    recorder = Recorder()
+    visitors = [
+        {
+            "customer_id": f"{tick}-{n}",
+            "customer_name": f"loadgen_{rng.randint(0, 10_000)}",
+            "character_class": rng.choices(classes, weights)[0],
+            "level": rng.randint(1, 20),
+        }
+        for n in range(customers)
+    ]
+    # order ids must be unique across runs or the deliveries are deduplicated
+    order_id = int(time.time()) * 10 + tick * 3
+
+    limits = httpx.Limits(
+        max_connections=customers + args.pollers, max_keepalive_connections=customers
+    )
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"access_token": args.api_key},
+        limits=limits,
+        timeout=args.timeout,
+    ) as client:
+        started = time.perf_counter()
+        await recorder.call(
+            client,
+            "current_time",
+            "POST",
+            "/info/current_time",
+            json={"day": DAYS[(tick // 12) % 7], "hour": (tick % 12) * 2},
+        )
+        await recorder.call(
+            client, "visits", "POST", f"/carts/visits/{order_id}", json=visitors
+        )
+        await asyncio.gather(
+            *(customer(client, recorder, visitor, rng) for visitor in visitors),
+            *(
+                catalog_poller(client, recorder, args.polls)
+                for _ in range(args.pollers)
+            ),
+        )
+        await scheduler_calls(client, recorder, order_id)
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in recorder.latencies.values())
+    errors = sum(recorder.errors.values())
+    everything = [s for samples in recorder.latencies.values() for s in samples]
+    return {
+        "customers": customers,
+        "requests": total,
+        "rps": total / elapsed,
+        "error_rate": errors / total if total else 0.0,
+        "overall": summarize(everything),
+        "endpoints": {
+            name: {**summarize(samples), "errors": recorder.errors[name]}
+            for name, samples in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def print_report(result: dict):
+    overall = result["overall"]
+    print(
+        f"\n{result['customers']} customers: {result['requests']} requests, {result['rps']:.1f} req/s, "
+        f"p99 {overall['p99_ms']:.1f}ms, error rate {result['error_rate']:.1%}"
+    )
+    print(
+        f"  {'endpoint':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    )
+    for name, stats in result["endpoints"].items():
+        print(
+            f"  {name:<20}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+            f"{stats['p99_ms']:>10.1f}{stats['errors']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", "092304"))
+    parser.add_argument("--customers", type=int, default=50, help="customers per tick")
+    parser.add_argument("--ticks", type=int, default=1)
+    parser.add_argument(
+        "--ramp",
+        type=int,
+        nargs="+",
+        help="customer counts to step through, one tick each",
+    )
+    parser.add_argument(
+        "--classes",
+        default="Warrior,Wizard,Rogue,Cleric,Druid,Paladin,Monk,Ranger",
+        help="customer classes with optional weights, e.g. Warrior=3,Wizard=1",
+    )
+    parser.add_argument(
+        "--pollers", type=int, default=10, help="extra concurrent catalog pollers"
+    )
+    parser.add_argument("--polls", type=int, default=5, help="catalog polls per poller")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-p99-ms", type=float, default=2000.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    classes, weights = parse_classes(args.classes)
+    levels = args.ramp or [args.customers] * args.ticks
+
+    for tick, customers in enumerate(levels):
+        result = asyncio.run(play_tick(args, tick, customers, classes, weights))
+        print_report(result)
+        if args.ramp and (
+            result["error_rate"] > args.max_error_rate
+            or result["overall"]["p99_ms"] > args.max_p99_ms
+        ):
+            print(f"\nshop falls over at {customers} concurrent customers")
+            return
+    if args.ramp:
+        print(f"\nshop held up through {levels[-1]} concurrent customers")
+
+
+if __name__ == "__main__":
+    main()
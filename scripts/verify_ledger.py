@@ -0,0 +1,40 @@
+"""
+Runs the incremental ledger integrity verifier against the configured storage
+backend and prints each violation it finds. Exits non-zero if there are any,
+so it can run from cron or CI.
+
+    uv run python -m scripts.verify_ledger
+    uv run python -m scripts.verify_ledger --full
+"""
+import argparse
+import sys
+
+from src import integrity
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="re-verify from the first transaction"
+    )
+    parser.add_argument("--batch-size", type=int, help="journal transactions per page")
+    args = parser.parse_args()
+
+    report = integrity.verify(full=args.full, batch_size=args.batch_size)
+    for violation in report.violations:
+        print(
+            f"transaction {violation.transaction_id:>10}  {violation.rule:<20}{violation.detail}"
+        )
+    print(
+        f"checked {report.checked} transactions, verified through {report.transaction_id}",
+        end="",
+    )
+    print("" if report.saved else " (another run moved the watermark first, not saved)")
+    print(f"{len(report.violations)} violations")
+    sys.exit(1 if report.violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Production launcher: one uvicorn process per worker, without reload.
+
+Each worker keeps its own connection pool and read caches; the caches stay
+coherent through src.cache's LISTEN/NOTIFY bus. Size the pool so that
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) + 2 * workers (the bus connections)
+fits under the database's connection limit.
+
+    python serve.py --workers 4
+"""
+import argparse
+import os
+import uvicorn
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "3000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2"))
+    )
+    args = parser.parse_args()
+
+    uvicorn.run(
+        "src.api.server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="info",
+        proxy_headers=True,
+    )
@@ -0,0 +1,252 @@
+"""
+Admission control: caps how many requests run at once, per priority class and
+overall, so a checkout burst queues briefly or gets a fast 503 instead of
+exhausting the connection pool and timing out every route at once.
+
+When a slot frees up it goes to the oldest waiter of the most important class:
+checkout first, then everything else, then search and analytics.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Tuple
+import asyncio
+from starlette.responses import JSONResponse
+
+CHECKOUT = "checkout"
+DEFAULT = "default"
+BACKGROUND = "background"
+# most important first
+PRIORITY = (CHECKOUT, DEFAULT, BACKGROUND)
+
+# (method, route template) -> class; unlisted routes are DEFAULT
+ROUTE_CLASSES: Dict[Tuple[str, str], str] = {
+    ("POST", "/carts/"): CHECKOUT,
+    ("POST", "/carts/{cart_id}/items/{item_sku}"): CHECKOUT,
+    ("POST", "/carts/{cart_id}/checkout"): CHECKOUT,
+    ("GET", "/carts/search/"): BACKGROUND,
+    ("GET", "/admin/db_stats"): BACKGROUND,
+}
+EXEMPT = ("/", "/metrics", "/docs", "/openapi.json")
+
+
+def parse_limits(raw: str) -> Dict[str, int]:
+    """
+    Parses "checkout=15,background=2" into {class: limit}.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, value = entry.partition("=")
+        if name.strip() not in PRIORITY:
+            raise ValueError(f"Unknown admission class {name.strip()!r}.")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+@dataclass
+class ClassStats:
+    in_flight: int = 0
+    admitted: int = 0
+    queued_total: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+    wait_seconds_total: float = 0.0
+
+
+class AdmissionController:
+    """
+    Only used from the event loop thread, so the counters need no locking.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        limits: Dict[str, int],
+        queue_sizes: Dict[str, int],
+        queue_timeout: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.limits = {
+            name: min(limits.get(name, max_concurrency), max_concurrency)
+            for name in PRIORITY
+        }
+        self.queue_sizes = {name: queue_sizes.get(name, 0) for name in PRIORITY}
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {
+            name: deque() for name in PRIORITY
+        }
+        self.stats: Dict[str, ClassStats] = {name: ClassStats() for name in PRIORITY}
+
+    def _can_run(self, name: str) -> bool:
+        return (
+            self.in_flight < self.max_concurrency
+            and self.stats[name].in_flight < self.limits[name]
+        )
+
+    def _grant(self, name: str):
+        self.in_flight += 1
+        self.stats[name].in_flight += 1
+        self.stats[name].admitted += 1
+
+    def _blocked_on_total(self, name: str) -> bool:
+        # waiters held back by the overall cap rather than their own class limit
+        return (
+            bool(self.waiters[name]) and self.stats[name].in_flight < self.limits[name]
+        )
+
+    def _ahead(self, name: str) -> bool:
+        # earlier waiters of this class, and more important classes waiting for any slot, go first
+        if self.waiters[name]:
+            return True
+        return any(
+            self._blocked_on_total(other) for other in PRIORITY[: PRIORITY.index(name)]
+        )
+
+    async def acquire(self, name: str) -> str | None:
+        """
+        Returns None once admitted, or the rejection reason.
+        """
+        if self._can_run(name) and not self._ahead(name):
+            self._grant(name)
+            return None
+        stats = self.stats[name]
+        waiters = self.waiters[name]
+        if len(waiters) >= self.queue_sizes[name]:
+            stats.rejected_queue_full += 1
+            return "queue_full"
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiters.append(future)
+        stats.queued_total += 1
+        start = loop.time()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+            return None
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # granted in the same loop iteration the wait gave up; hand the slot back
+                self.release(name)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            stats.rejected_timeout += 1
+            return "timeout"
+        finally:
+            stats.wait_seconds_total += loop.time() - start
+            if future in waiters:
+                waiters.remove(future)
+
+    def release(self, name: str):
+        self.in_flight -= 1
+        self.stats[name].in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        for name in PRIORITY:
+            waiters = self.waiters[name]
+            while waiters and self._can_run(name):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._grant(name)
+                future.set_result(None)
+            if self._blocked_on_total(name):
+                # keep less important classes from taking the slots this one is waiting for
+                return
+
+    def render(self) -> str:
+        lines = []
+        for metric, kind, attr, help_text in (
+            (
+                "admission_in_flight",
+                "gauge",
+                "in_flight",
+                "Requests running, by class.",
+            ),
+            (
+                "admission_admitted_total",
+                "counter",
+                "admitted",
+                "Requests admitted, by class.",
+            ),
+            (
+                "admission_queued_total",
+                "counter",
+                "queued_total",
+                "Requests that had to wait for a slot.",
+            ),
+            (
+                "admission_wait_seconds_total",
+                "counter",
+                "wait_seconds_total",
+                "Time spent waiting for a slot.",
+            ),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines += [
+                f'{metric}{{class="{name}"}} {getattr(self.stats[name], attr)}'
+                for name in PRIORITY
+            ]
+        lines += [
+            "# HELP admission_waiting Requests waiting for a slot, by class.",
+            "# TYPE admission_waiting gauge",
+        ]
+        lines += [
+            f'admission_waiting{{class="{name}"}} {len(self.waiters[name])}'
+            for name in PRIORITY
+        ]
+        lines += [
+            "# HELP admission_rejected_total Requests turned away with a 503, by class and reason.",
+            "# TYPE admission_rejected_total counter",
+        ]
+        for name in PRIORITY:
+            stats = self.stats[name]
+            lines.append(
+                f'admission_rejected_total{{class="{name}",reason="queue_full"}} {stats.rejected_queue_full}'
+            )
+            lines.append(
+                f'admission_rejected_total{{class="{name}",reason="timeout"}} {stats.rejected_timeout}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+class AdmissionMiddleware:
+    """
+    Holds a slot for the whole request. Add it inside MetricsMiddleware, which
+    resolves the route template it classifies requests by.
+    """
+
+    def __init__(self, app, controller: AdmissionController, retry_after: int = 1):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] in EXEMPT
+            or self.controller.max_concurrency <= 0
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        name = ROUTE_CLASSES.get(
+            (scope["method"], scope.get("route_template", "")), DEFAULT
+        )
+        reason = await self.controller.acquire(name)
+        if reason is not None:
+            response = JSONResponse(
+                {"detail": "Shop is busy, try again shortly."},
+                status_code=503,
+                headers={
+                    "Retry-After": str(self.retry_after),
+                    "X-Admission-Rejected": reason,
+                },
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
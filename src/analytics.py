@@ -0,0 +1,121 @@
+"""
+Applies the analytics outbox off the request path.
+
+Checkout queues its sale and /info/current_time queues the tick in the same
+transaction as their other writes, and neither waits for analytics. The worker
+applies the queue in order, one insert for all the sales before a tick, then
+rolls the tick up, reprices the catalog for it and runs the cart reaper.
+"""
+import threading
+from src import cart_reaper
+from src import config
+from src import pricing
+from src.logger import get_logger
+from src.storage import get_storage
+
+logger = get_logger(__name__)
+
+_counts = {"jobs": 0, "batches": 0}
+_counts_lock = threading.Lock()
+_worker: "AnalyticsWorker | None" = None
+
+
+def drain() -> int:
+    """
+    Applies everything queued so far and returns how many jobs that was. Stops
+    early while another worker holds the outbox; that worker finishes the queue.
+    """
+    batch_size = config.get_settings().ANALYTICS_BATCH_SIZE
+    storage = get_storage()
+    applied = 0
+    while True:
+        batch = storage.apply_analytics(batch_size)
+        if batch.applied == 0:
+            return applied
+        applied += batch.applied
+        with _counts_lock:
+            _counts["jobs"] += batch.applied
+            _counts["batches"] += 1
+        if batch.tick is not None:
+            try:
+                pricing.refresh_prices(*batch.tick)
+            except Exception:
+                # the tick is already rolled up; prices catch up on the next one
+                logger.exception("price refresh failed", extra={"tick": batch.tick})
+            try:
+                cart_reaper.reap()
+            except Exception:
+                # carts aged this tick are still there for the next one
+                logger.exception("cart reaper failed", extra={"tick": batch.tick})
+
+
+class AnalyticsWorker:
+    """
+    A daemon thread that drains the outbox every poll interval, or as soon as
+    wake() is called.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="analytics-worker", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                drain()
+            except Exception:
+                logger.exception("analytics drain failed")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def start_worker():
+    global _worker
+    if _worker is None:
+        _worker = AnalyticsWorker(config.get_settings().ANALYTICS_POLL_INTERVAL)
+        _worker.start()
+
+
+def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+
+def kick():
+    """
+    Has the outbox applied now: wakes the worker, or drains inline on platforms
+    that never send the lifespan startup event. Meant for a BackgroundTask.
+    """
+    if _worker is not None:
+        _worker.wake()
+    else:
+        drain()
+
+
+def render() -> str:
+    with _counts_lock:
+        counts = dict(_counts)
+    return (
+        "# HELP analytics_jobs_applied_total Analytics outbox jobs applied by this worker.\n"
+        "# TYPE analytics_jobs_applied_total counter\n"
+        f"analytics_jobs_applied_total {counts['jobs']}\n"
+        "# HELP analytics_batches_total Outbox batches applied, each in one transaction.\n"
+        "# TYPE analytics_batches_total counter\n"
+        f"analytics_batches_total {counts['batches']}\n"
+    )
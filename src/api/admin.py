@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, status
-import sqlalchemy
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Path, status
+from pydantic import BaseModel
+from typing import Annotated, List
 from src.api import auth
+from src import cache
 from src import database as db
+from src import integrity
+from src.storage import Balances, get_storage
 
 router = APIRouter(
     prefix="/admin",
@@ -9,6 +14,13 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+SnapshotName = Annotated[str, Path(pattern=r"^[a-zA-Z0-9_-]{1,64}$")]
+
+
+class Snapshot(BaseModel):
+    name: str
+    created_at: datetime
+
 
 @router.post("/reset", status_code=status.HTTP_204_NO_CONTENT)
 def reset():
@@ -16,41 +28,74 @@ def reset():
     Reset the game state. Gold goes to 100, all potions are removed from
     inventory, and all barrels are removed from inventory. Carts are all reset.
     """
-    with db.engine.begin() as connection:
-        connection.execute(
-            sqlalchemy.text("DELETE FROM gold_ledger")
-        )
-        connection.execute(
-            sqlalchemy.text("DELETE FROM potion_ledger")
-        )
-        connection.execute(
-            sqlalchemy.text("DELETE FROM liquid_ledger")
-        )
-        connection.execute(
-            sqlalchemy.text("DELETE FROM carts")
-        )
-        connection.execute(
-            sqlalchemy.text("DELETE FROM cart_items")
-        )
-        connection.execute(
-            sqlalchemy.text("DELETE FROM capacity_order_ledger")
-        )
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO gold_ledger (order_id, gold_delta, transaction_type)
-                VALUES (-1, 100, 'GAME_RESET')
-                """
-            )
-        )
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO capacity_order_ledger 
-                (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
-                VALUES (-1, 50, 10000, 0)
-                """
-            )
-        )
+    get_storage().reset()
+    cache.invalidate(*cache.ALL)
     # TODO: Implement database write logic here
     pass
+
+
+@router.get("/snapshots", response_model=List[Snapshot])
+def list_snapshots():
+    """
+    Lists saved game states, newest first.
+    """
+    return [
+        Snapshot(name=s.name, created_at=s.created_at)
+        for s in get_storage().list_snapshots()
+    ]
+
+
+@router.post("/snapshots/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def create_snapshot(name: SnapshotName):
+    """
+    Saves the whole game state (potions, ledgers, carts, analytics and prices)
+    under name, replacing any snapshot with the same name.
+    """
+    get_storage().create_snapshot(name)
+
+
+@router.post("/snapshots/{name}/restore", status_code=status.HTTP_204_NO_CONTENT)
+def restore_snapshot(name: SnapshotName):
+    """
+    Rewinds the game to a saved snapshot.
+    """
+    if not get_storage().restore_snapshot(name):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    cache.invalidate(*cache.ALL)
+
+
+@router.delete("/snapshots/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_snapshot(name: SnapshotName):
+    if not get_storage().delete_snapshot(name):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+
+@router.get("/balances/as_of", response_model=Balances)
+def get_balances_as_of(timestamp: datetime):
+    """
+    Every balance (gold, ml per color, potions and capacity) as it stood at
+    timestamp, answered from the nearest balance checkpoint.
+    """
+    balances = get_storage().get_balances_as_of(timestamp)
+    if balances is None:
+        raise HTTPException(status_code=404, detail="No balance history at that time")
+    return balances
+
+
+@router.post("/verify_ledger", response_model=integrity.VerifyReport)
+def verify_ledger(full: bool = False):
+    """
+    Checks the journal transactions posted since the last verification for
+    unbalanced postings, negative ml or stock and bottling that doesn't match
+    its recipes, then checks account_balances against the journal. full
+    re-verifies everything and detects rewritten history.
+    """
+    return integrity.verify(full=full)
+
+
+@router.get("/db_stats")
+def get_db_stats():
+    """
+    Reports connection pool wait times and prepared statement reuse.
+    """
+    return db.pool_stats()
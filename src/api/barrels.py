@@ -1,11 +1,16 @@
 from dataclasses import dataclass
 from fastapi import APIRouter, Depends, status
 from pydantic import BaseModel, Field, field_validator
-from typing import List
-import random
+from typing import List, Tuple
 import sqlalchemy
 from src.api import auth
+from src import config
 from src import database as db
+from src import planner
+from src.logger import get_logger
+from src.plans import BarrelProblem
+from src.serialization import JsonBody
+from src.storage import get_storage
 
 router = APIRouter(
     prefix="/barrels",
@@ -13,6 +18,8 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = get_logger(__name__)
+
 
 class Barrel(BaseModel):
     sku: str
@@ -51,90 +58,106 @@ class BarrelSummary:
 
 
 def calculate_barrel_summary(barrels: List[Barrel]) -> BarrelSummary:
-    red_ml = sum(barrel.ml_per_barrel * barrel.potion_type[0] * barrel.quantity for barrel in barrels)
-    green_ml = sum(barrel.ml_per_barrel * barrel.potion_type[1] * barrel.quantity for barrel in barrels)
-    blue_ml = sum(barrel.ml_per_barrel * barrel.potion_type[2] * barrel.quantity for barrel in barrels)
-    dark_ml = sum(barrel.ml_per_barrel * barrel.potion_type[3] * barrel.quantity for barrel in barrels)
+    red_ml = sum(
+        barrel.ml_per_barrel * barrel.potion_type[0] * barrel.quantity
+        for barrel in barrels
+    )
+    green_ml = sum(
+        barrel.ml_per_barrel * barrel.potion_type[1] * barrel.quantity
+        for barrel in barrels
+    )
+    blue_ml = sum(
+        barrel.ml_per_barrel * barrel.potion_type[2] * barrel.quantity
+        for barrel in barrels
+    )
+    dark_ml = sum(
+        barrel.ml_per_barrel * barrel.potion_type[3] * barrel.quantity
+        for barrel in barrels
+    )
     gold_paid = sum(b.price * b.quantity for b in barrels)
 
-    return BarrelSummary(gold_paid=gold_paid,
-                        red_ml=red_ml,
-                        blue_ml=blue_ml,
-                        green_ml=green_ml,
-                        dark_ml=dark_ml)
+    # potion_type shares are floats; the ledgers and the journal hold whole ml
+    return BarrelSummary(
+        gold_paid=gold_paid,
+        red_ml=round(red_ml),
+        blue_ml=round(blue_ml),
+        green_ml=round(green_ml),
+        dark_ml=round(dark_ml),
+    )
+
+
+barrels_body = JsonBody(List[Barrel])
 
 
-@router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
-def post_deliver_barrels(barrels_delivered: List[Barrel], order_id: int):
+@router.post(
+    "/deliver/{order_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    openapi_extra=barrels_body.openapi,
+)
+def post_deliver_barrels(
+    order_id: int, barrels_delivered: List[Barrel] = Depends(barrels_body)
+):
     """
     Processes barrels delivered based on the provided order_id. order_id is a unique value representing
     a single delivery; the call is idempotent based on the order_id.
     """
     # NOTE we are receiving barrels of liquids in exchange for gold
-    print(f"barrels delivered: {barrels_delivered} order_id: {order_id}")
+    logger.info("barrels delivered: %s order_id: %s", barrels_delivered, order_id)
 
     summary = calculate_barrel_summary(barrels_delivered)
-    with db.engine.begin() as connection:
-        # check if order already exists
-        existing_order = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 1 
-                FROM (
-                    SELECT order_id FROM liquid_ledger WHERE order_id = :order_id AND transaction_type = 'BARREL_DELIVERY'
-                    UNION
-                    SELECT order_id FROM gold_ledger WHERE order_id = :order_id AND transaction_type = 'BARREL_PURCHASE'
-                ) AS orders
-                """
-            ),
-            {
-                "order_id": order_id
-            }
-        ).first()
-
-        if existing_order:
-            return
+    recorded = get_storage().record_barrel_delivery(
+        order_id,
+        gold_paid=summary.gold_paid,
+        red_ml=summary.red_ml,
+        green_ml=summary.green_ml,
+        blue_ml=summary.blue_ml,
+        dark_ml=summary.dark_ml,
+    )
+    if not recorded:
+        logger.info("barrel order %s already delivered", order_id)
 
-        # insert into ledger with data
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO liquid_ledger
-                (order_id, red_ml_delta, green_ml_delta, blue_ml_delta, dark_ml_delta, transaction_type)
-                VALUES (:order_id, :red_ml_delta, :green_ml_delta, :blue_ml_delta, :dark_ml_delta, :transaction_type)
-                """
-            ), 
-            {
-                "order_id": order_id,
-                "red_ml_delta": summary.red_ml,
-                "green_ml_delta": summary.green_ml,
-                "blue_ml_delta": summary.blue_ml,
-                "dark_ml_delta": summary.dark_ml,
-                "transaction_type": "BARREL_DELIVERY"
-            }
-        )
 
-        # insert into gold ledger
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO gold_ledger
-                (order_id, gold_delta, transaction_type)
-                VALUES (:order_id, :gold_delta, :transaction_type)
-                """
-            ),
-            {
-                "order_id": order_id,
-                "gold_delta": -summary.gold_paid,  # negative because we're paying
-                "transaction_type": "BARREL_PURCHASE"
-            }
-        )
+def barrel_problem(
+    gold: int,
+    max_barrel_capacity: int,
+    current_ml: List[int],
+    wholesale_catalog: List[Barrel],
+) -> Tuple[BarrelProblem, List[Barrel]]:
+    """
+    Aims for a quarter of capacity in each colour, half again as much dark,
+    with each dark ml worth half again as much. Junk barrels are skipped.
+    """
+    barrels = [
+        barrel
+        for barrel in wholesale_catalog
+        if barrel.quantity > 0 and not barrel.sku.startswith("JUNK")
+    ]
+    gold = max(gold, 0)
+    room = max(max_barrel_capacity - sum(current_ml), 0)
+    target_per_liquid = max_barrel_capacity / 4
+    dark_preference_multiplier = 1.5
+    targets = [target_per_liquid] * 3 + [target_per_liquid * dark_preference_multiplier]
+    problem = BarrelProblem(
+        prices=tuple(barrel.price for barrel in barrels),
+        ml=tuple(
+            tuple(barrel.ml_per_barrel * share for share in barrel.potion_type)
+            for barrel in barrels
+        ),
+        gold=gold,
+        room=room,
+        wanted=tuple(max(0, target - ml) for target, ml in zip(targets, current_ml)),
+        weights=(1.0, 1.0, 1.0, dark_preference_multiplier),
+        bounds=tuple(
+            min(
+                barrel.quantity,
+                gold // barrel.price if barrel.price > 0 else barrel.quantity,
+                int(room // barrel.ml_per_barrel),
+            )
+            for barrel in barrels
+        ),
+    )
+    return problem, barrels
 
-def calculate_max_quantity(barrel: Barrel, gold: int, remaining_capacity: int) -> int:
-    max_by_gold = gold // barrel.price
-    max_by_capacity = remaining_capacity // barrel.ml_per_barrel
-    max_by_availability = barrel.quantity
-    return min(max_by_gold, max_by_capacity, max_by_availability)
 
 def create_barrel_plan(
     gold: int,
@@ -145,154 +168,67 @@ def create_barrel_plan(
     current_dark_ml: int,
     wholesale_catalog: List[Barrel],
 ) -> List[BarrelOrder]:
-    print(
-        f"gold: {gold}, max_barrel_capacity: {max_barrel_capacity}, current_red_ml: {current_red_ml}, current_green_ml: {current_green_ml}, current_blue_ml: {current_blue_ml}, current_dark_ml: {current_dark_ml}, wholesale_catalog: {wholesale_catalog}"
+    """
+    Buys nothing unless BARREL_PLANNER is on. With it on, starts from the
+    greedy plan and searches for a better one until BARREL_PLAN_DEADLINE_MS.
+    """
+    logger.debug(
+        "gold: %s, max_barrel_capacity: %s, current_red_ml: %s, current_green_ml: %s, current_blue_ml: %s, current_dark_ml: %s, wholesale_catalog: %s",
+        gold,
+        max_barrel_capacity,
+        current_red_ml,
+        current_green_ml,
+        current_blue_ml,
+        current_dark_ml,
+        wholesale_catalog,
     )
-    # Get time-based demand data
-    #demand_data = get_time_based_demand()
-    #print(demand_data)
-
-    return []
-    
-    current_levels = {
-        "red": current_red_ml,
-        "green": current_green_ml,
-        "blue": current_blue_ml,
-        "dark": current_dark_ml
-    }
-    target_per_liquid = max_barrel_capacity / 4
-    dark_preference_multiplier = 1.5
-    def compute_deficit():
-        return {
-            "red": max(0, target_per_liquid - current_levels["red"]),
-            "green": max(0, target_per_liquid - current_levels["green"]),
-            "blue": max(0, target_per_liquid - current_levels["blue"]),
-            "dark": max(0, target_per_liquid * dark_preference_multiplier - current_levels["dark"])
-        }
-
-    def calculate_balance_score(barrel: Barrel) -> float:
-        deficit = compute_deficit()
-        colors = ["red", "green", "blue", "dark"]
-        score = 0
-        for idx, color in enumerate(colors):
-            multiplier = dark_preference_multiplier if color == "dark" else 1.0
-            score += barrel.potion_type[idx] * deficit[color] * barrel.ml_per_barrel * multiplier
-        return score
-
-    # def would_exceed_barrel_capacity(barrel: Barrel) -> bool:
-    #     total_in_inventory = current_red_ml + current_green_ml + current_blue_ml + current_dark_ml
-    #     new_amount = total_in_inventory + (barrel.ml_per_barrel) # TODO: configure for multiple quantity barrels  
-    #     if new_amount > max_barrel_capacity:
-    #         print(f"skipping - would exceed barrel capacity")
-    #         return True
-    #     return False
-    
-    remaining_gold = gold
-    remaining_capacity = max_barrel_capacity - (current_red_ml + current_green_ml + current_blue_ml + current_dark_ml)
-    valid_barrels = []
-    affordable_barrels = [
-        barrel for barrel in wholesale_catalog 
-        if barrel.price <= remaining_gold 
-        and not barrel.sku.startswith('JUNK')
-    ]
-    affordable_barrels = [
-        barrel for barrel in wholesale_catalog
-        if barrel.price <= remaining_gold
-        and barrel.potion_type[3] > 0
-    ]
-
-    for barrel in affordable_barrels:
-        max_quantity = calculate_max_quantity(barrel, remaining_gold, remaining_capacity)
-        if max_quantity == 0:
-            continue
-
-        balance_score = calculate_balance_score(barrel)
-        total_score = balance_score * max_quantity
-        if total_score > 0:
-            valid_barrels.append((barrel, total_score, max_quantity))
-
-    if not valid_barrels:
-        if affordable_barrels:
-            random_barrel = random.choice(affordable_barrels)
-            max_quantity = calculate_max_quantity(random_barrel, remaining_gold, remaining_capacity)
-            return [BarrelOrder(sku=random_barrel.sku, quantity=max_quantity or 1)]
+    settings = config.get_settings()
+    if not settings.BARREL_PLANNER:
         return []
 
-    # sort barrels by score in descending order
-    valid_barrels.sort(key=lambda x: x[1], reverse=True)
-    orders = []
-    
-    # take top 2 barrels and calculate optimal quantities
-    for barrel, score, max_qty in valid_barrels[:2]:
-        if remaining_gold >= barrel.price and max_qty > 0:
-            # calculate total liquid after this order
-            total_liquid = (current_red_ml + current_green_ml + 
-                          current_blue_ml + current_dark_ml + 
-                          (barrel.ml_per_barrel * max_qty))
-            
-            # skip if this would exceed capacity
-            if total_liquid > max_barrel_capacity:
-                print(f"Skipping order - would exceed max capacity of {max_barrel_capacity}")
-                continue
+    problem, barrels = barrel_problem(
+        gold,
+        max_barrel_capacity,
+        [current_red_ml, current_green_ml, current_blue_ml, current_dark_ml],
+        wholesale_catalog,
+    )
+    plan = planner.solve(problem, problem.greedy(), settings.BARREL_PLAN_DEADLINE_MS)
+    return [
+        BarrelOrder(sku=barrel.sku, quantity=quantity)
+        for barrel, quantity in zip(barrels, plan)
+        if quantity > 0
+    ]
 
-            orders.append(BarrelOrder(
-                sku=barrel.sku,
-                quantity=max_qty
-            ))
-            remaining_gold -= barrel.price * max_qty
-            remaining_capacity -= barrel.ml_per_barrel * max_qty
-            
-            # update current levels for next iteration
-            current_red_ml += barrel.ml_per_barrel * max_qty * barrel.potion_type[0]
-            current_green_ml += barrel.ml_per_barrel * max_qty * barrel.potion_type[1]
-            current_blue_ml += barrel.ml_per_barrel * max_qty * barrel.potion_type[2]
-            current_dark_ml += barrel.ml_per_barrel * max_qty * barrel.potion_type[3]
-    return orders
 
-@router.post("/plan", response_model=List[BarrelOrder])
-def get_wholesale_purchase_plan(wholesale_catalog: List[Barrel]):
+@router.post(
+    "/plan", response_model=List[BarrelOrder], openapi_extra=barrels_body.openapi
+)
+def get_wholesale_purchase_plan(
+    wholesale_catalog: List[Barrel] = Depends(barrels_body)
+):
     """
     Gets the plan for purchasing wholesale barrels. The call passes in a catalog of available barrels
     and the shop returns back which barrels they'd like to purchase and how many.
     """
-    print(f"barrel catalog: {wholesale_catalog}")
-    with db.engine.begin() as connection:
-        row = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                    (SELECT COALESCE(SUM(gold_delta), 0) FROM gold_ledger) as gold,
-                    (SELECT COALESCE(SUM(ml_capacity_increase), 0) FROM capacity_order_ledger) as max_barrel_capacity,
-                    COALESCE(SUM(red_ml_delta), 0) as red_ml,
-                    COALESCE(SUM(green_ml_delta), 0) as green_ml,
-                    COALESCE(SUM(blue_ml_delta), 0) as blue_ml,
-                    COALESCE(SUM(dark_ml_delta), 0) as dark_ml
-                FROM liquid_ledger
-                """
-            )
-        ).one()
-        
-        gold = row.gold
-        red_ml = row.red_ml
-        green_ml = row.green_ml
-        blue_ml = row.blue_ml
-        dark_ml = row.dark_ml
-        max_barrel_capacity = row.max_barrel_capacity
+    logger.debug("barrel catalog: %s", wholesale_catalog)
+    # balances skip the cache: another worker's delivery may not have reached it yet
+    balances = get_storage().get_balances()
 
     return create_barrel_plan(
-        gold=gold,
-        max_barrel_capacity=max_barrel_capacity,
-        current_red_ml=red_ml,
-        current_green_ml=green_ml,
-        current_blue_ml=blue_ml,
-        current_dark_ml=dark_ml,
+        gold=balances.gold,
+        max_barrel_capacity=balances.max_barrel_capacity,
+        current_red_ml=balances.red_ml,
+        current_green_ml=balances.green_ml,
+        current_blue_ml=balances.blue_ml,
+        current_dark_ml=balances.dark_ml,
         wholesale_catalog=wholesale_catalog,
     )
 
+
 def get_time_based_demand() -> dict:
     # analyzes historical sales data to determine demand patterns by time period.
     # returns a score indicating the relative importance of stocking up now.
-    with db.engine.begin() as connection:
+    with db.read_engine().begin() as connection:
         result = connection.execute(
             sqlalchemy.text(
                 """
@@ -333,8 +269,8 @@ def get_time_based_demand() -> dict:
                 """
             )
         ).first()
-        
+
         return {
-            'avg_upcoming_sales': float(result.avg_upcoming_sales),
-            'stockout_risk': float(result.stockout_risk)
+            "avg_upcoming_sales": float(result.avg_upcoming_sales),
+            "stockout_risk": float(result.stockout_risk),
         }
@@ -2,7 +2,13 @@ from fastapi import APIRouter, Depends, status
 from pydantic import BaseModel, Field, field_validator
 from typing import List
 from src.api import auth
+from src import cache
+from src import config
 from src import database as db
+from src import planner
+from src.logger import get_logger
+from src.plans import BottleProblem
+from src.storage import PotionStock, get_storage
 import sqlalchemy
 
 router = APIRouter(
@@ -11,6 +17,8 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = get_logger(__name__)
+
 
 class PotionMixes(BaseModel):
     potion_type: List[int] = Field(
@@ -30,6 +38,7 @@ class PotionMixes(BaseModel):
             raise ValueError("Sum of potion_type values must be exactly 100")
         return potion_type
 
+
 def calculate_liquid_used(ml_used: dict[str, int], potion: PotionMixes):
     red_used = potion.potion_type[0] * potion.quantity
     green_used = potion.potion_type[1] * potion.quantity
@@ -40,6 +49,7 @@ def calculate_liquid_used(ml_used: dict[str, int], potion: PotionMixes):
     ml_used["blue_ml"] -= blue_used
     ml_used["dark_ml"] -= dark_used
 
+
 @router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
 def post_deliver_bottles(potions_delivered: List[PotionMixes], order_id: int):
     """
@@ -47,91 +57,36 @@ def post_deliver_bottles(potions_delivered: List[PotionMixes], order_id: int):
     a single delivery; the call is idempotent based on the order_id.
     """
     # NOTE we are receiving bottles in exchange for liquid
-    print(f"potions delivered: {potions_delivered} order_id: {order_id}")
-    with db.engine.begin() as connection:
-        existing_order = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 1 
-                FROM (
-                    SELECT order_id FROM potion_ledger WHERE order_id = :order_id AND transaction_type = 'POTION_DELIVERY'
-                    UNION
-                    SELECT order_id FROM liquid_ledger WHERE order_id = :order_id AND transaction_type = 'POTION_DELIVERY' 
-                ) AS combined_ledgers
-                """
-            ),
-            {
-                "order_id": order_id,
-            }
-        ).first()
-
-        if existing_order:
-            print("ORDER ALREADY EXISTS IN POTION LEDGER AND/OR LIQUID_LEDGER")
-            return
-        
-        ml_used = {"red_ml": 0, "green_ml": 0, "blue_ml": 0, "dark_ml": 0}
-        line_item_id = 1
-        for potion in potions_delivered:
-            calculate_liquid_used(ml_used, potion)
-
-            # grab corresponding potion sku
-            sku = connection.execute(
-                sqlalchemy.text(
-                    """
-                    SELECT sku
-                    FROM potions
-                    WHERE red_ml = :red_ml 
-                    AND green_ml = :green_ml 
-                    AND blue_ml = :blue_ml 
-                    AND dark_ml = :dark_ml
-                    """
-                ),
-                {
-                    "red_ml": potion.potion_type[0],
-                    "green_ml": potion.potion_type[1],
-                    "blue_ml": potion.potion_type[2],
-                    "dark_ml": potion.potion_type[3],
-                }
-            ).scalar_one()
-
-            # insert into potion_ledger
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    INSERT INTO potion_ledger
-                    (order_id, line_item_id, sku, quantity_delta, transaction_type)
-                    VALUES (:order_id, :line_item_id, :sku, :quantity_delta, :transaction_type)
-                    """
-                ),
-                {
-                    "order_id": order_id,
-                    "line_item_id": line_item_id,
-                    "sku": sku,
-                    "quantity_delta": potion.quantity,
-                    "transaction_type": "POTION_DELIVERY"
-                }
-            )
-            line_item_id += 1
-        
-        print(f"ml_used: {ml_used}")
-        # insert into liquid_ledger
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO liquid_ledger
-                (order_id, red_ml_delta, green_ml_delta, blue_ml_delta, dark_ml_delta, transaction_type)
-                VALUES (:order_id, :red_ml_delta, :green_ml_delta, :blue_ml_delta, :dark_ml_delta, :transaction_type)
-                """
-            ),
-            {
-                "order_id": order_id,
-                "red_ml_delta": ml_used["red_ml"],
-                "green_ml_delta": ml_used["green_ml"],
-                "blue_ml_delta": ml_used["blue_ml"],
-                "dark_ml_delta": ml_used["dark_ml"],
-                "transaction_type": "POTION_DELIVERY",
-            }
+    logger.info("potions delivered: %s order_id: %s", potions_delivered, order_id)
+    ml_used = {"red_ml": 0, "green_ml": 0, "blue_ml": 0, "dark_ml": 0}
+    for potion in potions_delivered:
+        calculate_liquid_used(ml_used, potion)
+    logger.debug("ml_used: %s", ml_used)
+
+    recorded = get_storage().record_potion_delivery(
+        order_id,
+        [(potion.potion_type, potion.quantity) for potion in potions_delivered],
+        ml_used,
+    )
+    if not recorded:
+        logger.info(
+            "order already exists in potion_ledger and/or liquid_ledger",
+            extra={"order_id": order_id},
         )
+        return
+    cache.invalidate(cache.CATALOG, cache.STOCK)
+
+
+def equal_target(
+    maximum_potion_capacity: int, total_potions: int, active_potions: List[PotionStock]
+) -> int:
+    """
+    The stock every active potion is bottled up to: the space left, evenly
+    divided so that they have an equal max cap.
+    """
+    remaining_space = maximum_potion_capacity - total_potions
+    return remaining_space // len(active_potions)
+
 
 def create_bottle_plan(
     red_ml: int,
@@ -140,123 +95,160 @@ def create_bottle_plan(
     dark_ml: int,
     maximum_potion_capacity: int,
     current_potion_inventory: List[PotionMixes],
+    total_potions: int,
+    active_potions: List[PotionStock],
 ) -> List[PotionMixes]:
     """
     Creates a plan for bottling potions based on available liquids,
-    ensuring an even distribution for variety.
+    ensuring an even distribution for variety. total_potions is the net
+    potion ledger balance across every sku, active or not.
     """
     plans: List[PotionMixes] = []
     current_potion_count = sum([potion.quantity for potion in current_potion_inventory])
     remaining_potion_count = maximum_potion_capacity - current_potion_count
 
     if remaining_potion_count <= 0:
-        print(f"max potion capacity reached - current total: {current_potion_count}, Max: {maximum_potion_capacity}")
+        logger.info(
+            "max potion capacity reached - current total: %s, Max: %s",
+            current_potion_count,
+            maximum_potion_capacity,
+        )
         return []
-    
+
     available_liquids = {
         "red_ml": red_ml,
         "green_ml": green_ml,
         "blue_ml": blue_ml,
-        "dark_ml": dark_ml
+        "dark_ml": dark_ml,
     }
-    
-    with db.engine.begin() as connection:
-        all_potion_quantities = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT COALESCE(SUM(pl.quantity_delta), 0) as total_existing
-                FROM potions p
-                LEFT JOIN potion_ledger pl ON pl.sku = p.sku
-                """
-            )
-        ).scalar()
 
-        active_potions = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT p.sku, 
-                    p.red_ml, 
-                    p.green_ml, 
-                    p.blue_ml, 
-                    p.dark_ml,
-                    COALESCE(SUM(pl.quantity_delta), 0) as total_quantity
-                FROM potions p
-                LEFT JOIN potion_ledger pl ON pl.sku = p.sku
-                WHERE p.is_active = true
-                GROUP BY p.sku, p.red_ml, p.green_ml, p.blue_ml, p.dark_ml
-                """
+    if len(active_potions) == 0:
+        return []
+
+    target_quantity = equal_target(
+        maximum_potion_capacity, total_potions, active_potions
+    )
+    logger.debug(
+        "active_potions: %s target_quantity: %s", active_potions, target_quantity
+    )
+    for potion in active_potions:
+        logger.debug("potion: %s available_liquids: %s", potion, available_liquids)
+        needed_quantity = target_quantity - potion.quantity
+        if needed_quantity <= 0:
+            continue
+
+        required_red_ml = potion.red_ml * needed_quantity
+        required_green_ml = potion.green_ml * needed_quantity
+        required_blue_ml = potion.blue_ml * needed_quantity
+        required_dark_ml = potion.dark_ml * needed_quantity
+        logger.debug("required_red: %s", required_red_ml)
+
+        # check if we have enough liquid
+        if (
+            required_red_ml > available_liquids["red_ml"]
+            or required_green_ml > available_liquids["green_ml"]
+            or required_blue_ml > available_liquids["blue_ml"]
+            or required_dark_ml > available_liquids["dark_ml"]
+        ):
+            # calculate max amount possible based on available liquids
+            # the minimium will be the limiting factor
+            possible_quantity = min(
+                available_liquids["red_ml"] // potion.red_ml
+                if potion.red_ml > 0
+                else float("inf"),
+                available_liquids["green_ml"] // potion.green_ml
+                if potion.green_ml > 0
+                else float("inf"),
+                available_liquids["blue_ml"] // potion.blue_ml
+                if potion.blue_ml > 0
+                else float("inf"),
+                available_liquids["dark_ml"] // potion.dark_ml
+                if potion.dark_ml > 0
+                else float("inf"),
             )
-        ).all()
-        if len(active_potions) == 0:
-            return []
-        
-        # if not, return empty list
-        # evenly divide so that they have a equal max cap
-        remaining_space = maximum_potion_capacity - all_potion_quantities
-        target_quantity = remaining_space // len(active_potions)
-        print(f"active_potions: {active_potions}")
-        print(f"remaining_space: {remaining_space}")
-        print(f"target_quantity: {target_quantity}")
-        for potion in active_potions:
-            print(f"\npotion: {potion}")
-            print(f"available_liquids: {available_liquids}")
-            needed_quantity = target_quantity - potion.total_quantity
-            if needed_quantity <= 0:
+            logger.debug("possible_quantity: %s", possible_quantity)
+
+            if possible_quantity <= 0:
                 continue
 
-            required_red_ml = potion.red_ml * needed_quantity
-            required_green_ml = potion.green_ml * needed_quantity
-            required_blue_ml = potion.blue_ml * needed_quantity
-            required_dark_ml = potion.dark_ml * needed_quantity
-            print(f"required_red: {required_red_ml}")
-
-            # check if we have enough liquid
-            if (required_red_ml > available_liquids["red_ml"] or
-                required_green_ml > available_liquids["green_ml"] or
-                required_blue_ml > available_liquids["blue_ml"] or
-                required_dark_ml > available_liquids["dark_ml"]):
-                
-                # calculate max amount possible based on available liquids
-                # the minimium will be the limiting factor
-                possible_quantity = min(
-                    available_liquids["red_ml"] // potion.red_ml if potion.red_ml > 0 else float('inf'),
-                    available_liquids["green_ml"] // potion.green_ml if potion.green_ml > 0 else float('inf'),
-                    available_liquids["blue_ml"] // potion.blue_ml if potion.blue_ml > 0 else float('inf'),
-                    available_liquids["dark_ml"] // potion.dark_ml if potion.dark_ml > 0 else float('inf')
-                )
-                print(f"possible_quantity: {possible_quantity}")
-                
-                if possible_quantity <= 0:
-                    continue
-                
-                needed_quantity = min(needed_quantity, possible_quantity)
-                print(f"needed_quantity: {needed_quantity}")
-
-            recipe = [
-                potion.red_ml,
-                potion.green_ml,
-                potion.blue_ml,
-                potion.dark_ml
-            ]
-            
-            available_liquids["red_ml"] -= recipe[0] * needed_quantity
-            available_liquids["green_ml"] -= recipe[1] * needed_quantity
-            available_liquids["blue_ml"] -= recipe[2] * needed_quantity
-            available_liquids["dark_ml"] -= recipe[3] * needed_quantity
-
-            plans.append(
-                PotionMixes(
-                    potion_type=recipe,
-                    quantity=needed_quantity
-                )
+            # every recipe uses some colour, so possible_quantity is never the inf placeholder
+            needed_quantity = min(needed_quantity, int(possible_quantity))
+            logger.debug("needed_quantity: %s", needed_quantity)
+
+        recipe = [potion.red_ml, potion.green_ml, potion.blue_ml, potion.dark_ml]
+
+        available_liquids["red_ml"] -= recipe[0] * needed_quantity
+        available_liquids["green_ml"] -= recipe[1] * needed_quantity
+        available_liquids["blue_ml"] -= recipe[2] * needed_quantity
+        available_liquids["dark_ml"] -= recipe[3] * needed_quantity
+
+        plans.append(PotionMixes(potion_type=recipe, quantity=needed_quantity))
+
+    logger.debug("bottle_plan: %s remaining liquids: %s", plans, available_liquids)
+    plans_potion_count = sum(potion.quantity for potion in plans)
+    if plans_potion_count + current_potion_count > maximum_potion_capacity:
+        return []
+    return plans
+
+
+def improve_bottle_plan(
+    greedy_plan: List[PotionMixes],
+    ml: List[int],
+    maximum_potion_capacity: int,
+    current_potion_inventory: List[PotionMixes],
+    total_potions: int,
+    active_potions: List[PotionStock],
+) -> List[PotionMixes]:
+    """
+    Searches from the greedy plan, until BOTTLE_PLAN_DEADLINE_MS, for one
+    that gets the active potions closer to the greedy plan's equal target,
+    e.g. by sharing out ml the greedy plan spent on the first potions it
+    reached. No potion is bottled past the target.
+    """
+    if not active_potions:
+        return greedy_plan
+    ml = [max(on_hand, 0) for on_hand in ml]
+    room = max(
+        maximum_potion_capacity
+        - sum(potion.quantity for potion in current_potion_inventory),
+        0,
+    )
+    target_quantity = equal_target(
+        maximum_potion_capacity, total_potions, active_potions
+    )
+    wanted = [max(target_quantity - potion.quantity, 0) for potion in active_potions]
+    problem = BottleProblem(
+        recipes=tuple(tuple(potion.potion_type) for potion in active_potions),
+        wanted=tuple(wanted),
+        ml=tuple(ml),
+        room=room,
+        bounds=tuple(
+            min(
+                want,
+                room,
+                10000,
+                *(
+                    on_hand // need
+                    for on_hand, need in zip(ml, potion.potion_type)
+                    if need > 0
+                ),
             )
-        
-        print(f"bottle_plan: {plans}")
-        print(f"remaining liquids: {available_liquids}")
-        plans_potion_count = sum(potion.quantity for potion in plans)
-        if plans_potion_count + current_potion_count > maximum_potion_capacity:
-            return []
-        return plans
+            for want, potion in zip(wanted, active_potions)
+        ),
+    )
+    greedy_quantities = {tuple(mix.potion_type): mix.quantity for mix in greedy_plan}
+    initial = tuple(greedy_quantities.get(recipe, 0) for recipe in problem.recipes)
+    plan = planner.solve(
+        problem, initial, config.get_settings().BOTTLE_PLAN_DEADLINE_MS
+    )
+    if plan == initial:
+        return greedy_plan
+    return [
+        PotionMixes(potion_type=list(recipe), quantity=quantity)
+        for recipe, quantity in zip(problem.recipes, plan)
+        if quantity > 0
+    ]
+
 
 @router.post("/plan", response_model=List[PotionMixes])
 def get_bottle_plan():
@@ -265,69 +257,42 @@ def get_bottle_plan():
     Each bottle has a quantity of what proportion of red, green, blue, and dark potions to add.
     Colors are expressed in integers from 0 to 100 that must sum up to exactly 100.
     """
-    inventory = []
-    with db.engine.begin() as connection:
-        row = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                    (SELECT COALESCE(SUM(potion_capacity_increase), 0) FROM capacity_order_ledger) as max_potion_capacity,
-                    COALESCE(SUM(red_ml_delta), 0) as red_ml,
-                    COALESCE(SUM(green_ml_delta), 0) as green_ml,
-                    COALESCE(SUM(blue_ml_delta), 0) as blue_ml,
-                    COALESCE(SUM(dark_ml_delta), 0) as dark_ml
-                FROM liquid_ledger
-                """
-            )
-        ).one()
-        red_ml = row.red_ml
-        green_ml = row.green_ml
-        blue_ml = row.blue_ml
-        dark_ml = row.dark_ml
-        max_potion_capacity = row.max_potion_capacity
-
-        # get all current potions in the form of [(sku, quantity, ...), (sku, quantity, ...)]
-        potions = connection.execute(
-            sqlalchemy.text(
-                """
-                    SELECT 
-                        p.sku,
-                        COALESCE(SUM(pl.quantity_delta), 0) AS quantity,
-                        p.red_ml,
-                        p.green_ml, 
-                        p.blue_ml, 
-                        p.dark_ml
-                    FROM potions p
-                    LEFT JOIN potion_ledger pl ON p.sku = pl.sku
-                    GROUP BY p.sku, p.red_ml, p.green_ml, p.blue_ml, p.dark_ml
-                    HAVING COALESCE(SUM(pl.quantity_delta), 0) > 0
-                """
-            )
-        ).all()
-        for potion in potions:
-            quantity = potion.quantity
-            r = potion.red_ml
-            g = potion.green_ml
-            b = potion.blue_ml
-            d = potion.dark_ml
-            inventory.append(
-                PotionMixes(
-                    potion_type=[r, g, b, d],
-                    quantity=quantity
-                )
-            )
-    print(f"get_bottle_plan inventory: {inventory}")
-    return create_bottle_plan(
-        red_ml=red_ml,
-        green_ml=green_ml,
-        blue_ml=blue_ml,
-        dark_ml=dark_ml,
-        maximum_potion_capacity=max_potion_capacity,
+    storage = get_storage()
+    # balances skip the cache: another worker's delivery may not have reached it yet
+    balances = storage.get_balances()
+    potions = cache.get(
+        cache.STOCK, lambda: storage.get_potion_stock(active_only=False)
+    )
+
+    inventory = [
+        PotionMixes(potion_type=potion.potion_type, quantity=potion.quantity)
+        for potion in potions
+        if potion.quantity > 0
+    ]
+    logger.debug("get_bottle_plan inventory: %s", inventory)
+    active_potions = [potion for potion in potions if potion.is_active]
+    greedy_plan = create_bottle_plan(
+        red_ml=balances.red_ml,
+        green_ml=balances.green_ml,
+        blue_ml=balances.blue_ml,
+        dark_ml=balances.dark_ml,
+        maximum_potion_capacity=balances.max_potion_capacity,
         current_potion_inventory=inventory,
+        total_potions=balances.number_of_potions,
+        active_potions=active_potions,
     )
+    return improve_bottle_plan(
+        greedy_plan,
+        [balances.red_ml, balances.green_ml, balances.blue_ml, balances.dark_ml],
+        balances.max_potion_capacity,
+        inventory,
+        balances.number_of_potions,
+        active_potions,
+    )
+
 
 def get_potion_demand() -> dict:
-    with db.engine.begin() as connection:
+    with db.read_engine().begin() as connection:
         connection.execute(
             sqlalchemy.text(
                 """
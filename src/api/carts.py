@@ -4,7 +4,24 @@ import sqlalchemy
 from src.api import auth
 from enum import Enum
 from typing import List, Optional
+from src import cache
+from src import config
 from src import database as db
+from src import pricing
+from src.logger import get_logger
+from src.serialization import JsonBody
+from src.storage import (
+    CheckoutOutcome,
+    get_storage,
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    ITEM_INSUFFICIENT,
+    ITEM_MISSING,
+)
+from src.storage import postgres
 
 router = APIRouter(
     prefix="/carts",
@@ -12,6 +29,8 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = get_logger(__name__)
+
 
 class SearchSortOptions(str, Enum):
     customer_name = "customer_name"
@@ -19,6 +38,7 @@ class SearchSortOptions(str, Enum):
     line_item_total = "line_item_total"
     timestamp = "timestamp"
 
+
 class SearchSortOrder(str, Enum):
     asc = "asc"
     desc = "desc"
@@ -38,99 +58,85 @@ class SearchResponse(BaseModel):
     results: List[LineItem]
 
 
-@router.get("/search/", response_model=SearchResponse, tags=["search"])
-def search_orders(
-    customer_name: str = "",
-    potion_sku: str = "",
-    search_page: str = "",
-    sort_col: SearchSortOptions = SearchSortOptions.timestamp,
-    sort_order: SearchSortOrder = SearchSortOrder.desc,
-):
+def parse_search_page(search_page: str) -> tuple[int, int]:
     """
-    Search for cart line items by customer name and/or potion sku.
+    Parses "(offset)_(limit)". An empty search_page parses as the first page of
+    10; the handlers then search without a limit, returning every line item.
     """
-    
-    # parse page parameters
     try:
         offset, limit = map(int, search_page.split("_")) if search_page else (0, 10)
     except ValueError:
         offset, limit = 0, 10
+    return offset, limit
 
-    # map enum values to SQL column names
-    sort_col_mapping = {
-        SearchSortOptions.customer_name: "c.customer_name",
-        SearchSortOptions.item_sku: "p.name",
-        SearchSortOptions.line_item_total: "g.gold_delta",
-        SearchSortOptions.timestamp: "g.created_at"
-    }
-
-    sql_sort_col = sort_col_mapping[sort_col]
-
-    with db.engine.begin() as connection:
-        query = """
-            SELECT
-                ROW_NUMBER() OVER (ORDER BY {sort_col} {sort_order}) as line_item_id,
-                g.gold_delta as line_item_total,
-                ci.quantity as quantity,
-                g.created_at as timestamp, 
-                p.name as item_sku, 
-                c.customer_name as customer_name,
-                COUNT(*) OVER() as total_count
-            FROM gold_ledger g
-            JOIN cart_items ci ON ci.cart_id = g.order_id
-            JOIN potions p ON p.sku = ci.sku
-            JOIN carts c ON c.cart_id = ci.cart_id
-            WHERE g.transaction_type = 'POTION_SALE'
-        """.format(
-            sort_col=sql_sort_col,
-            sort_order=sort_order.value
-        )
 
-        params = {}
-        if customer_name:
-            query += " AND c.customer_name = :customer_name"
-            params["customer_name"] = customer_name
+def build_search_response(results, offset: int, limit: int) -> SearchResponse:
+    if not results:
+        return SearchResponse(previous=None, next=None, results=[])
 
-        if potion_sku:
-            query += " AND p.name = :potion_sku"
-            params["potion_sku"] = potion_sku
+    line_items = [
+        LineItem(
+            line_item_id=row.line_item_id,
+            item_sku=f"{row.quantity} {row.item_sku}{'s' if row.quantity > 1 else ''}",
+            customer_name=row.customer_name,
+            line_item_total=row.line_item_total,
+            timestamp=row.timestamp.isoformat()[:19] + "Z",
+        )
+        for row in results
+    ]
 
-        if len(search_page) > 0:
-            query += f" LIMIT {limit} OFFSET {offset}"
+    # "(offset)_(limit)"
+    total_count = results[0].total_count if results else 0
+    previous = f"{max(0, offset-limit)}_{limit}" if offset > 0 else None
+    next = f"{offset+limit}_{limit}" if offset + limit < total_count else None
 
-        results = connection.execute(
-            sqlalchemy.text(query), params
-        ).all()
+    return SearchResponse(previous=previous, next=next, results=line_items)
 
-        if not results:
-            return SearchResponse(
-                previous=None,
-                next=None,
-                results=[]
-            )
-
-        line_items = [
-            LineItem(
-                line_item_id=row.line_item_id,
-                item_sku=f"{row.quantity} {row.item_sku}{'s' if row.quantity > 1 else ''}",
-                customer_name=row.customer_name,
-                line_item_total=row.line_item_total,
-                timestamp=row.timestamp.isoformat()[:19] + "Z"
-            )
-            for row in results
-        ]
 
-        # "(offset)_(limit)"
-        total_count = results[0].total_count if results else 0
-        previous = f"{max(0, offset-limit)}_{limit}" if offset > 0 else None
-        next = f"{offset+limit}_{limit}" if offset + limit < total_count else None
+async def search_orders_async(
+    customer_name: str = "",
+    potion_sku: str = "",
+    search_page: str = "",
+    sort_col: SearchSortOptions = SearchSortOptions.timestamp,
+    sort_order: SearchSortOrder = SearchSortOrder.desc,
+):
+    offset, limit = parse_search_page(search_page)
+    query, params = postgres.build_search_query(
+        customer_name,
+        potion_sku,
+        sort_col.value,
+        sort_order.value,
+        offset,
+        limit if search_page else None,
+    )
+    async with (await db.read_async_engine()).begin() as connection:
+        results = (await connection.execute(sqlalchemy.text(query), params)).all()
+    return build_search_response(results, offset, limit)
 
 
-    return SearchResponse(
-        previous=previous,
-        next=next,
-        results=line_items
+@router.get("/search/", response_model=SearchResponse, tags=["search"])
+@db.async_variant(search_orders_async)
+def search_orders(
+    customer_name: str = "",
+    potion_sku: str = "",
+    search_page: str = "",
+    sort_col: SearchSortOptions = SearchSortOptions.timestamp,
+    sort_order: SearchSortOrder = SearchSortOrder.desc,
+):
+    """
+    Search for cart line items by customer name and/or potion sku.
+    """
+    offset, limit = parse_search_page(search_page)
+    results = get_storage().search_orders(
+        customer_name,
+        potion_sku,
+        sort_col.value,
+        sort_order.value,
+        offset,
+        limit if search_page else None,
     )
+    return build_search_response(results, offset, limit)
+
 
 # LineItem(
 #     line_item_id=1,
@@ -140,6 +146,7 @@ def search_orders(
 #     timestamp="2021-01-01T00:00:00Z",
 # )
 
+
 class Customer(BaseModel):
     customer_id: str
     customer_name: str
@@ -147,12 +154,26 @@ class Customer(BaseModel):
     level: int = Field(ge=1, le=20)
 
 
-@router.post("/visits/{visit_id}", status_code=status.HTTP_204_NO_CONTENT)
-def post_visits(visit_id: int, customers: List[Customer]):
+customers_body = JsonBody(List[Customer])
+
+
+async def post_visits_async(
+    visit_id: int, customers: List[Customer] = Depends(customers_body)
+):
+    logger.debug("visit %s customers: %s", visit_id, customers)
+
+
+@router.post(
+    "/visits/{visit_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    openapi_extra=customers_body.openapi,
+)
+@db.async_variant(post_visits_async)
+def post_visits(visit_id: int, customers: List[Customer] = Depends(customers_body)):
     """
     Shares the customers that visited the store on that tick.
     """
-    print(customers)
+    logger.debug("visit %s customers: %s", visit_id, customers)
     pass
 
 
@@ -160,27 +181,29 @@ class CartCreateResponse(BaseModel):
     cart_id: int
 
 
+async def create_cart_async(new_cart: Customer):
+    async with db.async_engine.begin() as connection:
+        cart_id = (
+            await connection.execute(
+                postgres.CREATE_CART_SQL,
+                {
+                    "customer_name": new_cart.customer_name,
+                    "character_class": new_cart.character_class,
+                },
+            )
+        ).scalar_one()
+    return CartCreateResponse(cart_id=cart_id)
+
+
 @router.post("/", response_model=CartCreateResponse)
+@db.async_variant(create_cart_async)
 def create_cart(new_cart: Customer):
     """
     Creates a new cart for a specific customer.
     """
-    customer_name = new_cart.customer_name
-    character_class = new_cart.character_class
-    with db.engine.begin() as connection:
-        cart_id = connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO carts (customer_name, character_class)
-                VALUES (:customer_name, :character_class)
-                RETURNING cart_id
-                """
-            ),
-            {
-                "customer_name": customer_name,
-                "character_class": character_class,
-            }
-        ).scalar_one()
+    cart_id = get_storage().create_cart(
+        new_cart.customer_name, new_cart.character_class
+    )
     return CartCreateResponse(cart_id=cart_id)
 
 
@@ -188,50 +211,67 @@ class CartItem(BaseModel):
     quantity: int = Field(ge=1, description="Quantity must be at least 1")
 
 
-@router.post("/{cart_id}/items/{item_sku}", status_code=status.HTTP_204_NO_CONTENT)
-def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
-    print(
-        f"cart_id: {cart_id}, item_sku: {item_sku}, cart_item: {cart_item}"
+async def set_item_quantity_async(cart_id: int, item_sku: str, cart_item: CartItem):
+    logger.debug(
+        "cart_id: %s, item_sku: %s, cart_item: %s", cart_id, item_sku, cart_item
     )
-    with db.engine.connect().execution_options(isolation_level="SERIALIZABLE") as connection:
-        with connection.begin():
-            # lock the row with FOR UPDATE to prevent concurrent updates
-            cart = connection.execute(
-                sqlalchemy.text(
-                    """
-                    SELECT c.is_checked_out, p.sku 
-                    FROM carts c
-                    JOIN potions p ON p.sku = :sku
-                    WHERE c.cart_id = :cart_id
-                    FOR UPDATE
-                    """
-                ),
-                {"cart_id": cart_id, "sku": item_sku}
-            ).first()
-
-            if cart is None:
-                raise HTTPException(
-                    status_code=404, 
-                    detail="Cart not found or cart is locked"
-                )
-
-            # upsert
-            connection.execute(
-                sqlalchemy.text(
-                    """
-                    INSERT INTO cart_items (cart_id, sku, quantity)
-                    VALUES (:cart_id, :sku, :quantity)
-                    ON CONFLICT (cart_id, sku) DO UPDATE
-                    SET quantity = cart_items.quantity + :quantity
-                    """
-                ), 
-                {
-                    "cart_id": cart_id,
-                    "sku": item_sku,
-                    "quantity": cart_item.quantity,
-                }
+    params = {
+        "cart_id": cart_id,
+        "sku": item_sku,
+        "quantity": cart_item.quantity,
+        "ttl": config.get_settings().RESERVATION_TTL_SECONDS,
+    }
+    async with db.async_engine.begin() as connection:
+        cart = (
+            await connection.execute(postgres.LOCK_CART_FOR_ITEM_SQL, params)
+        ).first()
+
+        if cart is None or cart.is_checked_out:
+            raise HTTPException(
+                status_code=404, detail="Cart not found or cart is locked"
             )
-        return status.HTTP_204_NO_CONTENT
+
+        await connection.execute(postgres.LOCK_SKU_STOCK_SQL, params)
+        if (
+            await connection.execute(postgres.RESERVE_STOCK_SQL, params)
+        ).first() is None:
+            raise HTTPException(status_code=409, detail="Not enough stock")
+
+        await connection.execute(postgres.UPSERT_CART_ITEM_SQL, params)
+    cache.invalidate(cache.CATALOG)
+    return status.HTTP_204_NO_CONTENT
+
+
+@router.post(
+    "/{cart_id}/items/{item_sku}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={
+        404: {"description": "Cart not found or cart is locked"},
+        409: {"description": "Not enough stock"},
+    },
+)
+@db.async_variant(set_item_quantity_async)
+def set_item_quantity(cart_id: int, item_sku: str, cart_item: CartItem):
+    """
+    Adds the potions to the cart and holds them for it for
+    RESERVATION_TTL_SECONDS, so checkout won't run out of them. Asking for
+    more than the unreserved stock is a 409 "Not enough stock".
+    """
+    logger.debug(
+        "cart_id: %s, item_sku: %s, cart_item: %s", cart_id, item_sku, cart_item
+    )
+    result = get_storage().set_cart_item(
+        cart_id,
+        item_sku,
+        cart_item.quantity,
+        config.get_settings().RESERVATION_TTL_SECONDS,
+    )
+    if result == ITEM_MISSING:
+        raise HTTPException(status_code=404, detail="Cart not found or cart is locked")
+    if result == ITEM_INSUFFICIENT:
+        raise HTTPException(status_code=409, detail="Not enough stock")
+    cache.invalidate(cache.CATALOG)
+    return status.HTTP_204_NO_CONTENT
 
 
 class CheckoutResponse(BaseModel):
@@ -243,150 +283,90 @@ class CartCheckout(BaseModel):
     payment: str
 
 
-@router.post("/{cart_id}/checkout", response_model=CheckoutResponse)
-def checkout(cart_id: int, cart_checkout: CartCheckout):
-    """
-    Handles the checkout process for a specific cart.
-    """
-    with db.engine.begin() as connection:
-        # check if cart exists and get totals
-        cart_exists = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT cart_id, character_class
-                FROM carts 
-                WHERE cart_id = :cart_id
-                FOR UPDATE
-                """
-            ),
-            {"cart_id": cart_id}
-        ).first()
+def checkout_response(
+    cart_id: int, outcome: CheckoutOutcome
+) -> Optional[CheckoutResponse]:
+    if outcome.status == CHECKOUT_MISSING:
+        logger.warning("cart doesn't exist", extra={"cart_id": cart_id})
+        return None
+    if outcome.status == CHECKOUT_EMPTY:
+        logger.info("total potions in cart is 0", extra={"cart_id": cart_id})
+    elif outcome.status == CHECKOUT_ALREADY_DONE:
+        logger.info("cart is already checked out", extra={"cart_id": cart_id})
+    elif outcome.status == CHECKOUT_INSUFFICIENT:
+        logger.warning(
+            "insufficient inventory while checking out", extra={"cart_id": cart_id}
+        )
+    elif outcome.status == CHECKOUT_OK:
+        # the sale has committed; every worker's stock is now stale
+        cache.invalidate(cache.CATALOG, cache.STOCK)
+    return CheckoutResponse(
+        total_potions_bought=outcome.total_potions_bought,
+        total_gold_paid=outcome.total_gold_paid,
+    )
 
-        if cart_exists is None:
-            print("cart doesn't exist")
-            return
-        
-        character_class = cart_exists.character_class
-
-        # Then get totals
-        cart_info = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                    c.is_checked_out, 
-                    COALESCE(SUM(ci.quantity), 0) as total_potions_bought,
-                    COALESCE(SUM(ci.quantity * p.price), 0) as total_gold
-                FROM carts c
-                LEFT JOIN cart_items ci ON ci.cart_id = c.cart_id
-                LEFT JOIN potions p ON p.sku = ci.sku
-                WHERE c.cart_id = :cart_id
-                GROUP BY c.cart_id, c.is_checked_out
-                """
-            ),
-            {"cart_id": cart_id}
+
+async def checkout_async(cart_id: int, cart_checkout: CartCheckout):
+    prices = pricing.get_snapshot().prices
+    async with db.async_engine.begin() as connection:
+        cart = (
+            await connection.execute(postgres.LOCK_CART_SQL, {"cart_id": cart_id})
         ).first()
+        if cart is None:
+            return checkout_response(cart_id, CheckoutOutcome(CHECKOUT_MISSING))
 
-        # debugging
-        if cart_info is None:
-            print("no cart info available")
-            return CheckoutResponse(
-                total_potions_bought=0,
-                total_gold_paid=0
-            )
-        
-        if cart_info.total_potions_bought == 0:
-            print("total potions in cart is 0")
-            return CheckoutResponse(
-                total_potions_bought=0,
-                total_gold_paid=0
+        cart_items = (
+            await connection.execute(postgres.CART_ITEMS_SQL, {"cart_id": cart_id})
+        ).all()
+        total_potions_bought, total_gold = postgres.price_cart_items(cart_items, prices)
+
+        if total_potions_bought == 0:
+            return checkout_response(cart_id, CheckoutOutcome(CHECKOUT_EMPTY))
+
+        if cart_items[0].is_checked_out:
+            return checkout_response(
+                cart_id,
+                CheckoutOutcome(
+                    CHECKOUT_ALREADY_DONE, total_potions_bought, total_gold
+                ),
             )
-        
-        total_potions_bought = cart_info.total_potions_bought
-        total_gold = cart_info.total_gold
-
-        if cart_info.is_checked_out:
-            print("cart is already checked out")
-            return CheckoutResponse(
-                total_potions_bought=total_potions_bought,
-                total_gold_paid=total_gold
+
+        insufficient_inventory = (
+            await connection.execute(
+                postgres.INSUFFICIENT_INVENTORY_SQL, {"cart_id": cart_id}
             )
-        
-        # check for sufficient inventory
-        insufficient_inventory = connection.execute(
-            sqlalchemy.text(
-                """
-                WITH cart_totals AS (
-                    SELECT ci.sku, ci.quantity as requested_quantity
-                    FROM cart_items ci
-                    WHERE ci.cart_id = :cart_id
-                )
-                SELECT ct.sku, ct.requested_quantity, COALESCE(SUM(pl.quantity_delta), 0) as available_quantity
-                FROM cart_totals ct
-                LEFT JOIN potion_ledger pl ON pl.sku = ct.sku
-                GROUP BY ct.sku, ct.requested_quantity
-                HAVING COALESCE(SUM(pl.quantity_delta), 0) < ct.requested_quantity
-                """
-            ),
-            {"cart_id": cart_id}
         ).all()
 
         if insufficient_inventory:
-            print("insufficient inventory while checking out")
-            return CheckoutResponse(
-                total_potions_bought=0,
-                total_gold_paid=0
-            )
-        
-        # update gold and potion ledger, check out cart, and update sale analytics
-        connection.execute(
-            sqlalchemy.text(
-                """
-                WITH gold_update AS (
-                    INSERT INTO gold_ledger 
-                    (order_id, gold_delta, transaction_type)
-                    VALUES (:cart_id, :gold_delta, 'POTION_SALE')
-                ), cart_update AS (
-                    UPDATE carts 
-                    SET is_checked_out = true
-                    WHERE cart_id = :cart_id
-                ), potion_ledger_update AS (
-                    INSERT INTO potion_ledger (order_id, line_item_id, sku, quantity_delta, transaction_type)
-                    SELECT 
-                        :cart_id,
-                        ROW_NUMBER() OVER () as line_item_id,
-                        sku,
-                        -quantity, 
-                        'POTION_SALE'
-                    FROM cart_items
-                    WHERE cart_id = :cart_id
-                ), cur_time AS (
-                    SELECT day_of_week, hour_of_day
-                    FROM time_analytics
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                ), sale_analytics_update AS (
-                    INSERT INTO sale_analytics 
-                    (cart_id, customer_class, hour_of_day, day_of_week, total_gold, potion_count)
-                    SELECT 
-                        :cart_id,
-                        :character_class,
-                        hour_of_day,
-                        day_of_week,
-                        :gold_delta,
-                        :potion_count
-                    FROM cur_time
-                )
-                SELECT 1
-                """
-            ),
+            return checkout_response(cart_id, CheckoutOutcome(CHECKOUT_INSUFFICIENT))
+
+        await connection.execute(
+            postgres.CHECKOUT_SQL,
             {
                 "cart_id": cart_id,
                 "gold_delta": total_gold,
-                "character_class": character_class,
-                "potion_count": total_potions_bought
-            }
+                "character_class": cart.character_class,
+                "potion_count": total_potions_bought,
+            },
         )
-        
-    return CheckoutResponse(
-        total_potions_bought=total_potions_bought, total_gold_paid=total_gold
-    )
\ No newline at end of file
+        await connection.execute(
+            postgres.POST_JOURNAL_SQL,
+            postgres.journal_params(
+                cart_id, "POTION_SALE", postgres.sale_postings(cart_items, total_gold)
+            ),
+        )
+
+    return checkout_response(
+        cart_id, CheckoutOutcome(CHECKOUT_OK, total_potions_bought, total_gold)
+    )
+
+
+@router.post("/{cart_id}/checkout", response_model=CheckoutResponse)
+@db.async_variant(checkout_async)
+def checkout(cart_id: int, cart_checkout: CartCheckout):
+    """
+    Handles the checkout process for a specific cart, priced from the
+    current tick's price table.
+    """
+    outcome = get_storage().checkout(cart_id, pricing.get_snapshot().prices)
+    return checkout_response(cart_id, outcome)
@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
 from typing import List, Annotated
+from src import cache
 from src import database as db
-import sqlalchemy
+from src import pricing
+from src.storage import get_storage
+from src.storage import postgres
 
 router = APIRouter()
 
@@ -20,54 +23,57 @@ class CatalogItem(BaseModel):
     )
 
 
-def create_catalog() -> List[CatalogItem]:
+def build_catalog(potions) -> List[CatalogItem]:
     catalog = []
-    with db.engine.begin() as connection: 
-        #[(sku, name, ...), (sku, name, ...)]
-        potions = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                    p.sku,
-                    p.name,
-                    COALESCE(SUM(pl.quantity_delta), 0) AS quantity,
-                    p.price, 
-                    p.red_ml, 
-                    p.green_ml, 
-                    p.blue_ml, 
-                    p.dark_ml
-                FROM potions p
-                LEFT JOIN potion_ledger pl ON pl.sku = p.sku
-                WHERE is_active = TRUE
-                GROUP BY p.sku, p.name, p.price, p.red_ml, p.green_ml, p.blue_ml, p.dark_ml
-                HAVING COALESCE(SUM(pl.quantity_delta), 0) > 0
-                """
+    prices = pricing.get_snapshot().prices
+    # [(sku, name, ...), (sku, name, ...)]
+    for potion in potions:
+        # only list potions that are in stock and not held by carts
+        quantity = potion.quantity - potion.reserved
+        if quantity <= 0:
+            continue
+        sku = potion.sku
+        name = potion.name
+        price = prices.get(sku, potion.price)
+        potion_type = [
+            potion.red_ml,
+            potion.green_ml,
+            potion.blue_ml,
+            potion.dark_ml,
+        ]  # [r, g, b, d]
+        catalog.append(
+            CatalogItem(
+                sku=sku,
+                name=name,
+                quantity=quantity,
+                price=price,
+                potion_type=potion_type,
             )
+        )
+    return catalog
+
+
+def create_catalog() -> List[CatalogItem]:
+    return build_catalog(get_storage().get_potion_stock(active_only=True))
+
+
+async def create_catalog_async() -> List[CatalogItem]:
+    async with db.async_engine.begin() as connection:
+        potions = (
+            await connection.execute(postgres.POTION_STOCK_SQL, {"active_only": True})
         ).all()
+    return build_catalog(potions)
 
-        for potion in potions:
-            sku = potion.sku
-            name = potion.name
-            quantity = potion.quantity
-            price = potion.price
-            potion_type = [potion.red_ml, potion.green_ml, potion.blue_ml, potion.dark_ml]  # [r, g, b, d]
-            catalog.append(
-                CatalogItem(
-                    sku=sku,
-                    name=name,
-                    quantity=quantity,
-                    price=price,
-                    potion_type=potion_type
-                )
-            )
-    
-    return catalog
+
+async def get_catalog_async() -> List[CatalogItem]:
+    return await cache.get_async(cache.CATALOG, create_catalog_async)
 
 
 @router.get("/catalog/", tags=["catalog"], response_model=List[CatalogItem])
+@db.async_variant(get_catalog_async)
 def get_catalog() -> List[CatalogItem]:
     """
     Retrieves the catalog of items. Each unique item combination should have only a single price.
     You can have at most 6 potion SKUs offered in your catalog at one time.
     """
-    return create_catalog()
+    return cache.get(cache.CATALOG, create_catalog)
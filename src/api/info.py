@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, BackgroundTasks, Depends, status
 from pydantic import BaseModel
 from src.api import auth
+from src import analytics
+from src import cache
 from src import database as db
-import sqlalchemy
+from src.storage import TICK_JOB, get_storage
+from src.storage import postgres
 
 router = APIRouter(
     prefix="/info",
@@ -16,54 +19,32 @@ class Timestamp(BaseModel):
     hour: int
 
 
+def sweep_reservations():
+    if get_storage().sweep_reservations():
+        cache.invalidate(cache.CATALOG)
+
+
+async def post_time_async(timestamp: Timestamp, background_tasks: BackgroundTasks):
+    async with db.async_engine.begin() as connection:
+        await connection.execute(
+            postgres.ENQUEUE_ANALYTICS_SQL,
+            postgres.analytics_job(TICK_JOB, day=timestamp.day, hour=timestamp.hour),
+        )
+
+    background_tasks.add_task(analytics.kick)
+    background_tasks.add_task(sweep_reservations)
+
+
 @router.post("/current_time", status_code=status.HTTP_204_NO_CONTENT)
-def post_time(timestamp: Timestamp):
+@db.async_variant(post_time_async)
+def post_time(timestamp: Timestamp, background_tasks: BackgroundTasks):
     """
     Shares what the latest time (in game time) is.
-    Records analytics for the current tick.
+    Queues the tick behind the sales already waiting for analytics; the
+    analytics worker rolls it up and reprices the catalog. Expired stock
+    reservations are swept once per tick.
     """
-    with db.engine.begin() as connection:
-        # get metrics from ledger tables for the previous tick until now(last 3 hours)
-        sales_data = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                    COALESCE(COUNT(DISTINCT gl.order_id), 0) as total_sales,
-                    COALESCE(SUM(gl.gold_delta), 0) as total_gold,
-                    COALESCE(COUNT(DISTINCT c.cart_id), 0) as visitor_count
-                FROM gold_ledger gl
-                LEFT JOIN potion_ledger pl ON pl.order_id = gl.order_id
-                LEFT JOIN carts c ON DATE(c.created_at) = CURRENT_DATE
-                WHERE DATE(gl.created_at) = CURRENT_DATE
-                    AND gl.created_at >= NOW() - INTERVAL '3 hours'
-                    AND gl.transaction_type = 'POTION_SALE'
-                """
-            )
-        ).first()
+    get_storage().queue_tick(timestamp.day, timestamp.hour)
 
-        # upsert time analytics for previous tick
-        connection.execute(
-            sqlalchemy.text(
-                """
-                INSERT INTO time_analytics (
-                    day_of_week,
-                    hour_of_day,
-                    total_sales,
-                    total_gold,
-                    visitor_count
-                ) VALUES (:day, :hour_of_day, :total_sales, :total_gold, :visitor_count)
-                ON CONFLICT (day_of_week, hour_of_day) DO UPDATE SET
-                    total_sales = :total_sales,
-                    total_gold = :total_gold,
-                    visitor_count = :visitor_count,
-                    created_at = CURRENT_TIMESTAMP
-                """
-            ),
-            {
-                "day": timestamp.day,
-                "hour_of_day": timestamp.hour,
-                "total_sales": sales_data.total_sales,
-                "total_gold": float(sales_data.total_gold or 0),
-                "visitor_count": sales_data.visitor_count
-            }
-        )
+    background_tasks.add_task(analytics.kick)
+    background_tasks.add_task(sweep_reservations)
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, Field
-import sqlalchemy
 from src.api import auth
 from src import database as db
+from src.logger import get_logger
+from src.storage import Balances, get_storage
+from src.storage import postgres
 
 router = APIRouter(
     prefix="/inventory",
@@ -10,6 +13,8 @@ router = APIRouter(
     dependencies=[Depends(auth.get_api_key)],
 )
 
+logger = get_logger(__name__)
+
 
 class InventoryAudit(BaseModel):
     number_of_potions: int
@@ -17,7 +22,6 @@ class InventoryAudit(BaseModel):
     gold: int
 
 
-
 class CapacityPlan(BaseModel):
     potion_capacity: int = Field(
         ge=0, le=10, description="Potion capacity units, max 10"
@@ -25,37 +29,91 @@ class CapacityPlan(BaseModel):
     ml_capacity: int = Field(ge=0, le=10, description="ML capacity units, max 10")
 
 
+def build_audit(balances: Balances) -> InventoryAudit:
+    gold = balances.gold
+    number_of_potions = balances.number_of_potions
+    ml_in_barrels = balances.ml_in_barrels
+    logger.debug(
+        "number_of_potions: %s, ml_in_barrels: %s, gold: %s",
+        number_of_potions,
+        ml_in_barrels,
+        gold,
+    )
+    return InventoryAudit(
+        number_of_potions=number_of_potions, ml_in_barrels=ml_in_barrels, gold=gold
+    )
+
+
+async def load_balances_async() -> Balances:
+    async with (await db.read_async_engine(fresh=True)).begin() as connection:
+        row = (await connection.execute(postgres.BALANCES_SQL)).one()
+    return postgres.balances_from_row(row)
+
+
+async def get_inventory_async():
+    return build_audit(await load_balances_async())
+
+
 @router.get("/audit", response_model=InventoryAudit)
+@db.async_variant(get_inventory_async)
 def get_inventory():
     """
     Returns an audit of the current inventory. Any discrepancies between
     what is reported here and my source of truth will be posted
     as errors on potion exchange.
     """
+    return build_audit(get_storage().get_balances())
 
-    with db.engine.begin() as connection:
-        result = connection.execute(
-            sqlalchemy.text(
-            """
-            SELECT 
-                (SELECT COALESCE(SUM(gold_delta), 0) FROM gold_ledger) as gold,
-                (SELECT COALESCE(SUM(quantity_delta), 0) FROM potion_ledger) as number_of_potions,
-                (SELECT 
-                    COALESCE(SUM(red_ml_delta), 0) + COALESCE(SUM(green_ml_delta), 0) + 
-                    COALESCE(SUM(blue_ml_delta), 0) + COALESCE(SUM(dark_ml_delta), 0) 
-                FROM liquid_ledger) as ml_in_barrels
-            """
-            )
-        ).one()
 
-        gold = result.gold
-        number_of_potions = result.number_of_potions
-        ml_in_barrels = result.ml_in_barrels
-        print(f"number_of_potions: {number_of_potions}, ml_in_barrels: {ml_in_barrels}, gold: {gold}", flush=True)
-    return InventoryAudit(number_of_potions=number_of_potions, ml_in_barrels=ml_in_barrels, gold=gold)
+@router.get("/audit/as_of", response_model=InventoryAudit)
+def get_inventory_as_of(timestamp: datetime):
+    """
+    The audit as it stood at timestamp (UTC unless it carries an offset), for
+    matching a past tick against what Potion Exchange reported.
+    """
+    balances = get_storage().get_balances_as_of(timestamp)
+    if balances is None:
+        raise HTTPException(status_code=404, detail="No inventory history at that time")
+    return build_audit(balances)
+
+
+def plan_capacity(balances: Balances) -> CapacityPlan:
+    gold = balances.gold
+    total_liquid_in_inventory = balances.ml_in_barrels
+    total_potions_in_inventory = balances.number_of_potions
+    max_potion_capacity = balances.max_potion_capacity
+    max_barrel_capacity = balances.max_barrel_capacity
+
+    # NOTE roughly its diminishing returns past this point, and not worth to spend more gold
+    if max_barrel_capacity >= 90000 and max_potion_capacity >= 300:
+        return CapacityPlan(potion_capacity=0, ml_capacity=0)
+    else:
+        return CapacityPlan(potion_capacity=5, ml_capacity=0)
+
+    liquid_utilization = total_liquid_in_inventory / max_barrel_capacity
+    potion_utilization = total_potions_in_inventory / max_potion_capacity
+
+    ml_capacity = 0
+    potion_capacity = 0
+    if gold >= 3000 and liquid_utilization >= 0.7 and potion_utilization >= 0.5:
+        capacity = int(gold // 2000)
+        ml_capacity = capacity
+        potion_capacity = capacity
+    elif gold >= 1000:
+        if liquid_utilization > potion_utilization and liquid_utilization >= 0.7:
+            ml_capacity = 1
+        elif potion_utilization >= 0.6:
+            potion_capacity = 1
+    logger.debug("potion_capacity: %s, ml_capacity: %s", potion_capacity, ml_capacity)
+    return CapacityPlan(potion_capacity=potion_capacity, ml_capacity=ml_capacity)
+
+
+async def get_capacity_plan_async():
+    return plan_capacity(await load_balances_async())
 
 
 @router.post("/plan", response_model=CapacityPlan)
+@db.async_variant(get_capacity_plan_async)
 def get_capacity_plan():
     """
     Provides a daily capacity purchase plan.
@@ -63,64 +121,56 @@ def get_capacity_plan():
     - Start with 1 capacity for 50 potions and 1 capacity for 10,000 ml of potion.
     - Each additional capacity unit costs 1000 gold.
     """
-    with db.engine.begin() as connection:
-        # get gold, potion count, and liquids
-        inventory = connection.execute(
-            sqlalchemy.text(
-            """
-            SELECT 
-                (SELECT COALESCE(SUM(gold_delta), 0) FROM gold_ledger) as gold,
-                (SELECT COALESCE(SUM(quantity_delta), 0) FROM potion_ledger) as total_potions_in_inventory,
-                (SELECT 
-                    COALESCE(SUM(red_ml_delta), 0) + COALESCE(SUM(green_ml_delta), 0) + 
-                    COALESCE(SUM(blue_ml_delta), 0) + COALESCE(SUM(dark_ml_delta), 0) 
-                FROM liquid_ledger) as ml_in_barrels
-            """
-            )
-        ).one()
-        gold = inventory.gold
-        total_liquid_in_inventory = inventory.ml_in_barrels
-        total_potions_in_inventory = inventory.total_potions_in_inventory
-
-        capacity = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 
-                COALESCE(SUM(potion_capacity_increase), 10000) AS max_potion_capacity,
-                COALESCE(SUM(ml_capacity_increase), 10000) AS max_barrel_capacity
-                FROM capacity_order_ledger
-                """
+    return plan_capacity(get_storage().get_balances())
+
+
+def capacity_delivery_params(capacity_purchase: CapacityPlan, order_id: int) -> dict:
+    potion_capacity_increase = capacity_purchase.potion_capacity * 50
+    ml_capacity_increase = capacity_purchase.ml_capacity * 10000
+    gold_delta = (
+        -(capacity_purchase.potion_capacity + capacity_purchase.ml_capacity) * 1000
+    )
+    return {
+        "order_id": order_id,
+        "potion_capacity_increase": potion_capacity_increase,
+        "ml_capacity_increase": ml_capacity_increase,
+        "gold_delta": gold_delta,
+    }
+
+
+async def deliver_capacity_plan_async(capacity_purchase: CapacityPlan, order_id: int):
+    logger.info("capacity delivered: %s order_id: %s", capacity_purchase, order_id)
+    params = capacity_delivery_params(capacity_purchase, order_id)
+
+    async with db.async_engine.begin() as connection:
+        claimed = (
+            await connection.execute(
+                postgres.CLAIM_IDEMPOTENCY_KEY_SQL,
+                {"endpoint": postgres.CAPACITY_DELIVERY, "order_id": order_id},
             )
-        ).one()
-        max_potion_capacity = capacity.max_potion_capacity
-        max_barrel_capacity = capacity.max_barrel_capacity
-
-        # NOTE roughly its diminishing returns past this point, and not worth to spend more gold
-        if max_barrel_capacity >= 90000 and max_potion_capacity >= 300:
-            return CapacityPlan(potion_capacity=0, ml_capacity=0)
-        else:
-            return CapacityPlan(potion_capacity=5, ml_capacity=0)
-        
-        liquid_utilization = total_liquid_in_inventory / max_barrel_capacity
-        potion_utilization = total_potions_in_inventory / max_potion_capacity
-
-        ml_capacity = 0
-        potion_capacity = 0
-        if gold >= 3000 and liquid_utilization >= 0.7 and potion_utilization >= 0.5:
-            capacity = int(gold // 2000)
-            ml_capacity = capacity
-            potion_capacity = capacity
-        elif gold >= 1000:
-            if liquid_utilization > potion_utilization and liquid_utilization >= 0.7:
-                ml_capacity = 1
-            elif potion_utilization >= 0.6:
-                potion_capacity = 1
-        print(f"potion_capacity: {potion_capacity}, ml_capacity: {ml_capacity}")
-    return CapacityPlan(potion_capacity=potion_capacity, ml_capacity=ml_capacity)
+        ).first()
+
+        if claimed is None:
+            return
+
+        await connection.execute(postgres.CAPACITY_DELIVERY_SQL, params)
+        await connection.execute(
+            postgres.POST_JOURNAL_SQL,
+            postgres.journal_params(
+                order_id,
+                "INVENTORY_UPGRADE",
+                postgres.capacity_postings(
+                    params["potion_capacity_increase"],
+                    params["ml_capacity_increase"],
+                    params["gold_delta"],
+                ),
+            ),
+        )
 
 
 # NOTE: once a day
 @router.post("/deliver/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+@db.async_variant(deliver_capacity_plan_async)
 def deliver_capacity_plan(capacity_purchase: CapacityPlan, order_id: int):
     """
     Processes the delivery of the planned capacity purchase. order_id is a
@@ -129,47 +179,8 @@ def deliver_capacity_plan(capacity_purchase: CapacityPlan, order_id: int):
     - Start with 1 capacity for 50 potions and 1 capacity for 10,000 ml of potion.
     - Each additional capacity unit costs 1000 gold.
     """
-    print(f"capacity delivered: {capacity_purchase} order_id: {order_id}")
-    
-    potion_capacity_increase = capacity_purchase.potion_capacity * 50
-    ml_capacity_increase = capacity_purchase.ml_capacity * 10000
-    gold_delta = -(capacity_purchase.potion_capacity + capacity_purchase.ml_capacity) * 1000
-
-    with db.engine.begin() as connection:
-        existing_order = connection.execute(
-            sqlalchemy.text(
-                """
-                SELECT 1 FROM capacity_order_ledger WHERE :order_id = order_id
-                """
-            ), 
-            {
-                "order_id": order_id,
-            }
-        ).first()
-
-        if existing_order:
-            return
-
-        # update capacity and subtract gold
-        connection.execute(
-            sqlalchemy.text(
-                """
-                WITH capacity_insert AS (
-                    INSERT INTO capacity_order_ledger
-                    (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
-                    VALUES (:order_id, :potion_capacity_increase, :ml_capacity_increase, :gold_delta)
-                )
-                INSERT INTO gold_ledger 
-                (order_id, gold_delta, transaction_type)
-                VALUES (:order_id, :gold_delta, 'INVENTORY_UPGRADE')
-                """
-            ), 
-            {
-                "order_id": order_id,
-                "potion_capacity_increase": potion_capacity_increase,
-                "ml_capacity_increase": ml_capacity_increase,
-                "gold_delta": gold_delta
-            }
-        )
+    logger.info("capacity delivered: %s order_id: %s", capacity_purchase, order_id)
+    params = capacity_delivery_params(capacity_purchase, order_id)
 
-        print(f"updating capacity in db: potion_capacity_increase: {potion_capacity_increase}, ml_capacity_increase: {ml_capacity_increase}, gold_consumed: {gold_delta}")
\ No newline at end of file
+    if get_storage().record_capacity_delivery(**params):
+        logger.info("updating capacity in db", extra=params)
@@ -1,6 +1,17 @@
-from fastapi import FastAPI
-from src.api import carts, catalog, bottler, barrels, admin, info, inventory
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from src.api import auth
+from src import admission
+from src import config
+from src import metrics
+from src import profiler
+from src import singleflight
+from src.logger import get_logger
 from starlette.middleware.cors import CORSMiddleware
+import importlib
+import threading
 
 description = """
 Central Coast Cauldrons is the premier ecommerce site for all your alchemical desires.
@@ -21,6 +32,98 @@ tags_metadata = [
     },
 ]
 
+logger = get_logger(__name__)
+
+# routers are imported on first use, in the order they're included
+ROUTERS = ["inventory", "carts", "catalog", "bottler", "barrels", "admin", "info"]
+_routers_loaded = False
+_routers_lock = threading.Lock()
+
+
+def include_routers():
+    """
+    Imports and includes every router once. Keeping them out of module import
+    lets a serverless cold start hand the app over before pydantic has built
+    every request model.
+    """
+    global _routers_loaded
+    with _routers_lock:
+        if _routers_loaded:
+            return
+        for name in ROUTERS:
+            app.include_router(importlib.import_module(f"src.api.{name}").router)
+        _routers_loaded = True
+
+
+def warm_up():
+    """
+    Loads the routers, opens one pooled connection and loads the price table,
+    so the first customer request of a tick doesn't pay for any of it.
+    """
+    from src import database as db
+    from src import pricing
+
+    include_routers()
+    if config.get_settings().STORAGE_BACKEND == "postgres":
+        db.warm_up()
+    pricing.get_snapshot()
+
+
+def start_cache():
+    """
+    Turns on the read caches. With Postgres every worker has to hear the
+    others' invalidations first, so caching waits for the LISTEN/NOTIFY bus;
+    sqlite may be shared by several processes without one, so it stays uncached.
+    """
+    from src import cache
+
+    settings = config.get_settings()
+    if settings.STORAGE_BACKEND == "memory":
+        cache.enable()
+    elif settings.STORAGE_BACKEND == "postgres" and settings.CACHE_BUS:
+        cache.start_bus(settings.POSTGRES_URI)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from src import analytics
+    from src import planner
+
+    start_cache()
+    analytics.start_worker()
+    planner.start_pool()
+    try:
+        await run_in_threadpool(warm_up)
+        if config.get_settings().DB_ASYNC:
+            from src import database as db
+
+            await db.warm_up_async()
+    except Exception:
+        # a cold database shouldn't stop the app from starting; requests will retry
+        logger.exception("warm up failed")
+    yield
+    from src import cache
+
+    analytics.stop_worker()
+    planner.stop_pool()
+    cache.stop_bus()
+
+
+class LazyRouterMiddleware:
+    """
+    Includes the routers before the first request is routed, for platforms
+    that never send the ASGI lifespan startup event.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not _routers_loaded and scope["type"] == "http":
+            await run_in_threadpool(include_routers)
+        await self.app(scope, receive, send)
+
+
 app = FastAPI(
     title="Central Coast Cauldrons",
     description=description,
@@ -31,6 +134,9 @@ app = FastAPI(
         "email": "lupierce@calpoly.edu",
     },
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
+    # orjson encodes the validated response content several times faster than json.dumps
+    default_response_class=ORJSONResponse,
 )
 
 origins = ["https://potion-exchange.vercel.app"]
@@ -43,15 +149,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(inventory.router)
-app.include_router(carts.router)
-app.include_router(catalog.router)
-app.include_router(bottler.router)
-app.include_router(barrels.router)
-app.include_router(admin.router)
-app.include_router(info.router)
+settings = config.get_settings()
+admission_controller = admission.AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENCY,
+    admission.parse_limits(settings.ADMISSION_LIMITS),
+    admission.parse_limits(settings.ADMISSION_QUEUE),
+    settings.ADMISSION_QUEUE_TIMEOUT,
+)
+
+app.add_middleware(profiler.ProfilerMiddleware)
+# inside MetricsMiddleware, which resolves the route it classifies by and counts its 503s
+app.add_middleware(
+    admission.AdmissionMiddleware,
+    controller=admission_controller,
+    retry_after=settings.ADMISSION_RETRY_AFTER,
+)
+app.add_middleware(metrics.MetricsMiddleware)
+# outermost, so routes exist before MetricsMiddleware resolves them
+app.add_middleware(LazyRouterMiddleware)
 
 
 @app.get("/")
 async def root():
     return {"message": "Shop is open for business!"}
+
+
+@app.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(auth.get_api_key)],
+    include_in_schema=False,
+)
+async def get_metrics():
+    """
+    Per-route latency histograms, p50/p95/p99, in-flight and error counts,
+    per-route query totals, coalesced loads, admission control, the
+    analytics worker, the cart reaper, the plan searches and group commit in
+    Prometheus text format.
+    """
+    from src import analytics
+    from src import cart_reaper
+    from src import planner
+    from src import database as db
+    from src.storage import ledger_writer
+
+    pool = db.pool_stats()
+    return "".join(
+        (
+            profiler.render(),
+            singleflight.render(),
+            admission_controller.render(),
+            analytics.render(),
+            cart_reaper.render(),
+            planner.render(),
+            ledger_writer.render(),
+        )
+    ) + metrics.render(
+        {
+            "db_pool_checked_out": pool["checked_out"],
+            "db_pool_avg_wait_ms": pool["avg_wait_ms"],
+            "db_pool_max_wait_ms": pool["max_wait_ms"],
+            "db_prepared_statement_hit_rate": pool["prepared_statement_hit_rate"],
+        }
+    )
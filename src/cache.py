@@ -0,0 +1,244 @@
+"""
+Per-process read caches kept coherent across workers with Postgres LISTEN/NOTIFY.
+
+Writers call invalidate() after their transaction commits. That drops the
+entries locally and queues a NOTIFY; every other worker's listener drops the
+same entries as soon as the notification arrives. Caching is only switched on
+while this process is listening (or when storage is in-process memory), so a
+worker that can't hear invalidations never serves stale reads.
+"""
+from typing import Any, Callable, Dict, List
+import os
+import queue
+import threading
+import time
+from src import singleflight
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+CATALOG = "catalog"
+STOCK = "stock"
+PRICES = "prices"
+ALL = (CATALOG, STOCK, PRICES)
+
+CHANNEL = "potion_cache"
+# how long the listener waits for a notification before checking for shutdown
+LISTEN_TIMEOUT = 1.0
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+class Cache:
+    """
+    Named entries guarded by a generation counter: a value loaded while an
+    invalidation raced with the load is returned but not stored.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._generations: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, name: str):
+        with self._lock:
+            if name in self._values:
+                return True, self._values[name], self._generations.get(name, 0)
+            return False, None, self._generations.get(name, 0)
+
+    def store(self, name: str, value: Any, generation: int):
+        with self._lock:
+            if self._generations.get(name, 0) == generation:
+                self._values[name] = value
+
+    def put(self, name: str, value: Any):
+        with self._lock:
+            self._values[name] = value
+
+    def subscribe(self, name: str, callback: Callable[[], None]):
+        with self._lock:
+            self._subscribers.setdefault(name, []).append(callback)
+
+    def drop(self, names):
+        with self._lock:
+            for name in names:
+                self._values.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+                # later readers must not join a load that started before the write
+                singleflight.forget(name)
+            callbacks = [
+                callback
+                for name in names
+                for callback in self._subscribers.get(name, [])
+            ]
+        for callback in callbacks:
+            callback()
+
+
+_cache = Cache()
+_enabled = False
+_bus: "CacheBus | None" = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    """For single-process storage (memory), where there are no other workers to hear from."""
+    global _enabled
+    _enabled = True
+
+
+def get(name: str, loader: Callable[[], Any]) -> Any:
+    """
+    Returns the cached value for name, loading it on a miss. Concurrent misses
+    (and every call while caching is off) share one load through singleflight.
+    """
+    if not _enabled:
+        return singleflight.do(name, loader)
+    hit, value, generation = _cache.lookup(name)
+    if hit:
+        return value
+    value = singleflight.do(name, loader)
+    _cache.store(name, value, generation)
+    return value
+
+
+async def get_async(name: str, loader) -> Any:
+    """Like get(), for a coroutine function loader."""
+    if not _enabled:
+        return await singleflight.do_async(name, loader)
+    hit, value, generation = _cache.lookup(name)
+    if hit:
+        return value
+    value = await singleflight.do_async(name, loader)
+    _cache.store(name, value, generation)
+    return value
+
+
+def put(name: str, value: Any):
+    if _enabled:
+        _cache.put(name, value)
+
+
+def subscribe(name: str, callback: Callable[[], None]):
+    """
+    Runs callback whenever name is dropped, here or in another worker. For
+    state that lives outside the cache, like the pricing snapshot.
+    """
+    _cache.subscribe(name, callback)
+
+
+def invalidate(*names: str):
+    """
+    Drops names in this worker and broadcasts the drop to every other worker.
+    Call it after the write has committed, never inside the transaction.
+    """
+    _cache.drop(names)
+    if _bus is not None:
+        _bus.publish(names)
+
+
+def conninfo(uri: str) -> str:
+    # psycopg wants a plain libpq url, without sqlalchemy's +driver suffix
+    from sqlalchemy.engine import make_url
+
+    return (
+        make_url(uri).set(drivername="postgresql").render_as_string(hide_password=False)
+    )
+
+
+class CacheBus:
+    """
+    Two daemon threads, each with its own autocommit connection outside the
+    pool: one LISTENs and drops entries, the other sends queued NOTIFYs so
+    handlers (sync or async) never block on the round trip.
+    """
+
+    def __init__(self, uri: str):
+        self.conninfo = conninfo(uri)
+        self.origin = str(os.getpid())
+        self._outbox: "queue.SimpleQueue[tuple | None]" = queue.SimpleQueue()
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._listen, name="cache-listener", daemon=True),
+            threading.Thread(target=self._send, name="cache-publisher", daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._outbox.put(None)
+
+    def publish(self, names):
+        self._outbox.put(tuple(names))
+
+    def _listen(self):
+        global _enabled
+        import psycopg
+
+        delay = RECONNECT_DELAY
+        while not self._stopping.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as connection:
+                    connection.execute(f"LISTEN {CHANNEL}")
+                    # anything could have changed while we weren't listening
+                    _cache.drop(ALL)
+                    _enabled = True
+                    delay = RECONNECT_DELAY
+                    logger.info("cache bus listening", extra={"channel": CHANNEL})
+                    while not self._stopping.is_set():
+                        for notify in connection.notifies(timeout=LISTEN_TIMEOUT):
+                            origin, _, names = notify.payload.partition(":")
+                            if origin != self.origin:
+                                _cache.drop(names.split(","))
+            except Exception:
+                logger.exception("cache bus listener disconnected")
+            finally:
+                _enabled = False
+                _cache.drop(ALL)
+            self._stopping.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _send(self):
+        import psycopg
+
+        connection = None
+        while True:
+            names = self._outbox.get()
+            if names is None:
+                break
+            payload = f"{self.origin}:{','.join(names)}"
+            for attempt in range(2):
+                try:
+                    if connection is None or connection.closed:
+                        connection = psycopg.connect(self.conninfo, autocommit=True)
+                    connection.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+                    break
+                except Exception:
+                    logger.exception(
+                        "cache bus publish failed", extra={"attempt": attempt}
+                    )
+                    connection = None
+                    time.sleep(RECONNECT_DELAY if attempt == 0 else 0)
+        if connection is not None:
+            connection.close()
+
+
+def start_bus(uri: str):
+    global _bus
+    if _bus is None:
+        _bus = CacheBus(uri)
+        _bus.start()
+
+
+def stop_bus():
+    global _bus
+    if _bus is not None:
+        _bus.stop()
+        _bus = None
@@ -0,0 +1,62 @@
+"""
+Keeps carts and cart_items down to the carts still in play.
+
+Every tick ages the open carts. Once the analytics worker has applied a tick,
+open carts older than CART_TTL_TICKS ticks are deleted, and checked-out carts
+whose sale is already in sale_analytics move to cart_archive, where order
+search still finds them. Both go CART_REAPER_BATCH_SIZE carts per transaction,
+so neither holds locks on the cart tables for long.
+"""
+import threading
+from src import config
+from src.logger import get_logger
+from src.storage import get_storage
+
+logger = get_logger(__name__)
+
+_counts = {"expired": 0, "archived": 0}
+_counts_lock = threading.Lock()
+
+
+def _in_batches(step, batch_size: int) -> int:
+    total = 0
+    while True:
+        done = step(batch_size)
+        total += done
+        if done < batch_size:
+            return total
+
+
+def reap() -> dict:
+    """
+    Deletes abandoned carts and archives settled ones until none are left,
+    and returns how many of each there were.
+    """
+    settings = config.get_settings()
+    storage = get_storage()
+    counts = {
+        "expired": _in_batches(
+            lambda limit: storage.reap_carts(settings.CART_TTL_TICKS, limit),
+            settings.CART_REAPER_BATCH_SIZE,
+        ),
+        "archived": _in_batches(storage.archive_carts, settings.CART_REAPER_BATCH_SIZE),
+    }
+    with _counts_lock:
+        for key, value in counts.items():
+            _counts[key] += value
+    if any(counts.values()):
+        logger.info("reaped carts", extra=counts)
+    return counts
+
+
+def render() -> str:
+    with _counts_lock:
+        counts = dict(_counts)
+    return (
+        "# HELP cart_reaper_expired_total Open carts deleted after CART_TTL_TICKS ticks.\n"
+        "# TYPE cart_reaper_expired_total counter\n"
+        f"cart_reaper_expired_total {counts['expired']}\n"
+        "# HELP cart_reaper_archived_total Checked-out carts moved to cart_archive.\n"
+        "# TYPE cart_reaper_archived_total counter\n"
+        f"cart_reaper_archived_total {counts['archived']}\n"
+    )
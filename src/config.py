@@ -1,23 +1,106 @@
-from dotenv import load_dotenv, find_dotenv
+from dotenv import dotenv_values
 import os
 from functools import lru_cache
+from pathlib import Path
 
-# Load default first
-load_dotenv(dotenv_path="default.env", override=False)
 
-# Then override with .env if available
-load_dotenv(dotenv_path=find_dotenv(".env"), override=True)
+def _load_env():
+    """
+    Real environment variables win over default.env, and .env wins over both.
+    Reads each file once and skips find_dotenv's call stack inspection.
+    """
+    for key, value in dotenv_values("default.env").items():
+        if value is not None:
+            os.environ.setdefault(key, value)
+    for key, value in dotenv_values(
+        Path(__file__).resolve().parent.parent / ".env"
+    ).items():
+        if value is not None:
+            os.environ[key] = value
+
+
+_load_env()
 
 
 class Settings:
     API_KEY: str | None = os.getenv("API_KEY")
     POSTGRES_URI: str | None = os.getenv("POSTGRES_URI")
+    # optional streaming replica for search and analytics reads; unset sends everything to the primary
+    POSTGRES_REPLICA_URI: str | None = os.getenv("POSTGRES_REPLICA_URI") or None
+    # where ledgers, carts and analytics live: postgres, memory or sqlite
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "postgres").lower()
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "potion_shop.db")
+    # serve catalog, carts, inventory and info from async handlers on an AsyncEngine
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "false").lower() == "true"
+    # connection pool sizing; keep size + overflow under the Supabase pooler's client limit
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # recycle connections before the pooler drops idle ones, instead of pinging on every checkout
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+    # psycopg prepares a statement server-side once it has run this many times on a
+    # connection; "none" disables prepared statements (needed behind transaction poolers)
+    DB_PREPARE_THRESHOLD: int | None = (
+        None
+        if os.getenv("DB_PREPARE_THRESHOLD", "2").lower() == "none"
+        else int(os.getenv("DB_PREPARE_THRESHOLD", "2"))
+    )
+    # group commit: cart creation, checkouts and deliveries arriving within this many ms share
+    # one commit, up to MAX_BATCH per commit; 0 (the default) commits each on its own
+    LEDGER_GROUP_COMMIT_MS: float = float(os.getenv("LEDGER_GROUP_COMMIT_MS", "0"))
+    LEDGER_GROUP_COMMIT_MAX_BATCH: int = int(
+        os.getenv("LEDGER_GROUP_COMMIT_MAX_BATCH", "64")
+    )
+    # requests allowed to run at once (0 disables admission control), then per-class caps
+    # and wait queue lengths for checkout, default and background (search, analytics) routes
+    ADMISSION_MAX_CONCURRENCY: int = int(
+        os.getenv("ADMISSION_MAX_CONCURRENCY", str(DB_POOL_SIZE + DB_MAX_OVERFLOW))
+    )
+    ADMISSION_LIMITS: str = os.getenv("ADMISSION_LIMITS", "default=10,background=2")
+    ADMISSION_QUEUE: str = os.getenv(
+        "ADMISSION_QUEUE", "checkout=64,default=32,background=4"
+    )
+    # seconds a request may wait for a slot before it gets a 503, and the Retry-After it's sent
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+    ADMISSION_RETRY_AFTER: int = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+    # cache catalog, stock and balances per worker, invalidated across workers via LISTEN/NOTIFY
+    CACHE_BUS: bool = os.getenv("CACHE_BUS", "true").lower() == "true"
+    # checkout and ticks queue analytics; the worker applies up to this many jobs per transaction
+    ANALYTICS_BATCH_SIZE: int = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+    # seconds between outbox drains when nothing wakes the worker sooner
+    ANALYTICS_POLL_INTERVAL: float = float(os.getenv("ANALYTICS_POLL_INTERVAL", "2"))
+    # seconds add-to-cart holds stock for a cart before other carts may take it
+    RESERVATION_TTL_SECONDS: int = int(os.getenv("RESERVATION_TTL_SECONDS", "300"))
+    # ticks an open cart lives before the cart reaper deletes it
+    CART_TTL_TICKS: int = int(os.getenv("CART_TTL_TICKS", "12"))
+    # carts the reaper deletes or archives per transaction
+    CART_REAPER_BATCH_SIZE: int = int(os.getenv("CART_REAPER_BATCH_SIZE", "500"))
+    # processes that search for better barrel and bottler plans (0 returns the greedy plans)
+    PLANNER_WORKERS: int = int(os.getenv("PLANNER_WORKERS", "1"))
+    # buy barrels toward the planner's colour targets; off, /barrels/plan buys nothing as it always has
+    BARREL_PLANNER: bool = os.getenv("BARREL_PLANNER", "false").lower() == "true"
+    # ms a plan endpoint may search before it answers with the best plan found
+    BARREL_PLAN_DEADLINE_MS: float = float(os.getenv("BARREL_PLAN_DEADLINE_MS", "1000"))
+    BOTTLE_PLAN_DEADLINE_MS: float = float(os.getenv("BOTTLE_PLAN_DEADLINE_MS", "1000"))
+    # journal transactions the ledger verifier reads per page
+    INTEGRITY_BATCH_SIZE: int = int(os.getenv("INTEGRITY_BATCH_SIZE", "1000"))
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    # per-endpoint sampling of debug/info logs, e.g. "carts=0.1,barrels.get_wholesale_purchase_plan=1"
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+    # log statements slower than this (0 disables), with their EXPLAIN plan
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "250"))
+    SLOW_QUERY_EXPLAIN: bool = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
 
     def __init__(self):
         if not self.API_KEY:
             raise ValueError("API_KEY is missing in the environment variables.")
         if not self.POSTGRES_URI:
             raise ValueError("POSTGRES_URI is missing in the environment variables.")
+        if self.STORAGE_BACKEND not in ("postgres", "memory", "sqlite"):
+            raise ValueError(f"Unknown STORAGE_BACKEND {self.STORAGE_BACKEND!r}.")
+        if self.DB_ASYNC and self.STORAGE_BACKEND != "postgres":
+            raise ValueError("DB_ASYNC requires STORAGE_BACKEND=postgres.")
 
 
 @lru_cache()
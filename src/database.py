@@ -1,5 +1,285 @@
 from src import config
-from sqlalchemy import create_engine
+from src import profiler
+from dataclasses import dataclass
+from typing import Any, Optional
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
-connection_url = config.get_settings().POSTGRES_URI
-engine = create_engine(connection_url, pool_pre_ping=True)
+settings = config.get_settings()
+connection_url = settings.POSTGRES_URI
+replica_url = settings.POSTGRES_REPLICA_URI
+
+STATEMENT_COUNTS_MAX = 1000
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    statements: int = 0
+    prepared_hits: int = 0
+    replica_reads: int = 0
+    replica_behind: int = 0
+
+
+_stats = PoolStats()
+_stats_lock = threading.Lock()
+
+
+def _record_wait(waited: float):
+    with _stats_lock:
+        _stats.checkouts += 1
+        _stats.wait_seconds_total += waited
+        _stats.wait_seconds_max = max(_stats.wait_seconds_max, waited)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _record_wait(time.perf_counter() - start)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _record_wait(time.perf_counter() - start)
+
+
+def _track_prepared(conn, cursor, statement, parameters, context, executemany):
+    """
+    Mirrors psycopg's per-connection prepare counter so we can report how often
+    a statement ran as an already-prepared server-side statement.
+    """
+    threshold = settings.DB_PREPARE_THRESHOLD
+    counts = conn.connection.info.setdefault("statement_counts", {})
+    if len(counts) > STATEMENT_COUNTS_MAX:
+        # dynamic queries (e.g. search pagination) would otherwise grow this forever
+        counts.clear()
+    seen = counts.get(statement, 0)
+    counts[statement] = seen + 1
+    with _stats_lock:
+        _stats.statements += 1
+        if threshold is not None and seen > threshold:
+            _stats.prepared_hits += 1
+
+
+engine_options = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={"prepare_threshold": settings.DB_PREPARE_THRESHOLD},
+)
+
+# engines are built on first use: creating one imports the psycopg driver (and the
+# asyncio extension), which a serverless cold start shouldn't pay for up front; sync
+# Engines and AsyncEngines share the dict, keyed by role
+_engines: dict[str, Any] = {}
+_engines_lock = threading.Lock()
+
+
+def _build_engine(key: str, url: str):
+    with _engines_lock:
+        if key not in _engines:
+            engine = create_engine(url, poolclass=TimedQueuePool, **engine_options)
+            event.listen(engine, "before_cursor_execute", _track_prepared)
+            profiler.instrument(engine)
+            _engines[key] = engine
+        return _engines[key]
+
+
+def _build_async_engine(key: str, url: str):
+    with _engines_lock:
+        if key not in _engines:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            # psycopg 3 speaks asyncio natively, so the same postgresql+psycopg:// url works here
+            async_engine = create_async_engine(
+                url, poolclass=TimedAsyncQueuePool, **engine_options
+            )
+            event.listen(
+                async_engine.sync_engine, "before_cursor_execute", _track_prepared
+            )
+            profiler.instrument(async_engine.sync_engine)
+            _engines[key] = async_engine
+        return _engines[key]
+
+
+def get_engine():
+    return _build_engine("sync", connection_url)
+
+
+def get_async_engine():
+    return _build_async_engine("async", connection_url)
+
+
+def get_replica_engine():
+    return _build_engine("replica", replica_url)
+
+
+def get_async_replica_engine():
+    return _build_async_engine("async_replica", replica_url)
+
+
+PRIMARY_LSN_SQL = text("SELECT pg_current_wal_lsn()::text")
+# true once the replica has replayed everything the primary had committed when asked
+REPLICA_CAUGHT_UP_SQL = text(
+    "SELECT COALESCE(pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn), false)"
+)
+
+
+def _count_read(on_replica: bool):
+    with _stats_lock:
+        if on_replica:
+            _stats.replica_reads += 1
+        else:
+            _stats.replica_behind += 1
+
+
+def _request_lsn() -> Optional[str]:
+    profile = profiler.current_profile()
+    return profile.primary_lsn if profile else None
+
+
+def _remember_lsn(lsn: str):
+    profile = profiler.current_profile()
+    if profile is not None:
+        profile.primary_lsn = lsn
+
+
+def read_engine(fresh: bool = False):
+    """
+    Picks the engine for a read-only query. Without POSTGRES_REPLICA_URI that's
+    always the primary, with no round trips. Staleness-tolerant reads (search,
+    demand history) go to the replica. fresh reads, like the audit right after
+    a delivery, get read-your-writes: the replica is used only once it has
+    replayed up to the primary's WAL position at the request's first fresh
+    read, which covers commits from every worker, and the primary serves them
+    otherwise. Later fresh reads in the same request reuse that position, so
+    they cost one round trip, to the replica.
+    """
+    if replica_url is None:
+        return get_engine()
+    replica = get_replica_engine()
+    if not fresh:
+        _count_read(True)
+        return replica
+    lsn = _request_lsn()
+    if lsn is None:
+        with get_engine().connect() as connection:
+            lsn = connection.execute(PRIMARY_LSN_SQL).scalar_one()
+        _remember_lsn(lsn)
+    with replica.connect() as connection:
+        caught_up = connection.execute(REPLICA_CAUGHT_UP_SQL, {"lsn": lsn}).scalar_one()
+    _count_read(caught_up)
+    return replica if caught_up else get_engine()
+
+
+async def read_async_engine(fresh: bool = False):
+    if replica_url is None:
+        return get_async_engine()
+    replica = get_async_replica_engine()
+    if not fresh:
+        _count_read(True)
+        return replica
+    lsn = _request_lsn()
+    if lsn is None:
+        async with get_async_engine().connect() as connection:
+            lsn = (await connection.execute(PRIMARY_LSN_SQL)).scalar_one()
+        _remember_lsn(lsn)
+    async with replica.connect() as connection:
+        caught_up = (
+            await connection.execute(REPLICA_CAUGHT_UP_SQL, {"lsn": lsn})
+        ).scalar_one()
+    _count_read(caught_up)
+    return replica if caught_up else get_async_engine()
+
+
+def __getattr__(name: str):
+    # keeps db.engine / db.async_engine working while deferring their creation
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warm_up():
+    """
+    Opens one pooled connection ahead of the first request so it doesn't pay
+    for the TCP/TLS handshake and authentication.
+    """
+    with get_engine().connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+    if replica_url is not None:
+        with get_replica_engine().connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+
+
+async def warm_up_async():
+    async with get_async_engine().connect() as connection:
+        await connection.exec_driver_sql("SELECT 1")
+    if replica_url is not None:
+        async with get_async_replica_engine().connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+
+
+def pool_stats() -> dict:
+    """
+    Snapshot of pool usage and prepared statement reuse, used to size the pool.
+    """
+    with _stats_lock:
+        stats = PoolStats(**vars(_stats))
+    engine = get_engine()
+    async_engine = _engines.get("async")
+    replica = _engines.get("replica")
+    return {
+        "pool_size": engine.pool.size(),
+        "checked_out": engine.pool.checkedout(),
+        "overflow": engine.pool.overflow(),
+        "async_checked_out": async_engine.pool.checkedout() if async_engine else 0,
+        "replica_checked_out": replica.pool.checkedout() if replica else 0,
+        "replica_reads": stats.replica_reads,
+        "replica_behind_fallbacks": stats.replica_behind,
+        "checkouts": stats.checkouts,
+        "avg_wait_ms": stats.wait_seconds_total / stats.checkouts * 1000
+        if stats.checkouts
+        else 0.0,
+        "max_wait_ms": stats.wait_seconds_max * 1000,
+        "statements": stats.statements,
+        "prepared_statement_hits": stats.prepared_hits,
+        "prepared_statement_hit_rate": stats.prepared_hits / stats.statements
+        if stats.statements
+        else 0.0,
+    }
+
+
+def async_variant(async_handler):
+    """
+    Registers async_handler in place of the decorated sync handler when the
+    shop runs in async database mode (DB_ASYNC=true). Place it directly under
+    the router decorator so both modes share one route definition.
+    """
+
+    def decorator(sync_handler):
+        if not settings.DB_ASYNC:
+            return sync_handler
+        async_handler.__name__ = sync_handler.__name__
+        async_handler.__doc__ = sync_handler.__doc__
+        return async_handler
+
+    return decorator
@@ -0,0 +1,179 @@
+"""
+Checks the journal's invariants incrementally.
+
+The verifier keeps a watermark: the last journal transaction it checked, a
+hash chain over every transaction up to it and the balances after it. Each run
+picks up from there, so it reads only what was posted since the last run.
+
+Every transaction has to:
+- balance: each account's delta is cancelled by its world: twin
+- keep ml and potion stock from going negative
+- for bottling, debit exactly the ml its potions' recipes call for
+
+A run that catches up also checks account_balances against the verified
+balances plus whatever was posted after the watermark. A full run re-verifies
+from the first transaction and compares its hash chain with the stored one,
+which catches verified history that was rewritten since.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import hashlib
+from src import config
+from src.logger import get_logger
+from src.storage import JournalTransaction, VerifierState, get_storage
+from src.storage.base import ML_ACCOUNTS, SKU_PREFIX, WORLD_PREFIX
+
+logger = get_logger(__name__)
+
+# accounts that may never go below zero
+NON_NEGATIVE_PREFIXES = ("ml:", SKU_PREFIX)
+
+
+@dataclass
+class Violation:
+    transaction_id: int
+    rule: str
+    detail: str
+
+
+@dataclass
+class VerifyReport:
+    checked: int = 0
+    # the watermark after this run
+    transaction_id: int = 0
+    # False when another run moved the watermark first; this run's findings still stand
+    saved: bool = True
+    violations: List[Violation] = field(default_factory=list)
+
+
+def chain(digest: str, transaction: JournalTransaction) -> str:
+    postings = ";".join(
+        f"{account}={delta}" for account, delta in sorted(transaction.postings.items())
+    )
+    line = f"{digest}|{transaction.transaction_id}|{transaction.order_id}|{transaction.transaction_type}|{postings}"
+    return hashlib.sha256(line.encode()).hexdigest()
+
+
+def check_transaction(
+    transaction: JournalTransaction,
+    balances: Dict[str, int],
+    recipes: Dict[str, List[int]],
+) -> List[Violation]:
+    """
+    Applies transaction to balances in place and returns what it broke.
+    """
+    violations = []
+
+    def flag(rule: str, detail: str):
+        violations.append(Violation(transaction.transaction_id, rule, detail))
+
+    postings = transaction.postings
+    for account, delta in postings.items():
+        if account.startswith(WORLD_PREFIX):
+            twin = account[len(WORLD_PREFIX) :]
+            if twin not in postings:
+                flag("unbalanced", f"{account} {delta:+} has no {twin} posting")
+        elif postings.get(WORLD_PREFIX + account, 0) != -delta:
+            world_delta = postings.get(WORLD_PREFIX + account, 0)
+            flag(
+                "unbalanced",
+                f"{account} {delta:+} against {WORLD_PREFIX}{account} {world_delta:+}",
+            )
+
+    if transaction.transaction_type == "POTION_DELIVERY":
+        expected = [0, 0, 0, 0]
+        for account, delta in postings.items():
+            if not account.startswith(SKU_PREFIX):
+                continue
+            recipe = recipes.get(account[len(SKU_PREFIX) :])
+            if recipe is None:
+                flag("unknown_sku", f"{account} has no potion recipe")
+                continue
+            expected = [total + delta * ml for total, ml in zip(expected, recipe)]
+        for ml, account in zip(expected, ML_ACCOUNTS.values()):
+            if -postings.get(account, 0) != ml:
+                flag(
+                    "unmatched_bottling",
+                    f"{account} debited {-postings.get(account, 0)}, recipes need {ml}",
+                )
+
+    for account, delta in postings.items():
+        balances[account] = balances.get(account, 0) + delta
+        if account.startswith(NON_NEGATIVE_PREFIXES) and balances[account] < 0:
+            flag("negative_balance", f"{account} is {balances[account]}")
+    return violations
+
+
+def verify(full: bool = False, batch_size: Optional[int] = None) -> VerifyReport:
+    """
+    Checks every journal transaction posted since the last run (or all of
+    them when full) and moves the watermark past them.
+    """
+    batch_size = batch_size or config.get_settings().INTEGRITY_BATCH_SIZE
+    storage = get_storage()
+    stored = storage.load_verifier_state()
+    state = VerifierState() if full else stored
+    previous_id = stored.transaction_id
+    recipes = {
+        potion.sku: [potion.red_ml, potion.green_ml, potion.blue_ml, potion.dark_ml]
+        for potion in storage.get_potion_stock(active_only=False)
+    }
+
+    report = VerifyReport()
+    while True:
+        page = storage.journal_since(state.transaction_id, batch_size)
+        for transaction in page:
+            report.violations.extend(
+                check_transaction(transaction, state.balances, recipes)
+            )
+            state.digest = chain(state.digest, transaction)
+            state.transaction_id = transaction.transaction_id
+            if (
+                full
+                and state.transaction_id == stored.transaction_id
+                and state.digest != stored.digest
+            ):
+                report.violations.append(
+                    Violation(
+                        state.transaction_id,
+                        "history_rewritten",
+                        "hash chain differs from the verified one",
+                    )
+                )
+        report.checked += len(page)
+        if len(page) < batch_size:
+            break
+    if full and state.transaction_id < stored.transaction_id:
+        report.violations.append(
+            Violation(
+                state.transaction_id,
+                "history_rewritten",
+                f"verified up to {stored.transaction_id}, now ends here",
+            )
+        )
+
+    account_balances, unverified = storage.balances_since(state.transaction_id)
+    for account in sorted(account_balances.keys() | state.balances.keys()):
+        expected = state.balances.get(account, 0) + unverified.get(account, 0)
+        if account_balances.get(account, 0) != expected:
+            report.violations.append(
+                Violation(
+                    state.transaction_id,
+                    "balance_drift",
+                    f"account_balances has {account} at {account_balances.get(account, 0)}, the journal at {expected}",
+                )
+            )
+
+    report.transaction_id = state.transaction_id
+    if state.transaction_id != previous_id or full:
+        report.saved = storage.save_verifier_state(state, previous_id)
+    for violation in report.violations:
+        logger.warning(
+            "ledger invariant violated",
+            extra={
+                "transaction_id": violation.transaction_id,
+                "rule": violation.rule,
+                "detail": violation.detail,
+            },
+        )
+    return report
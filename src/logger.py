@@ -0,0 +1,111 @@
+from src import config
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def _parse_sample_rates(raw: str) -> dict[str, float]:
+    """
+    Parses "carts=0.1,barrels.post_deliver_barrels=1" into {key: rate}.
+    """
+    rates = {}
+    for entry in filter(None, (part.strip() for part in raw.split(","))):
+        key, _, rate = entry.partition("=")
+        rates[key.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of DEBUG/INFO records per endpoint. Rates are looked up by
+    "<module>.<function>" first and then "<module>", so a single handler can be
+    sampled more aggressively than the rest of its router. Warnings and errors
+    are always kept.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(
+            f"{record.module}.{record.funcName}", self.rates.get(record.module, 1.0)
+        )
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the queue untouched. The stock QueueHandler formats the
+    message in the calling thread; here formatting (including the repr of large
+    pydantic payloads) happens on the listener thread instead.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Renders each record as one JSON line with any `extra=` fields inlined.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "endpoint": f"{record.module}.{record.funcName}",
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _start():
+    global _listener
+    settings = config.get_settings()
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter())
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SamplingFilter(_parse_sample_rates(settings.LOG_SAMPLE_RATES)))
+
+    root = logging.getLogger("src")
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a logger whose records are written by a background thread, so
+    request handlers never block on stdout. Pass payloads as %-style args
+    rather than f-strings so they are only formatted if the record is kept.
+    """
+    if _listener is None:
+        _start()
+    return logging.getLogger(name)
@@ -0,0 +1,171 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import time
+from starlette.routing import Match
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+UNMATCHED = "unmatched"
+
+
+@dataclass
+class RouteMetrics:
+    # one slot per bucket plus the +Inf overflow slot
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    count: int = 0
+    total_seconds: float = 0.0
+    errors: int = 0
+    in_flight: int = 0
+
+
+# keyed by (method, route template). Only the middleware writes these, and it
+# always runs on the event loop thread, so plain ints need no locking.
+_routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+
+def _bucket_index(seconds: float) -> int:
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(BUCKETS)
+
+
+def quantile(metrics: RouteMetrics, q: float) -> float:
+    """
+    Estimates a latency quantile from the histogram by interpolating linearly
+    inside the bucket that contains it.
+    """
+    if metrics.count == 0:
+        return 0.0
+    rank = q * metrics.count
+    seen = 0
+    for i, in_bucket in enumerate(metrics.buckets):
+        if in_bucket and seen + in_bucket >= rank:
+            lower = BUCKETS[i - 1] if i > 0 else 0.0
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            return lower + (upper - lower) * (rank - seen) / in_bucket
+        seen += in_bucket
+    return BUCKETS[-1]
+
+
+def resolve_route(app, scope) -> str:
+    """
+    Returns the path template of the route a request will be dispatched to.
+    """
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or UNMATCHED
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency histograms, in-flight requests and server errors.
+    """
+
+    def __init__(self, app, exclude: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        route = resolve_route(scope["app"], scope)
+        # share the resolved template with inner middleware
+        scope["route_template"] = route
+        key = (scope["method"], route)
+        metrics = _routes.get(key)
+        if metrics is None:
+            metrics = _routes[key] = RouteMetrics()
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.in_flight -= 1
+            metrics.buckets[_bucket_index(elapsed)] += 1
+            metrics.count += 1
+            metrics.total_seconds += elapsed
+            if status_code >= 500:
+                metrics.errors += 1
+
+
+def _labels(method: str, route: str, **extra: str) -> str:
+    pairs = {"method": method, "route": route, **extra}
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+
+def render(gauges: Dict[str, float] | None = None) -> str:
+    """
+    Renders all route metrics, plus any extra gauges, in Prometheus text format.
+    """
+    routes = sorted(_routes.items())
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), metrics in routes:
+        cumulative = 0
+        for bound, in_bucket in zip(BUCKETS + (float("inf"),), metrics.buckets):
+            cumulative += in_bucket
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(
+                f"http_request_duration_seconds_bucket{_labels(method, route, le=le)} {cumulative}"
+            )
+        lines.append(
+            f"http_request_duration_seconds_sum{_labels(method, route)} {metrics.total_seconds}"
+        )
+        lines.append(
+            f"http_request_duration_seconds_count{_labels(method, route)} {metrics.count}"
+        )
+
+    lines += [
+        "# HELP http_request_latency_seconds Estimated latency quantiles by route.",
+        "# TYPE http_request_latency_seconds gauge",
+    ]
+    for (method, route), metrics in routes:
+        for q in QUANTILES:
+            lines.append(
+                f"http_request_latency_seconds{_labels(method, route, quantile=str(q))} {quantile(metrics, q):.6f}"
+            )
+
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being served by route.",
+        "# TYPE http_requests_in_flight gauge",
+    ]
+    lines += [
+        f"http_requests_in_flight{_labels(method, route)} {m.in_flight}"
+        for (method, route), m in routes
+    ]
+
+    lines += [
+        "# HELP http_request_errors_total Responses with a 5xx status or an unhandled exception.",
+        "# TYPE http_request_errors_total counter",
+    ]
+    lines += [
+        f"http_request_errors_total{_labels(method, route)} {m.errors}"
+        for (method, route), m in routes
+    ]
+
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,295 @@
+"""
+Anytime planning for the barrel and bottler plans.
+
+The scheduler calling /barrels/plan and /bottler/plan gives up after a few
+seconds, so a plan has to be ready by a deadline however long a search would
+like to run. A plan is a tuple of quantities, one per option (barrel or
+potion). The endpoint builds a greedy plan, which is ready at once, and a
+worker process improves on it by simulated annealing until the deadline or
+until it stops finding anything better. The endpoint returns the better of the
+two, or the greedy plan if the pool doesn't answer in time.
+
+Searches run in a process pool, so they hold neither the event loop nor the
+GIL that the request threads share. Each one reports its best score over time;
+/metrics averages how much better than greedy it was at points through its
+budget, which shows whether a longer deadline would buy anything.
+
+    plan = planner.solve(problem, problem.greedy(), deadline_ms=1000)
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import math
+import multiprocessing
+import random
+import threading
+import time
+from src import config
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+Plan = Tuple[int, ...]
+
+# time the result needs to come back from the worker, in seconds
+RESULT_MARGIN = 0.05
+# a search that hasn't improved in this many moves stops before its deadline
+STALL_MOVES = 20000
+# moves between clock checks
+CLOCK_EVERY = 64
+# fractions of the search budget the quality profile is reported at
+PROFILE_POINTS = (0.1, 0.25, 0.5, 1.0)
+
+
+class Problem(ABC):
+    """
+    bounds[i] is the most of option i a plan may hold. Problems are pickled
+    to the worker, so they should hold plain values only.
+    """
+
+    name: str
+    bounds: Tuple[int, ...]
+
+    @abstractmethod
+    def score(self, plan: Plan) -> Optional[float]:
+        """Higher is better; None if the plan breaks a constraint."""
+
+    def neighbour(self, plan: Plan, rng: random.Random) -> Plan:
+        """
+        A nearby plan: one option moved up or down, or some quantity shifted
+        from one option to another.
+        """
+        moved = list(plan)
+        i = rng.randrange(len(moved))
+        if len(moved) > 1 and moved[i] > 0 and rng.random() < 0.5:
+            j = rng.randrange(len(moved) - 1)
+            j += j >= i
+            amount = min(rng.randint(1, moved[i]), self.bounds[j] - moved[j])
+            moved[i] -= amount
+            moved[j] += amount
+        else:
+            step = rng.randint(1, max(1, self.bounds[i] // 4))
+            moved[i] = min(self.bounds[i], max(0, moved[i] + rng.choice((-step, step))))
+        return tuple(moved)
+
+
+@dataclass
+class SearchResult:
+    plan: Plan
+    score: float
+    budget: float
+    moves: int
+    # (seconds into the search, best score so far), one entry per improvement
+    trace: List[Tuple[float, float]]
+
+
+def search(problem: Problem, initial: Plan, deadline: float, seed: int) -> SearchResult:
+    """
+    Anneals from initial until deadline, a time.monotonic() value. The
+    monotonic clock is system wide on Linux and macOS, so the deadline can be
+    set by another process.
+    """
+    initial_score = problem.score(initial)
+    if initial_score is None:
+        raise ValueError(f"{problem.name}: the initial plan breaks a constraint")
+    rng = random.Random(seed)
+    started = time.monotonic()
+    budget = max(deadline - started, 0.0)
+    best = current = initial
+    best_score = current_score = initial_score
+    trace = [(0.0, best_score)]
+    # moves that lose this much are taken about a third of the time at the start
+    temperature = 0.05 * max(abs(best_score), 1.0)
+    moves = stalled = 0
+    now = started
+    while now < deadline and stalled < STALL_MOVES and any(problem.bounds):
+        cooling = 1 - (now - started) / budget
+        for _ in range(CLOCK_EVERY):
+            moves += 1
+            stalled += 1
+            candidate = problem.neighbour(current, rng)
+            candidate_score = problem.score(candidate)
+            if candidate_score is None:
+                continue
+            loss = current_score - candidate_score
+            if loss <= 0 or rng.random() < math.exp(
+                -loss / (temperature * cooling + 1e-12)
+            ):
+                current, current_score = candidate, candidate_score
+                if current_score > best_score:
+                    best, best_score = current, current_score
+                    stalled = 0
+                    trace.append((time.monotonic() - started, best_score))
+        now = time.monotonic()
+    return SearchResult(best, best_score, budget, moves, trace)
+
+
+def _warm() -> None:
+    pass
+
+
+@dataclass
+class PlannerStats:
+    runs: int = 0
+    # runs that fell back to the greedy plan: the pool was late, broken or off
+    fallbacks: int = 0
+    # runs whose search beat the greedy plan
+    improved: int = 0
+    moves: int = 0
+    # summed gain over the greedy score at each PROFILE_POINTS fraction of the budget
+    gain_at: List[float] = field(default_factory=lambda: [0.0] * len(PROFILE_POINTS))
+
+
+_stats: Dict[str, PlannerStats] = {}
+_stats_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _gain(score: float, greedy_score: float) -> float:
+    return (score - greedy_score) / max(abs(greedy_score), 1.0)
+
+
+def _record(name: str, greedy_score: float, result: Optional[SearchResult]):
+    with _stats_lock:
+        stats = _stats.setdefault(name, PlannerStats())
+        stats.runs += 1
+        if result is None:
+            stats.fallbacks += 1
+            return
+        stats.moves += result.moves
+        if result.score > greedy_score:
+            stats.improved += 1
+        for n, point in enumerate(PROFILE_POINTS):
+            reached = max(
+                score
+                for elapsed, score in result.trace
+                if elapsed <= point * result.budget
+            )
+            stats.gain_at[n] += _gain(reached, greedy_score)
+
+
+def start_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Starts PLANNER_WORKERS worker processes without waiting for them, so they
+    are up before the first plan of a tick instead of eating its deadline.
+    Workers are spawned rather than forked: the server has threads running
+    whose locks a forked child would inherit.
+    """
+    global _pool
+    workers = config.get_settings().PLANNER_WORKERS
+    with _pool_lock:
+        if _pool is None and workers > 0:
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            for _ in range(workers):
+                _pool.submit(_warm)
+        return _pool
+
+
+def stop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def solve(problem: Problem, initial: Plan, deadline_ms: float) -> Plan:
+    """
+    Returns the best plan found within deadline_ms, falling back to initial.
+    """
+    deadline = time.monotonic() + deadline_ms / 1000
+    greedy_score = problem.score(initial)
+    if greedy_score is None:
+        # nothing to anneal from; the caller's own plan stands
+        logger.warning(
+            "greedy plan breaks a constraint",
+            extra={"planner": problem.name, "plan": initial},
+        )
+        return initial
+
+    result = None
+    try:
+        pool = start_pool()
+        if pool is not None:
+            future = pool.submit(
+                search,
+                problem,
+                initial,
+                deadline - RESULT_MARGIN,
+                random.getrandbits(32),
+            )
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0.0))
+            except FutureTimeout:
+                future.cancel()
+                logger.warning(
+                    "plan search missed its deadline", extra={"planner": problem.name}
+                )
+    except Exception:
+        # a worker that died breaks the pool; the next plan starts a new one
+        logger.exception("plan search failed", extra={"planner": problem.name})
+        stop_pool()
+
+    _record(problem.name, greedy_score, result)
+    if result is None or result.score <= greedy_score:
+        return initial
+    logger.debug(
+        "plan improved",
+        extra={
+            "planner": problem.name,
+            "greedy": greedy_score,
+            "score": result.score,
+            "trace": result.trace,
+        },
+    )
+    return result.plan
+
+
+def render() -> str:
+    """
+    Plan searches and how far past greedy they got over time, in Prometheus text format.
+    """
+    with _stats_lock:
+        stats = {
+            name: PlannerStats(
+                s.runs, s.fallbacks, s.improved, s.moves, list(s.gain_at)
+            )
+            for name, s in _stats.items()
+        }
+    lines = []
+    for name, attr, help_text in (
+        ("planner_runs_total", "runs", "Plans requested, by planner."),
+        (
+            "planner_fallbacks_total",
+            "fallbacks",
+            "Plans that fell back to greedy: the search was late or failed.",
+        ),
+        (
+            "planner_improved_total",
+            "improved",
+            "Plans whose search beat the greedy plan.",
+        ),
+        ("planner_moves_total", "moves", "Candidate plans scored by the search."),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines += [
+            f'{name}{{planner="{planner}"}} {getattr(s, attr)}'
+            for planner, s in sorted(stats.items())
+        ]
+    lines.append(
+        "# HELP planner_gain_ratio Mean gain over the greedy score reached by each fraction of the search budget."
+    )
+    lines.append("# TYPE planner_gain_ratio gauge")
+    for planner, s in sorted(stats.items()):
+        searched = s.runs - s.fallbacks
+        for point, gain in zip(PROFILE_POINTS, s.gain_at):
+            mean = gain / searched if searched else 0.0
+            lines.append(
+                f'planner_gain_ratio{{planner="{planner}",budget="{point}"}} {mean:.6f}'
+            )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,109 @@
+"""
+The barrel and bottler planning problems. They live apart from their routers
+so planner worker processes can unpickle them without importing the web app.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from src.planner import Plan, Problem
+
+# what a gold is worth against a wanted ml; enough to prefer the cheaper of two equal plans
+GOLD_WEIGHT = 0.01
+
+
+@dataclass(frozen=True)
+class BarrelProblem(Problem):
+    """
+    Buys barrels toward a wanted amount of each colour. An ml past what is
+    wanted is worth nothing, so spending stops once the wants are covered.
+    """
+
+    prices: Tuple[int, ...]
+    # [r, g, b, d] ml per barrel of each option
+    ml: Tuple[Tuple[float, ...], ...]
+    gold: int
+    # ml of barrel capacity left
+    room: float
+    # [r, g, b, d] ml still wanted, and what an ml of each is worth
+    wanted: Tuple[float, ...]
+    weights: Tuple[float, ...]
+    bounds: Tuple[int, ...]
+    name: str = "barrels"
+
+    def score(self, plan: Plan) -> Optional[float]:
+        gold = sum(price * quantity for price, quantity in zip(self.prices, plan))
+        if gold > self.gold:
+            return None
+        added = [
+            sum(ml[color] * quantity for ml, quantity in zip(self.ml, plan))
+            for color in range(4)
+        ]
+        if sum(added) > self.room:
+            return None
+        value = sum(
+            weight * min(ml, wanted)
+            for weight, ml, wanted in zip(self.weights, added, self.wanted)
+        )
+        return value - GOLD_WEIGHT * gold
+
+    def greedy(self) -> Plan:
+        """
+        Adds one barrel at a time, always the one that adds the most score per
+        gold, until no barrel adds anything.
+        """
+        plan = [0] * len(self.bounds)
+        score = self.score(tuple(plan))
+        if score is None:
+            return tuple(plan)
+        while True:
+            best, best_rate, best_score = None, 0.0, score
+            for i, bound in enumerate(self.bounds):
+                if plan[i] >= bound:
+                    continue
+                plan[i] += 1
+                candidate = self.score(tuple(plan))
+                plan[i] -= 1
+                if candidate is None or candidate <= score:
+                    continue
+                rate = (candidate - score) / max(self.prices[i], 1)
+                if rate > best_rate:
+                    best, best_rate, best_score = i, rate, candidate
+            if best is None:
+                return tuple(plan)
+            plan[best] += 1
+            score = best_score
+
+
+@dataclass(frozen=True)
+class BottleProblem(Problem):
+    """
+    Bottles active potions toward the greedy plan's aim: the same target
+    stock for every active potion. wanted is what each potion is short of
+    that target, and bounds never go past it. A plan loses the square of
+    each shortfall it leaves, so between two plans that bottle as much, the
+    one that leaves the potions closer to even wins.
+    """
+
+    recipes: Tuple[Tuple[int, ...], ...]
+    wanted: Tuple[int, ...]
+    # [r, g, b, d] ml on hand
+    ml: Tuple[int, ...]
+    # potions that still fit
+    room: int
+    bounds: Tuple[int, ...]
+    name: str = "bottler"
+
+    def score(self, plan: Plan) -> Optional[float]:
+        if sum(plan) > self.room:
+            return None
+        for color, on_hand in enumerate(self.ml):
+            if (
+                sum(
+                    recipe[color] * quantity
+                    for recipe, quantity in zip(self.recipes, plan)
+                )
+                > on_hand
+            ):
+                return None
+        return -float(
+            sum((wanted - quantity) ** 2 for wanted, quantity in zip(self.wanted, plan))
+        )
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import Dict, List
+import threading
+from src import cache
+from src.storage import PricingInputs, get_storage
+
+# how far a tick price may drift from the list price in potions.price
+MIN_MULTIPLIER = 0.75
+MAX_MULTIPLIER = 1.25
+# catalog prices must stay inside CatalogItem's bounds
+MIN_PRICE = 1
+MAX_PRICE = 500
+# keep a week of ticks (12 per day) around for analysis
+VERSIONS_TO_KEEP = 84
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    version: int
+    prices: Dict[str, int]
+
+
+_snapshot: PriceSnapshot | None = None
+_lock = threading.Lock()
+
+
+def compute_prices(inputs: PricingInputs) -> List[int]:
+    """
+    Computes the tick price of every sku in one column-wise pass.
+
+    Skus that sell through quickly get marked up, slow movers get marked down,
+    and the whole table shifts with the forecast demand for the upcoming tick.
+    """
+    demand = min(max(inputs.demand_factor, 0.5), 1.5)
+    demand_adjustment = 0.2 * (demand - 1)
+
+    sell_through = [
+        sold / (sold + stock) if sold + stock > 0 else 0.0
+        for sold, stock in zip(inputs.sold_recent, inputs.stock)
+    ]
+    multipliers = [
+        min(
+            max(1 + 0.4 * (rate - 0.5) + demand_adjustment, MIN_MULTIPLIER),
+            MAX_MULTIPLIER,
+        )
+        for rate in sell_through
+    ]
+    return [
+        min(max(round(base * multiplier), MIN_PRICE), MAX_PRICE)
+        for base, multiplier in zip(inputs.base_prices, multipliers)
+    ]
+
+
+def refresh_prices(day: str, hour: int) -> PriceSnapshot:
+    """
+    Computes and stores a new price table version for the given tick, then swaps
+    it into the in-memory snapshot. Meant to run in the background after a tick.
+    """
+    global _snapshot
+    storage = get_storage()
+    inputs = storage.get_pricing_inputs(day, hour)
+    prices = dict(zip(inputs.skus, compute_prices(inputs)))
+    version = storage.save_prices(prices, VERSIONS_TO_KEEP)
+    # tell every other worker to reload the table; catalogs carry the old prices
+    cache.invalidate(cache.PRICES, cache.CATALOG)
+
+    snapshot = PriceSnapshot(version=version, prices=prices)
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def load_snapshot() -> PriceSnapshot:
+    """
+    Loads the latest stored price table version into memory.
+    """
+    global _snapshot
+    version, prices = get_storage().load_prices()
+    snapshot = PriceSnapshot(version=version, prices=prices)
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def forget_snapshot():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+cache.subscribe(cache.PRICES, forget_snapshot)
+
+
+def get_snapshot() -> PriceSnapshot:
+    snapshot = _snapshot
+    if snapshot is None:
+        snapshot = load_snapshot()
+    return snapshot
+
+
+def get_price(sku: str, default: int) -> int:
+    """
+    Returns the current tick price for a sku, falling back to its list price
+    when no price has been computed for it yet.
+    """
+    return get_snapshot().prices.get(sku, default)
@@ -0,0 +1,205 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import json
+import threading
+import time
+from src import config
+from src import metrics
+from src.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEBUG_REQUEST_HEADER = b"x-debug-queries"
+DEBUG_RESPONSE_HEADER = b"x-query-breakdown"
+# keep the debug header well under common proxy header size limits
+DEBUG_MAX_QUERIES = 20
+DEBUG_STATEMENT_CHARS = 120
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+NO_ROUTE = "background"
+
+
+@dataclass
+class QueryStat:
+    statement: str
+    seconds: float
+    rows: int
+
+
+@dataclass
+class RequestProfile:
+    route: str
+    queries: List[QueryStat] = field(default_factory=list)
+    # the primary's WAL position when the request's first fresh read asked for it
+    primary_lsn: Optional[str] = None
+
+
+@dataclass
+class RouteQueryTotals:
+    queries: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+
+
+_current: ContextVar[RequestProfile | None] = ContextVar(
+    "request_profile", default=None
+)
+# handlers run on threadpool workers, so unlike the latency metrics these need a lock
+_totals: Dict[str, RouteQueryTotals] = {}
+_totals_lock = threading.Lock()
+
+
+def current_profile() -> RequestProfile | None:
+    return _current.get()
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("EXPLAIN " + statement, parameters)
+        return "\n".join(str(row[0]) for row in cursor.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    rows = max(cursor.rowcount, 0)
+    profile = _current.get()
+    route = profile.route if profile else NO_ROUTE
+
+    if profile is not None:
+        profile.queries.append(
+            QueryStat(statement=statement, seconds=elapsed, rows=rows)
+        )
+    with _totals_lock:
+        totals = _totals.get(route)
+        if totals is None:
+            totals = _totals[route] = RouteQueryTotals()
+        totals.queries += 1
+        totals.rows += rows
+        totals.seconds += elapsed
+
+    settings = config.get_settings()
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        plan = None
+        if (
+            settings.SLOW_QUERY_EXPLAIN
+            and not executemany
+            and statement.lstrip().upper().startswith(EXPLAINABLE)
+        ):
+            plan = _explain(conn, statement, parameters)
+        logger.warning(
+            "slow query on %s took %.1fms",
+            route,
+            elapsed * 1000,
+            extra={"statement": statement, "rows": rows, "plan": plan},
+        )
+
+
+def instrument(engine):
+    """
+    Attaches query timing to a (sync) engine. For an AsyncEngine pass its sync_engine.
+    """
+    # imported here so the middleware can load without pulling in sqlalchemy
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def breakdown(profile: RequestProfile) -> dict:
+    slowest = sorted(profile.queries, key=lambda q: q.seconds, reverse=True)[
+        :DEBUG_MAX_QUERIES
+    ]
+    return {
+        "route": profile.route,
+        "queries": len(profile.queries),
+        "rows": sum(q.rows for q in profile.queries),
+        "ms": round(sum(q.seconds for q in profile.queries) * 1000, 3),
+        "slowest": [
+            {
+                "sql": " ".join(q.statement.split())[:DEBUG_STATEMENT_CHARS],
+                "ms": round(q.seconds * 1000, 3),
+                "rows": q.rows,
+            }
+            for q in slowest
+        ],
+    }
+
+
+class ProfilerMiddleware:
+    """
+    Opens a query profile for every request. Requests that send a valid API key
+    and `X-Debug-Queries: 1` get the breakdown back in `X-Query-Breakdown`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = scope.get("route_template") or metrics.resolve_route(
+            scope["app"], scope
+        )
+        profile = RequestProfile(route=route)
+        token = _current.set(profile)
+
+        headers = dict(scope["headers"])
+        debug = (
+            headers.get(DEBUG_REQUEST_HEADER) == b"1"
+            and headers.get(b"access_token", b"").decode()
+            == config.get_settings().API_KEY
+        )
+
+        async def send_wrapper(message):
+            if debug and message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (DEBUG_RESPONSE_HEADER, json.dumps(breakdown(profile)).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+
+def render() -> str:
+    """
+    Per-route query totals in Prometheus text format.
+    """
+    with _totals_lock:
+        totals = sorted(
+            (route, RouteQueryTotals(**vars(t))) for route, t in _totals.items()
+        )
+    lines = []
+    for name, attr, help_text in (
+        (
+            "db_queries_total",
+            "queries",
+            "Statements executed, attributed to the route that ran them.",
+        ),
+        ("db_rows_total", "rows", "Rows returned or affected, by route."),
+        (
+            "db_query_seconds_total",
+            "seconds",
+            "Time spent executing statements, by route.",
+        ),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines += [
+            f'{name}{{route="{route}"}} {getattr(t, attr)}' for route, t in totals
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,57 @@
+from typing import Any
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+
+def _inline_defs(schema: Any, defs: dict) -> Any:
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return _inline_defs(defs[ref[len("#/$defs/") :]], defs)
+        return {key: _inline_defs(value, defs) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_defs(item, defs) for item in schema]
+    return schema
+
+
+class JsonBody:
+    """
+    Dependency that validates the raw request body with pydantic-core in one
+    pass, instead of json.loads followed by FastAPI's per-field validation.
+    Meant for the large list bodies the Potion Exchange posts every tick:
+
+        barrels_body = JsonBody(List[Barrel])
+
+        @router.post("/deliver/{order_id}", openapi_extra=barrels_body.openapi)
+        def post_deliver_barrels(order_id: int, barrels_delivered: List[Barrel] = Depends(barrels_body)):
+    """
+
+    def __init__(self, annotation: Any):
+        self.adapter = TypeAdapter(annotation)
+
+    @property
+    def openapi(self) -> dict:
+        # the body isn't a FastAPI parameter, so document it by hand
+        schema = self.adapter.json_schema()
+        defs = schema.pop("$defs", {})
+        return {
+            "requestBody": {
+                "required": True,
+                "content": {"application/json": {"schema": _inline_defs(schema, defs)}},
+            }
+        }
+
+    async def __call__(self, request: Request) -> Any:
+        body = await request.body()
+        try:
+            return self.adapter.validate_json(body)
+        except ValidationError as e:
+            # same 422 shape FastAPI returns for its own body validation
+            raise RequestValidationError(
+                [
+                    {**error, "loc": ("body", *error["loc"])}
+                    for error in e.errors(include_url=False)
+                ],
+                body=body,
+            )
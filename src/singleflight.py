@@ -0,0 +1,121 @@
+"""
+Request coalescing: concurrent callers asking for the same key share one
+in-flight load and its result instead of each running the same query.
+
+    value = singleflight.do("catalog", create_catalog)
+    value = await singleflight.do_async("catalog", create_catalog_async)
+
+Callers that arrive after forget(key) start a new load, so a read issued after
+a write has committed never joins a load that started before it.
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import threading
+
+
+@dataclass
+class FlightCounts:
+    calls: int = 0
+    shared: int = 0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class Group:
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        # created and awaited on the event loop thread
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._counts: Dict[str, FlightCounts] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, shared: bool):
+        counts = self._counts.setdefault(key, FlightCounts())
+        counts.calls += 1
+        if shared:
+            counts.shared += 1
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            self._count(key, shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.value
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        leader = task is None
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._forget_task(key, done))
+        with self._lock:
+            self._count(key, shared=not leader)
+        # shielded so a caller that disconnects doesn't cancel the load for everyone else
+        return await asyncio.shield(task)
+
+    def _forget_task(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def forget(self, key: str):
+        with self._lock:
+            self._calls.pop(key, None)
+        self._tasks.pop(key, None)
+
+    def counts(self) -> Dict[str, FlightCounts]:
+        with self._lock:
+            return {
+                key: FlightCounts(**vars(counts))
+                for key, counts in self._counts.items()
+            }
+
+
+group = Group()
+do = group.do
+do_async = group.do_async
+forget = group.forget
+
+
+def render() -> str:
+    """
+    Calls and duplicate loads avoided per key, in Prometheus text format.
+    """
+    counts = sorted(group.counts().items())
+    lines = []
+    for name, attr, help_text in (
+        ("singleflight_calls_total", "calls", "Loads requested, by key."),
+        (
+            "singleflight_shared_total",
+            "shared",
+            "Loads that joined one already in flight instead of querying.",
+        ),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines += [f'{name}{{key="{key}"}} {getattr(c, attr)}' for key, c in counts]
+    return "\n".join(lines) + "\n"
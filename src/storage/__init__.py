@@ -0,0 +1,79 @@
+from functools import lru_cache
+from src import config
+from src.storage.base import (
+    AnalyticsBatch,
+    Balances,
+    CheckoutOutcome,
+    JournalTransaction,
+    PotionStock,
+    PricingInputs,
+    SaleLine,
+    SnapshotInfo,
+    Storage,
+    VerifierState,
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    ITEM_INSUFFICIENT,
+    ITEM_MISSING,
+    ITEM_RESERVED,
+    SALE_JOB,
+    TICK_JOB,
+)
+
+__all__ = [
+    "AnalyticsBatch",
+    "Balances",
+    "CheckoutOutcome",
+    "JournalTransaction",
+    "PotionStock",
+    "PricingInputs",
+    "SaleLine",
+    "SnapshotInfo",
+    "Storage",
+    "VerifierState",
+    "CHECKOUT_ALREADY_DONE",
+    "CHECKOUT_EMPTY",
+    "CHECKOUT_INSUFFICIENT",
+    "CHECKOUT_MISSING",
+    "CHECKOUT_OK",
+    "ITEM_INSUFFICIENT",
+    "ITEM_MISSING",
+    "ITEM_RESERVED",
+    "SALE_JOB",
+    "TICK_JOB",
+    "get_storage",
+]
+
+
+@lru_cache()
+def get_storage() -> Storage:
+    """
+    Returns the process-wide storage backend picked by STORAGE_BACKEND.
+    Backends are imported lazily so memory and sqlite never touch Postgres.
+    """
+    settings = config.get_settings()
+    if settings.STORAGE_BACKEND == "memory":
+        from src.storage.memory import MemoryStorage
+
+        return MemoryStorage()
+    if settings.STORAGE_BACKEND == "sqlite":
+        from src.storage.sqlite import SqliteStorage
+
+        return SqliteStorage(settings.SQLITE_PATH)
+
+    from src import database as db
+    from src.storage.postgres import PostgresStorage
+
+    ledger_writer = None
+    if settings.LEDGER_GROUP_COMMIT_MS > 0:
+        from src.storage.ledger_writer import LedgerWriter
+
+        ledger_writer = LedgerWriter(
+            db.engine,
+            settings.LEDGER_GROUP_COMMIT_MS / 1000,
+            settings.LEDGER_GROUP_COMMIT_MAX_BATCH,
+        )
+    return PostgresStorage(db.engine, db.read_engine, ledger_writer)
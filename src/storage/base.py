@@ -0,0 +1,381 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# customer-facing results of Storage.checkout
+CHECKOUT_MISSING = "missing"
+CHECKOUT_EMPTY = "empty"
+CHECKOUT_ALREADY_DONE = "already_checked_out"
+CHECKOUT_INSUFFICIENT = "insufficient_inventory"
+CHECKOUT_OK = "checked_out"
+
+# results of Storage.set_cart_item
+ITEM_RESERVED = "reserved"
+ITEM_MISSING = "missing"
+ITEM_INSUFFICIENT = "insufficient_stock"
+
+# idempotency key endpoints; a delivery is recorded once per (endpoint, order_id)
+BARREL_DELIVERY = "barrels.deliver"
+POTION_DELIVERY = "bottler.deliver"
+CAPACITY_DELIVERY = "inventory.deliver"
+
+# journal accounts; every posting to one is balanced by a posting to its world: twin,
+# the outside of the shop, so each journal transaction sums to zero per account pair
+GOLD_ACCOUNT = "gold"
+ML_ACCOUNTS = {
+    "red_ml": "ml:red",
+    "green_ml": "ml:green",
+    "blue_ml": "ml:blue",
+    "dark_ml": "ml:dark",
+}
+POTION_CAPACITY_ACCOUNT = "capacity:potions"
+ML_CAPACITY_ACCOUNT = "capacity:ml"
+SKU_PREFIX = "sku:"
+WORLD_PREFIX = "world:"
+
+
+# what a reset seeds
+RESET_POSTINGS = {
+    GOLD_ACCOUNT: 100,
+    POTION_CAPACITY_ACCOUNT: 50,
+    ML_CAPACITY_ACCOUNT: 10000,
+}
+
+
+def sku_account(sku: str) -> str:
+    return SKU_PREFIX + sku
+
+
+def capacity_postings(
+    potion_capacity_increase: int, ml_capacity_increase: int, gold_delta: int
+) -> Dict[str, int]:
+    return {
+        GOLD_ACCOUNT: gold_delta,
+        POTION_CAPACITY_ACCOUNT: potion_capacity_increase,
+        ML_CAPACITY_ACCOUNT: ml_capacity_increase,
+    }
+
+
+def journal_entries(postings: Dict[str, int]) -> List[dict]:
+    """
+    The nonzero postings plus a balancing world: posting for each.
+    """
+    moved = [(account, delta) for account, delta in postings.items() if delta]
+    return [{"account": account, "delta": delta} for account, delta in moved] + [
+        {"account": WORLD_PREFIX + account, "delta": -delta} for account, delta in moved
+    ]
+
+
+# analytics outbox job kinds
+SALE_JOB = "sale"
+TICK_JOB = "tick"
+
+
+@dataclass
+class Balances:
+    gold: int
+    red_ml: int
+    green_ml: int
+    blue_ml: int
+    dark_ml: int
+    number_of_potions: int
+    max_potion_capacity: int
+    max_barrel_capacity: int
+
+    @property
+    def ml_in_barrels(self) -> int:
+        return self.red_ml + self.green_ml + self.blue_ml + self.dark_ml
+
+
+@dataclass
+class PotionStock:
+    sku: str
+    name: str
+    price: int
+    red_ml: int
+    green_ml: int
+    blue_ml: int
+    dark_ml: int
+    is_active: bool
+    quantity: int
+    # held by carts that haven't checked out yet
+    reserved: int = 0
+
+    @property
+    def available(self) -> int:
+        return self.quantity - self.reserved
+
+    @property
+    def potion_type(self) -> List[int]:
+        return [self.red_ml, self.green_ml, self.blue_ml, self.dark_ml]
+
+
+@dataclass
+class SaleLine:
+    line_item_id: int
+    quantity: int
+    item_sku: str
+    customer_name: str
+    line_item_total: int
+    timestamp: datetime
+    total_count: int
+
+
+@dataclass
+class CheckoutOutcome:
+    status: str
+    total_potions_bought: int = 0
+    total_gold_paid: int = 0
+
+
+@dataclass
+class SnapshotInfo:
+    name: str
+    created_at: datetime
+
+
+@dataclass
+class AnalyticsBatch:
+    applied: int = 0
+    # the tick that ended the batch, whose prices are now due for a refresh
+    tick: Optional[Tuple[str, int]] = None
+
+
+@dataclass
+class JournalTransaction:
+    transaction_id: int
+    order_id: int
+    transaction_type: str
+    # account -> delta, world: twins included
+    postings: Dict[str, int]
+
+
+@dataclass
+class VerifierState:
+    """
+    How far the ledger verifier has got: the last journal transaction it
+    checked, the hash chain over every transaction up to it, and each account's
+    balance after it.
+    """
+
+    transaction_id: int = 0
+    digest: str = ""
+    balances: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class PricingInputs:
+    """
+    Column-oriented pricing features, one entry per active sku in each list.
+    """
+
+    skus: List[str]
+    base_prices: List[int]
+    stock: List[int]
+    sold_recent: List[int]
+    demand_factor: float
+
+
+class Storage(ABC):
+    """
+    Everything the routers need from persistence: ledger writes, balance reads,
+    carts and analytics. Deliveries return False when the order_id was already
+    recorded, which is what makes the deliver endpoints idempotent.
+    """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Clears ledgers and carts, then seeds 100 gold and the starting capacity."""
+
+    @abstractmethod
+    def add_potion(
+        self,
+        sku: str,
+        name: str,
+        price: int,
+        potion_type: List[int],
+        is_active: bool = True,
+    ) -> None:
+        """Creates or updates a potion recipe."""
+
+    # balance reads
+
+    @abstractmethod
+    def get_balances(self) -> Balances:
+        ...
+
+    @abstractmethod
+    def get_potion_stock(self, active_only: bool = True) -> List[PotionStock]:
+        ...
+
+    @abstractmethod
+    def get_balances_as_of(self, as_of: datetime) -> Optional[Balances]:
+        """
+        Balances as they stood after the last journal transaction at or before
+        as_of (naive means UTC), or None if there was none yet.
+        """
+
+    # ledger writes
+
+    @abstractmethod
+    def record_barrel_delivery(
+        self,
+        order_id: int,
+        gold_paid: int,
+        red_ml: int,
+        green_ml: int,
+        blue_ml: int,
+        dark_ml: int,
+    ) -> bool:
+        ...
+
+    @abstractmethod
+    def record_potion_delivery(
+        self,
+        order_id: int,
+        potions: List[Tuple[List[int], int]],
+        ml_used: Dict[str, int],
+    ) -> bool:
+        """potions are (potion_type, quantity) pairs; ml_used holds negative deltas."""
+
+    @abstractmethod
+    def record_capacity_delivery(
+        self,
+        order_id: int,
+        potion_capacity_increase: int,
+        ml_capacity_increase: int,
+        gold_delta: int,
+    ) -> bool:
+        ...
+
+    # carts
+
+    @abstractmethod
+    def create_cart(self, customer_name: str, character_class: str) -> int:
+        ...
+
+    @abstractmethod
+    def set_cart_item(self, cart_id: int, sku: str, quantity: int, ttl: int) -> str:
+        """
+        Adds quantity of sku to the cart and reserves the cart's whole quantity
+        of it for ttl seconds. Returns ITEM_MISSING if the cart is unknown or
+        checked out or the sku is unknown, and ITEM_INSUFFICIENT, adding
+        nothing, if stock not reserved by other carts can't cover it.
+        """
+
+    @abstractmethod
+    def sweep_reservations(self) -> int:
+        """Deletes expired reservations in one pass and returns how many there were."""
+
+    @abstractmethod
+    def reap_carts(self, max_age_ticks: int, limit: int) -> int:
+        """
+        Deletes up to limit open carts that have lived through max_age_ticks
+        ticks, with their items and reservations. Returns how many it deleted.
+        """
+
+    @abstractmethod
+    def archive_carts(self, limit: int) -> int:
+        """
+        Moves up to limit checked-out carts whose sale is already in
+        sale_analytics into cart_archive. Returns how many it moved.
+        """
+
+    @abstractmethod
+    def checkout(self, cart_id: int, prices: Dict[str, int]) -> CheckoutOutcome:
+        """
+        Charges the cart at prices, falling back to each potion's list price.
+        Items under a live reservation are sold without a stock check and the
+        reservations are released; others are checked against unreserved stock.
+        """
+
+    @abstractmethod
+    def search_orders(
+        self,
+        customer_name: str,
+        potion_sku: str,
+        sort_col: str,
+        sort_order: str,
+        offset: int,
+        limit: Optional[int],
+    ) -> List[SaleLine]:
+        """sort_col is one of customer_name, item_sku, line_item_total, timestamp."""
+
+    # analytics
+
+    @abstractmethod
+    def record_tick(self, day: str, hour: int) -> None:
+        """
+        Rolls the sales since the previous tick up into time analytics and
+        ages every open cart by a tick.
+        """
+
+    @abstractmethod
+    def queue_tick(self, day: str, hour: int) -> None:
+        """Queues the tick's roll up behind the sales already waiting in the analytics outbox."""
+
+    @abstractmethod
+    def apply_analytics(self, limit: int) -> AnalyticsBatch:
+        """
+        Applies up to limit queued analytics jobs in order, in one transaction,
+        stopping after the first tick. Returns an empty batch while another
+        worker is applying.
+        """
+
+    @abstractmethod
+    def get_pricing_inputs(self, day: str, hour: int) -> PricingInputs:
+        ...
+
+    @abstractmethod
+    def save_prices(self, prices: Dict[str, int], versions_to_keep: int) -> int:
+        """Stores a new price table version and returns its number."""
+
+    @abstractmethod
+    def load_prices(self) -> Tuple[int, Dict[str, int]]:
+        """Returns the latest price table version, or (0, {}) if there is none."""
+
+    # snapshots
+
+    @abstractmethod
+    def create_snapshot(self, name: str) -> None:
+        """Captures potions, ledgers, carts, analytics and prices under name, replacing any older one."""
+
+    @abstractmethod
+    def restore_snapshot(self, name: str) -> bool:
+        """Replaces the whole game state with the named snapshot. Returns False if there is none."""
+
+    @abstractmethod
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        ...
+
+    @abstractmethod
+    def delete_snapshot(self, name: str) -> bool:
+        ...
+
+    # integrity
+
+    @abstractmethod
+    def journal_since(self, after_id: int, limit: int) -> List[JournalTransaction]:
+        """
+        Up to limit journal transactions after after_id, in id order, stopping
+        before any that may still have a lower-id transaction in flight.
+        """
+
+    @abstractmethod
+    def balances_since(self, after_id: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        account_balances and the per-account sum of postings after after_id,
+        read from one snapshot.
+        """
+
+    @abstractmethod
+    def load_verifier_state(self) -> VerifierState:
+        ...
+
+    @abstractmethod
+    def save_verifier_state(self, state: VerifierState, previous_id: int) -> bool:
+        """
+        Stores state if the stored watermark is still previous_id. Returns False
+        when another verifier run got there first.
+        """
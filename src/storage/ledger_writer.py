@@ -0,0 +1,193 @@
+"""
+Group commit for ledger writes. Write transactions submitted within a few
+milliseconds of each other run back to back on one connection, each in its
+own savepoint, and share a single COMMIT, so a burst of checkouts pays for one
+WAL flush instead of one each.
+
+    future = writer.submit(lambda connection: write(connection, ...))
+    result = future.result()  # returns once the batch has committed
+
+A unit that raises rolls back to its savepoint and only its own future fails.
+A unit that lost a deadlock or serialization race instead runs again on its
+own once the batch has committed, as does every unit of a batch whose commit
+lost one; any other commit failure fails every future in the batch.
+
+One writer thread runs the batches. Each batch holds the row locks its
+earlier units took (the cart, the sku and gold rows of account_balances)
+until it commits, so two writers could take them in opposite orders and
+deadlock each other; with one writer only transactions outside the writer
+can, and those races are retried. A slow unit still delays every unit
+batched behind it, which is why group commit is off by default.
+"""
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+import queue
+import threading
+import time
+
+
+# deadlock_detected and serialization_failure: the unit lost a lock race and can run again
+RETRYABLE_SQLSTATES = ("40P01", "40001")
+RETRY_ATTEMPTS = 3
+
+
+@dataclass
+class WriterCounts:
+    units: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    retries: int = 0
+
+
+_counts = WriterCounts()
+_counts_lock = threading.Lock()
+
+
+def _retryable(error: BaseException) -> bool:
+    # sqlalchemy wraps the driver error; psycopg puts the SQLSTATE on it
+    return (
+        getattr(getattr(error, "orig", error), "sqlstate", None) in RETRYABLE_SQLSTATES
+    )
+
+
+class LedgerWriter:
+    """
+    The writer thread takes a batch off the queue: the first waiting unit plus
+    whatever arrives within window seconds, up to max_batch units. While one
+    batch commits the next one is already filling.
+    """
+
+    def __init__(self, engine, window: float, max_batch: int):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.SimpleQueue[Tuple[Callable[[Any], Any], Future] | None]" = (
+            queue.SimpleQueue()
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="ledger-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, unit: Callable[[Any], Any]) -> Future:
+        future: Future = Future()
+        self._queue.put((unit, future))
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch: List[Tuple[Callable[[Any], Any], Future]]):
+        outcomes: List[
+            Tuple[Callable[[Any], Any], Future, Any, Optional[BaseException]]
+        ] = []
+        try:
+            with self.engine.begin() as connection:
+                for unit, future in batch:
+                    try:
+                        with connection.begin_nested():
+                            outcomes.append((unit, future, unit(connection), None))
+                    except Exception as e:
+                        outcomes.append((unit, future, None, e))
+        except Exception as e:
+            with _counts_lock:
+                _counts.failed_batches += 1
+            if not _retryable(e):
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            # nothing in the batch committed, so each unit can run again by itself
+            outcomes = [(unit, future, None, e) for unit, future in batch]
+        else:
+            with _counts_lock:
+                _counts.units += len(batch)
+                _counts.batches += 1
+
+        for unit, future, value, error in outcomes:
+            if error is not None and _retryable(error):
+                self._run_alone(unit, future)
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+    def _run_alone(self, unit: Callable[[Any], Any], future: Future):
+        """
+        Runs a unit that lost a lock race in its own transaction, after the
+        batch that held its locks has committed.
+        """
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            with _counts_lock:
+                _counts.retries += 1
+            try:
+                with self.engine.begin() as connection:
+                    value = unit(connection)
+            except Exception as e:
+                if attempt < RETRY_ATTEMPTS and _retryable(e):
+                    continue
+                future.set_exception(e)
+                return
+            future.set_result(value)
+            return
+
+
+def render() -> str:
+    """
+    Units committed and the commits they shared, in Prometheus text format.
+    """
+    with _counts_lock:
+        counts = WriterCounts(**vars(_counts))
+    lines = []
+    for name, attr, help_text in (
+        (
+            "ledger_writer_units_total",
+            "units",
+            "Write transactions committed through group commit.",
+        ),
+        (
+            "ledger_writer_batches_total",
+            "batches",
+            "Group commits; units / batches is the average batch size.",
+        ),
+        (
+            "ledger_writer_failed_batches_total",
+            "failed_batches",
+            "Group commits that failed as a whole.",
+        ),
+        (
+            "ledger_writer_retries_total",
+            "retries",
+            "Units run again alone after losing a deadlock or serialization race.",
+        ),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {getattr(counts, attr)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,761 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import bisect
+import copy
+import threading
+from src.storage.base import (
+    AnalyticsBatch,
+    Balances,
+    CheckoutOutcome,
+    JournalTransaction,
+    PotionStock,
+    PricingInputs,
+    SaleLine,
+    SnapshotInfo,
+    Storage,
+    VerifierState,
+    BARREL_DELIVERY,
+    CAPACITY_DELIVERY,
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    GOLD_ACCOUNT,
+    ITEM_INSUFFICIENT,
+    ITEM_MISSING,
+    ITEM_RESERVED,
+    ML_ACCOUNTS,
+    ML_CAPACITY_ACCOUNT,
+    POTION_CAPACITY_ACCOUNT,
+    POTION_DELIVERY,
+    RESET_POSTINGS,
+    SALE_JOB,
+    SKU_PREFIX,
+    TICK_JOB,
+    capacity_postings,
+    journal_entries,
+    sku_account,
+)
+
+# everything a snapshot captures
+GAME_STATE = (
+    "_potions",
+    "_time_analytics",
+    "_sale_analytics",
+    "_prices",
+    "_gold_ledger",
+    "_potion_ledger",
+    "_liquid_ledger",
+    "_capacity_ledger",
+    "_journal",
+    "_account_balances",
+    "_balance_checkpoints",
+    "_verifier_state",
+    "_idempotency_keys",
+    "_analytics_outbox",
+    "_carts",
+    "_cart_items",
+    "_reservations",
+    "_cart_archive",
+    "_next_cart_id",
+)
+
+SEARCH_SORT_KEYS = {
+    "customer_name": lambda line: line["customer_name"],
+    "item_sku": lambda line: line["item_sku"],
+    "line_item_total": lambda line: line["line_item_total"],
+    "timestamp": lambda line: line["timestamp"],
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def balances_from_accounts(balances: Dict[str, int]) -> Balances:
+    return Balances(
+        gold=balances.get(GOLD_ACCOUNT, 0),
+        red_ml=balances.get(ML_ACCOUNTS["red_ml"], 0),
+        green_ml=balances.get(ML_ACCOUNTS["green_ml"], 0),
+        blue_ml=balances.get(ML_ACCOUNTS["blue_ml"], 0),
+        dark_ml=balances.get(ML_ACCOUNTS["dark_ml"], 0),
+        number_of_potions=sum(
+            balance
+            for account, balance in balances.items()
+            if account.startswith(SKU_PREFIX)
+        ),
+        max_potion_capacity=balances.get(POTION_CAPACITY_ACCOUNT, 0),
+        max_barrel_capacity=balances.get(ML_CAPACITY_ACCOUNT, 0),
+    )
+
+
+class MemoryStorage(Storage):
+    """
+    Keeps the same append-only ledgers as Postgres in plain lists, so planners
+    and simulations can run without a database. Not shared between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._potions: Dict[str, dict] = {}
+        self._time_analytics: Dict[Tuple[str, int], dict] = {}
+        self._sale_analytics: List[dict] = []
+        self._prices: Dict[int, Dict[str, int]] = {}
+        self._snapshots: Dict[str, Tuple[datetime, dict]] = {}
+        self._clear_ledgers()
+
+    def _clear_ledgers(self):
+        self._gold_ledger: List[dict] = []
+        self._potion_ledger: List[dict] = []
+        self._liquid_ledger: List[dict] = []
+        self._capacity_ledger: List[dict] = []
+        self._journal: List[dict] = []
+        self._account_balances: Dict[str, int] = {}
+        # (transaction_id, balances after it), one per tick
+        self._balance_checkpoints: List[Tuple[int, Dict[str, int]]] = []
+        self._verifier_state = VerifierState()
+        self._idempotency_keys: set = set()
+        self._analytics_outbox: List[dict] = []
+        self._carts: Dict[int, dict] = {}
+        self._cart_items: Dict[int, Dict[str, int]] = {}
+        # (cart_id, sku) -> (quantity, expires_at)
+        self._reservations: Dict[Tuple[int, str], Tuple[int, datetime]] = {}
+        # checked-out carts moved out of _carts, with their items
+        self._cart_archive: Dict[int, dict] = {}
+        self._next_cart_id = 1
+
+    def _claim(self, endpoint: str, order_id: int) -> bool:
+        key = (endpoint, order_id)
+        if key in self._idempotency_keys:
+            return False
+        self._idempotency_keys.add(key)
+        return True
+
+    def _post(self, order_id: int, transaction_type: str, postings: Dict[str, int]):
+        entries = journal_entries(postings)
+        self._journal.append(
+            {
+                "transaction_id": len(self._journal) + 1,
+                "order_id": order_id,
+                "transaction_type": transaction_type,
+                "postings": entries,
+                "created_at": _now(),
+            }
+        )
+        for entry in entries:
+            self._account_balances[entry["account"]] = (
+                self._account_balances.get(entry["account"], 0) + entry["delta"]
+            )
+
+    def _stock(self, sku: str) -> int:
+        return self._account_balances.get(sku_account(sku), 0)
+
+    def _reserved(
+        self, sku: str, now: datetime, except_cart: Optional[int] = None
+    ) -> int:
+        return sum(
+            quantity
+            for (cart_id, reserved_sku), (
+                quantity,
+                expires_at,
+            ) in self._reservations.items()
+            if reserved_sku == sku and cart_id != except_cart and expires_at > now
+        )
+
+    def _add_gold(self, order_id: int, gold_delta: int, transaction_type: str):
+        self._gold_ledger.append(
+            {
+                "order_id": order_id,
+                "gold_delta": gold_delta,
+                "transaction_type": transaction_type,
+                "created_at": _now(),
+            }
+        )
+
+    def _add_liquid(self, order_id: int, deltas: List[float], transaction_type: str):
+        self._liquid_ledger.append(
+            {
+                "order_id": order_id,
+                # the ledger columns are integers, Postgres rounds on insert
+                "deltas": [round(delta) for delta in deltas],
+                "transaction_type": transaction_type,
+                "created_at": _now(),
+            }
+        )
+
+    def _add_potions(
+        self,
+        order_id: int,
+        line_item_id: int,
+        sku: str,
+        quantity_delta: int,
+        transaction_type: str,
+    ):
+        self._potion_ledger.append(
+            {
+                "order_id": order_id,
+                "line_item_id": line_item_id,
+                "sku": sku,
+                "quantity_delta": quantity_delta,
+                "transaction_type": transaction_type,
+                "created_at": _now(),
+            }
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear_ledgers()
+            self._add_gold(-1, 100, "GAME_RESET")
+            self._capacity_ledger.append(
+                {
+                    "order_id": -1,
+                    "potion_capacity_increase": 50,
+                    "ml_capacity_increase": 10000,
+                    "gold_delta": 0,
+                }
+            )
+            self._post(-1, "GAME_RESET", RESET_POSTINGS)
+
+    def add_potion(
+        self,
+        sku: str,
+        name: str,
+        price: int,
+        potion_type: List[int],
+        is_active: bool = True,
+    ) -> None:
+        with self._lock:
+            self._potions[sku] = {
+                "sku": sku,
+                "name": name,
+                "price": price,
+                "potion_type": list(potion_type),
+                "is_active": is_active,
+            }
+
+    def get_balances(self) -> Balances:
+        with self._lock:
+            return balances_from_accounts(self._account_balances)
+
+    def get_balances_as_of(self, as_of: datetime) -> Optional[Balances]:
+        if as_of.tzinfo is None:
+            as_of = as_of.replace(tzinfo=timezone.utc)
+        with self._lock:
+            target = bisect.bisect_right(
+                self._journal, as_of, key=lambda entry: entry["created_at"]
+            )
+            if target == 0:
+                return None
+            # transaction ids are journal positions + 1, so the checkpoint at id n covers self._journal[:n]
+            index = bisect.bisect_right(
+                self._balance_checkpoints, target, key=lambda checkpoint: checkpoint[0]
+            )
+            start, balances = self._balance_checkpoints[index - 1] if index else (0, {})
+            balances = dict(balances)
+            for entry in self._journal[start:target]:
+                for posting in entry["postings"]:
+                    balances[posting["account"]] = (
+                        balances.get(posting["account"], 0) + posting["delta"]
+                    )
+            return balances_from_accounts(balances)
+
+    def get_potion_stock(self, active_only: bool = True) -> List[PotionStock]:
+        now = _now()
+        with self._lock:
+            return [
+                PotionStock(
+                    sku=potion["sku"],
+                    name=potion["name"],
+                    price=potion["price"],
+                    red_ml=potion["potion_type"][0],
+                    green_ml=potion["potion_type"][1],
+                    blue_ml=potion["potion_type"][2],
+                    dark_ml=potion["potion_type"][3],
+                    is_active=potion["is_active"],
+                    quantity=self._stock(potion["sku"]),
+                    reserved=self._reserved(potion["sku"], now),
+                )
+                for potion in sorted(
+                    self._potions.values(), key=lambda potion: potion["sku"]
+                )
+                if potion["is_active"] or not active_only
+            ]
+
+    def record_barrel_delivery(
+        self,
+        order_id: int,
+        gold_paid: int,
+        red_ml: int,
+        green_ml: int,
+        blue_ml: int,
+        dark_ml: int,
+    ) -> bool:
+        with self._lock:
+            if not self._claim(BARREL_DELIVERY, order_id):
+                return False
+
+            self._add_liquid(
+                order_id, [red_ml, green_ml, blue_ml, dark_ml], "BARREL_DELIVERY"
+            )
+            # negative because we're paying
+            self._add_gold(order_id, -gold_paid, "BARREL_PURCHASE")
+            self._post(
+                order_id,
+                "BARREL_DELIVERY",
+                {
+                    GOLD_ACCOUNT: -gold_paid,
+                    ML_ACCOUNTS["red_ml"]: round(red_ml),
+                    ML_ACCOUNTS["green_ml"]: round(green_ml),
+                    ML_ACCOUNTS["blue_ml"]: round(blue_ml),
+                    ML_ACCOUNTS["dark_ml"]: round(dark_ml),
+                },
+            )
+        return True
+
+    def record_potion_delivery(
+        self,
+        order_id: int,
+        potions: List[Tuple[List[int], int]],
+        ml_used: Dict[str, int],
+    ) -> bool:
+        with self._lock:
+            if (POTION_DELIVERY, order_id) in self._idempotency_keys:
+                return False
+
+            skus_by_recipe = {
+                tuple(potion["potion_type"]): sku
+                for sku, potion in self._potions.items()
+            }
+            skus = []
+            for potion_type, _ in potions:
+                if tuple(potion_type) not in skus_by_recipe:
+                    raise LookupError(f"no potion with recipe {potion_type}")
+                skus.append(skus_by_recipe[tuple(potion_type)])
+            # claimed only once nothing can fail, like the Postgres transaction
+            self._claim(POTION_DELIVERY, order_id)
+
+            for line_item_id, (sku, (_, quantity)) in enumerate(
+                zip(skus, potions), start=1
+            ):
+                self._add_potions(
+                    order_id, line_item_id, sku, quantity, "POTION_DELIVERY"
+                )
+            self._add_liquid(
+                order_id,
+                [
+                    ml_used["red_ml"],
+                    ml_used["green_ml"],
+                    ml_used["blue_ml"],
+                    ml_used["dark_ml"],
+                ],
+                "POTION_DELIVERY",
+            )
+            postings = {
+                ML_ACCOUNTS[color]: round(delta) for color, delta in ml_used.items()
+            }
+            for sku, (_, quantity) in zip(skus, potions):
+                postings[sku_account(sku)] = (
+                    postings.get(sku_account(sku), 0) + quantity
+                )
+            self._post(order_id, "POTION_DELIVERY", postings)
+        return True
+
+    def record_capacity_delivery(
+        self,
+        order_id: int,
+        potion_capacity_increase: int,
+        ml_capacity_increase: int,
+        gold_delta: int,
+    ) -> bool:
+        with self._lock:
+            if not self._claim(CAPACITY_DELIVERY, order_id):
+                return False
+
+            self._capacity_ledger.append(
+                {
+                    "order_id": order_id,
+                    "potion_capacity_increase": potion_capacity_increase,
+                    "ml_capacity_increase": ml_capacity_increase,
+                    "gold_delta": gold_delta,
+                }
+            )
+            self._add_gold(order_id, gold_delta, "INVENTORY_UPGRADE")
+            self._post(
+                order_id,
+                "INVENTORY_UPGRADE",
+                capacity_postings(
+                    potion_capacity_increase, ml_capacity_increase, gold_delta
+                ),
+            )
+        return True
+
+    def create_cart(self, customer_name: str, character_class: str) -> int:
+        with self._lock:
+            cart_id = self._next_cart_id
+            self._next_cart_id += 1
+            self._carts[cart_id] = {
+                "customer_name": customer_name,
+                "character_class": character_class,
+                "is_checked_out": False,
+                "created_at": _now(),
+                "age_ticks": 0,
+            }
+            self._cart_items[cart_id] = {}
+        return cart_id
+
+    def set_cart_item(self, cart_id: int, sku: str, quantity: int, ttl: int) -> str:
+        now = _now()
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None or cart["is_checked_out"] or sku not in self._potions:
+                return ITEM_MISSING
+            items = self._cart_items[cart_id]
+            requested = items.get(sku, 0) + quantity
+            if (
+                self._stock(sku) - self._reserved(sku, now, except_cart=cart_id)
+                < requested
+            ):
+                return ITEM_INSUFFICIENT
+            self._reservations[(cart_id, sku)] = (
+                requested,
+                now + timedelta(seconds=ttl),
+            )
+            items[sku] = requested
+        return ITEM_RESERVED
+
+    def sweep_reservations(self) -> int:
+        now = _now()
+        with self._lock:
+            expired = [
+                key
+                for key, (_, expires_at) in self._reservations.items()
+                if expires_at <= now
+            ]
+            for key in expired:
+                del self._reservations[key]
+        return len(expired)
+
+    def reap_carts(self, max_age_ticks: int, limit: int) -> int:
+        with self._lock:
+            expired = sorted(
+                cart_id
+                for cart_id, cart in self._carts.items()
+                if not cart["is_checked_out"] and cart["age_ticks"] >= max_age_ticks
+            )[:limit]
+            for cart_id in expired:
+                del self._carts[cart_id]
+                for sku in self._cart_items.pop(cart_id):
+                    self._reservations.pop((cart_id, sku), None)
+        return len(expired)
+
+    def archive_carts(self, limit: int) -> int:
+        with self._lock:
+            sold = {sale["cart_id"] for sale in self._sale_analytics}
+            settled = sorted(
+                cart_id
+                for cart_id, cart in self._carts.items()
+                if cart["is_checked_out"] and cart_id in sold
+            )[:limit]
+            for cart_id in settled:
+                cart = self._carts.pop(cart_id)
+                self._cart_archive[cart_id] = {
+                    "customer_name": cart["customer_name"],
+                    "character_class": cart["character_class"],
+                    "created_at": cart["created_at"],
+                    "items": self._cart_items.pop(cart_id),
+                }
+        return len(settled)
+
+    def checkout(self, cart_id: int, prices: Dict[str, int]) -> CheckoutOutcome:
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None:
+                return CheckoutOutcome(CHECKOUT_MISSING)
+
+            items = self._cart_items[cart_id]
+            total_potions_bought = sum(items.values())
+            total_gold = sum(
+                quantity * prices.get(sku, self._potions[sku]["price"])
+                for sku, quantity in items.items()
+            )
+
+            if total_potions_bought == 0:
+                return CheckoutOutcome(CHECKOUT_EMPTY)
+
+            if cart["is_checked_out"]:
+                return CheckoutOutcome(
+                    CHECKOUT_ALREADY_DONE, total_potions_bought, total_gold
+                )
+
+            now = _now()
+            for sku, quantity in items.items():
+                held, expires_at = self._reservations.get((cart_id, sku), (0, now))
+                if expires_at > now and held >= quantity:
+                    continue
+                if (
+                    self._stock(sku) - self._reserved(sku, now, except_cart=cart_id)
+                    < quantity
+                ):
+                    return CheckoutOutcome(CHECKOUT_INSUFFICIENT)
+
+            self._add_gold(cart_id, total_gold, "POTION_SALE")
+            cart["is_checked_out"] = True
+            for sku in items:
+                self._reservations.pop((cart_id, sku), None)
+            for line_item_id, (sku, quantity) in enumerate(items.items(), start=1):
+                self._add_potions(cart_id, line_item_id, sku, -quantity, "POTION_SALE")
+            self._post(
+                cart_id,
+                "POTION_SALE",
+                {
+                    GOLD_ACCOUNT: total_gold,
+                    **{sku_account(sku): -quantity for sku, quantity in items.items()},
+                },
+            )
+
+            self._analytics_outbox.append(
+                {
+                    "kind": SALE_JOB,
+                    "payload": {
+                        "cart_id": cart_id,
+                        "customer_class": cart["character_class"],
+                        "total_gold": total_gold,
+                        "potion_count": total_potions_bought,
+                    },
+                    "created_at": _now(),
+                }
+            )
+        return CheckoutOutcome(CHECKOUT_OK, total_potions_bought, total_gold)
+
+    def search_orders(
+        self,
+        customer_name: str,
+        potion_sku: str,
+        sort_col: str,
+        sort_order: str,
+        offset: int,
+        limit: Optional[int],
+    ) -> List[SaleLine]:
+        with self._lock:
+            lines = []
+            for sale in self._gold_ledger:
+                if sale["transaction_type"] != "POTION_SALE":
+                    continue
+                if sale["order_id"] in self._carts:
+                    cart = self._carts[sale["order_id"]]
+                    items = self._cart_items[sale["order_id"]]
+                elif sale["order_id"] in self._cart_archive:
+                    cart = self._cart_archive[sale["order_id"]]
+                    items = cart["items"]
+                else:
+                    continue
+                for sku, quantity in items.items():
+                    name = self._potions[sku]["name"]
+                    if customer_name and cart["customer_name"] != customer_name:
+                        continue
+                    if potion_sku and name != potion_sku:
+                        continue
+                    lines.append(
+                        {
+                            "quantity": quantity,
+                            "item_sku": name,
+                            "customer_name": cart["customer_name"],
+                            "line_item_total": sale["gold_delta"],
+                            "timestamp": sale["created_at"],
+                        }
+                    )
+
+        lines.sort(key=SEARCH_SORT_KEYS[sort_col], reverse=sort_order != "asc")
+        page = lines[offset : offset + limit] if limit is not None else lines
+        first_id = offset + 1 if limit is not None else 1
+        return [
+            SaleLine(line_item_id=line_item_id, total_count=len(lines), **line)
+            for line_item_id, line in enumerate(page, start=first_id)
+        ]
+
+    def record_tick(self, day: str, hour: int) -> None:
+        with self._lock:
+            now = _now()
+            sales = [
+                entry
+                for entry in self._gold_ledger
+                if entry["transaction_type"] == "POTION_SALE"
+                and entry["created_at"].date() == now.date()
+                and entry["created_at"] >= now - timedelta(hours=3)
+            ]
+            visitors = sum(
+                1
+                for cart in [*self._carts.values(), *self._cart_archive.values()]
+                if cart["created_at"].date() == now.date()
+            )
+            self._time_analytics[(day, hour)] = {
+                "day_of_week": day,
+                "hour_of_day": hour,
+                "total_sales": len({entry["order_id"] for entry in sales}),
+                "total_gold": float(sum(entry["gold_delta"] for entry in sales)),
+                "visitor_count": visitors if sales else 0,
+                "created_at": now,
+            }
+            for cart in self._carts.values():
+                if not cart["is_checked_out"]:
+                    cart["age_ticks"] += 1
+
+    def queue_tick(self, day: str, hour: int) -> None:
+        with self._lock:
+            self._analytics_outbox.append(
+                {
+                    "kind": TICK_JOB,
+                    "payload": {"day": day, "hour": hour},
+                    "created_at": _now(),
+                }
+            )
+
+    def apply_analytics(self, limit: int) -> AnalyticsBatch:
+        with self._lock:
+            batch = AnalyticsBatch()
+            for job in self._analytics_outbox[:limit]:
+                batch.applied += 1
+                payload = job["payload"]
+                if job["kind"] == TICK_JOB:
+                    batch.tick = (payload["day"], payload["hour"])
+                    self.record_tick(*batch.tick)
+                    last_checkpoint = (
+                        self._balance_checkpoints[-1][0]
+                        if self._balance_checkpoints
+                        else 0
+                    )
+                    if len(self._journal) > last_checkpoint:
+                        self._balance_checkpoints.append(
+                            (len(self._journal), dict(self._account_balances))
+                        )
+                    break
+                if self._time_analytics:
+                    current = max(
+                        self._time_analytics.values(), key=lambda row: row["created_at"]
+                    )
+                    self._sale_analytics.append(
+                        {
+                            **payload,
+                            "hour_of_day": current["hour_of_day"],
+                            "day_of_week": current["day_of_week"],
+                            "created_at": job["created_at"],
+                        }
+                    )
+            del self._analytics_outbox[: batch.applied]
+            return batch
+
+    def get_pricing_inputs(self, day: str, hour: int) -> PricingInputs:
+        with self._lock:
+            since = _now() - timedelta(hours=24)
+            potions = self.get_potion_stock(active_only=True)
+            sold_recent = {potion.sku: 0 for potion in potions}
+            for entry in self._potion_ledger:
+                if (
+                    entry["sku"] in sold_recent
+                    and entry["transaction_type"] == "POTION_SALE"
+                    and entry["created_at"] >= since
+                ):
+                    sold_recent[entry["sku"]] -= entry["quantity_delta"]
+
+            slots = list(self._time_analytics.values())
+            expected = [
+                row["total_sales"]
+                for row in slots
+                if row["day_of_week"] == day and row["hour_of_day"] == hour
+            ]
+
+        demand_factor = 1.0
+        average_sales = (
+            sum(row["total_sales"] for row in slots) / len(slots) if slots else 0
+        )
+        expected_sales = sum(expected) / len(expected) if expected else 0
+        if average_sales and expected_sales:
+            demand_factor = expected_sales / average_sales
+
+        return PricingInputs(
+            skus=[potion.sku for potion in potions],
+            base_prices=[potion.price for potion in potions],
+            stock=[potion.quantity for potion in potions],
+            sold_recent=[sold_recent[potion.sku] for potion in potions],
+            demand_factor=demand_factor,
+        )
+
+    def save_prices(self, prices: Dict[str, int], versions_to_keep: int) -> int:
+        with self._lock:
+            version = max(self._prices, default=0) + 1
+            if prices:
+                self._prices[version] = dict(prices)
+            for old in [v for v in self._prices if v <= version - versions_to_keep]:
+                del self._prices[old]
+        return version
+
+    def load_prices(self) -> Tuple[int, Dict[str, int]]:
+        with self._lock:
+            if not self._prices:
+                return 0, {}
+            version = max(self._prices)
+            return version, dict(self._prices[version])
+
+    def create_snapshot(self, name: str) -> None:
+        with self._lock:
+            state = copy.deepcopy({attr: getattr(self, attr) for attr in GAME_STATE})
+            self._snapshots[name] = (_now(), state)
+
+    def restore_snapshot(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._snapshots:
+                return False
+            _, state = self._snapshots[name]
+            for attr, value in copy.deepcopy(state).items():
+                setattr(self, attr, value)
+        return True
+
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        with self._lock:
+            snapshots = [
+                SnapshotInfo(name=name, created_at=created_at)
+                for name, (created_at, _) in self._snapshots.items()
+            ]
+        return sorted(snapshots, key=lambda snapshot: snapshot.created_at, reverse=True)
+
+    def delete_snapshot(self, name: str) -> bool:
+        with self._lock:
+            return self._snapshots.pop(name, None) is not None
+
+    def journal_since(self, after_id: int, limit: int) -> List[JournalTransaction]:
+        # posts happen under the lock, so nothing here is ever in flight
+        with self._lock:
+            return [
+                JournalTransaction(
+                    transaction_id=entry["transaction_id"],
+                    order_id=entry["order_id"],
+                    transaction_type=entry["transaction_type"],
+                    postings={
+                        posting["account"]: posting["delta"]
+                        for posting in entry["postings"]
+                    },
+                )
+                for entry in self._journal[after_id : after_id + limit]
+            ]
+
+    def balances_since(self, after_id: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        with self._lock:
+            deltas: Dict[str, int] = {}
+            for entry in self._journal[after_id:]:
+                for posting in entry["postings"]:
+                    deltas[posting["account"]] = (
+                        deltas.get(posting["account"], 0) + posting["delta"]
+                    )
+            return dict(self._account_balances), deltas
+
+    def load_verifier_state(self) -> VerifierState:
+        with self._lock:
+            return copy.deepcopy(self._verifier_state)
+
+    def save_verifier_state(self, state: VerifierState, previous_id: int) -> bool:
+        with self._lock:
+            if self._verifier_state.transaction_id != previous_id:
+                return False
+            self._verifier_state = copy.deepcopy(state)
+            return True
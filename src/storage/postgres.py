@@ -0,0 +1,1594 @@
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import functools
+import json
+import sqlalchemy
+from src.storage.base import (
+    AnalyticsBatch,
+    Balances,
+    CheckoutOutcome,
+    JournalTransaction,
+    PotionStock,
+    PricingInputs,
+    SaleLine,
+    SnapshotInfo,
+    BARREL_DELIVERY,
+    CAPACITY_DELIVERY,
+    Storage,
+    VerifierState,
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    GOLD_ACCOUNT,
+    ITEM_INSUFFICIENT,
+    ITEM_MISSING,
+    ITEM_RESERVED,
+    ML_ACCOUNTS,
+    POTION_DELIVERY,
+    RESET_POSTINGS,
+    SALE_JOB,
+    TICK_JOB,
+    capacity_postings,
+    journal_entries,
+    sku_account,
+)
+
+# statements shared with the async handlers, which run them on db.async_engine
+
+# the Balances fields, folded from (account, balance) rows
+BALANCE_COLUMNS = """
+        COALESCE(SUM(balance) FILTER (WHERE account = 'gold'), 0) as gold,
+        COALESCE(SUM(balance) FILTER (WHERE account LIKE 'sku:%'), 0) as number_of_potions,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'capacity:potions'), 0) as max_potion_capacity,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'capacity:ml'), 0) as max_barrel_capacity,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'ml:red'), 0) as red_ml,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'ml:green'), 0) as green_ml,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'ml:blue'), 0) as blue_ml,
+        COALESCE(SUM(balance) FILTER (WHERE account = 'ml:dark'), 0) as dark_ml
+"""
+
+# one read of the shop's side of account_balances, a row per account
+BALANCES_SQL = sqlalchemy.text(
+    f"""
+    SELECT {BALANCE_COLUMNS}
+    FROM account_balances
+    WHERE account NOT LIKE 'world:%'
+    """
+)
+
+# balances after the last journal transaction at or before :as_of: the nearest checkpoint
+# at or below it plus the postings in between, so the scan is at most one tick of postings
+BALANCES_AS_OF_SQL = sqlalchemy.text(
+    f"""
+    WITH target AS (
+        SELECT transaction_id AS id
+        FROM journal_transactions
+        WHERE created_at <= :as_of
+        ORDER BY created_at DESC, transaction_id DESC
+        LIMIT 1
+    ), checkpoint AS (
+        SELECT COALESCE(MAX(transaction_id), 0) AS id
+        FROM balance_checkpoints
+        WHERE transaction_id <= (SELECT id FROM target)
+    ), balances AS (
+        SELECT account, balance
+        FROM balance_checkpoints
+        WHERE transaction_id = (SELECT id FROM checkpoint)
+        UNION ALL
+        SELECT account, delta
+        FROM journal_postings
+        WHERE transaction_id > (SELECT id FROM checkpoint)
+            AND transaction_id <= (SELECT id FROM target)
+    )
+    SELECT (SELECT id FROM target) AS transaction_id, {BALANCE_COLUMNS}
+    FROM balances
+    WHERE account NOT LIKE 'world:%'
+    """
+)
+
+POTION_STOCK_SQL = sqlalchemy.text(
+    """
+    SELECT
+        p.sku,
+        p.name,
+        p.price,
+        p.red_ml,
+        p.green_ml,
+        p.blue_ml,
+        p.dark_ml,
+        p.is_active,
+        COALESCE(b.balance, 0) AS quantity,
+        COALESCE(r.quantity, 0) AS reserved
+    FROM potions p
+    LEFT JOIN account_balances b ON b.account = 'sku:' || p.sku
+    LEFT JOIN (
+        SELECT sku, SUM(quantity) AS quantity
+        FROM stock_reservations
+        WHERE expires_at > CURRENT_TIMESTAMP
+        GROUP BY sku
+    ) r ON r.sku = p.sku
+    WHERE p.is_active = TRUE OR NOT :active_only
+    ORDER BY p.sku
+    """
+)
+
+CREATE_CART_SQL = sqlalchemy.text(
+    """
+    INSERT INTO carts (customer_name, character_class)
+    VALUES (:customer_name, :character_class)
+    RETURNING cart_id
+    """
+)
+
+# lock the row with FOR UPDATE to prevent concurrent updates
+LOCK_CART_FOR_ITEM_SQL = sqlalchemy.text(
+    """
+    SELECT c.is_checked_out, p.sku
+    FROM carts c
+    JOIN potions p ON p.sku = :sku
+    WHERE c.cart_id = :cart_id
+    FOR UPDATE
+    """
+)
+
+# reservations of one sku take turns on its stock row; taken in a statement of its own so
+# the reservation that follows reads the reservations committed while it waited
+LOCK_SKU_STOCK_SQL = sqlalchemy.text(
+    """
+    SELECT balance
+    FROM account_balances
+    WHERE account = 'sku:' || :sku
+    FOR UPDATE
+    """
+)
+
+
+def reserve_stock_sql(expires_at: str) -> sqlalchemy.TextClause:
+    """
+    Holds the cart's whole quantity of sku (what it had plus :quantity) until
+    expires_at, if stock minus other carts' live reservations covers it. No
+    row back means it doesn't.
+    """
+    return sqlalchemy.text(
+        f"""
+        WITH requested AS (
+            SELECT COALESCE(
+                (SELECT quantity FROM cart_items WHERE cart_id = :cart_id AND sku = :sku), 0
+            ) + :quantity AS quantity
+        ), available AS (
+            SELECT COALESCE(
+                (SELECT balance FROM account_balances WHERE account = 'sku:' || :sku), 0
+            ) - COALESCE(
+                (
+                    SELECT SUM(quantity)
+                    FROM stock_reservations
+                    WHERE sku = :sku AND cart_id <> :cart_id AND expires_at > CURRENT_TIMESTAMP
+                ), 0
+            ) AS quantity
+        )
+        INSERT INTO stock_reservations (cart_id, sku, quantity, expires_at)
+        SELECT :cart_id, :sku, requested.quantity, {expires_at}
+        FROM requested, available
+        WHERE available.quantity >= requested.quantity
+        ON CONFLICT (cart_id, sku) DO UPDATE SET quantity = excluded.quantity, expires_at = excluded.expires_at
+        RETURNING quantity
+        """
+    )
+
+
+RESERVE_STOCK_SQL = reserve_stock_sql("CURRENT_TIMESTAMP + make_interval(secs => :ttl)")
+
+SWEEP_RESERVATIONS_SQL = sqlalchemy.text(
+    "DELETE FROM stock_reservations WHERE expires_at <= CURRENT_TIMESTAMP"
+)
+
+AGE_OPEN_CARTS_SQL = sqlalchemy.text(
+    "UPDATE carts SET age_ticks = age_ticks + 1 WHERE NOT is_checked_out"
+)
+
+# one batch of abandoned carts; their items and reservations go with them by cascade
+REAP_CARTS_SQL = sqlalchemy.text(
+    """
+    WITH expired AS (
+        SELECT cart_id
+        FROM carts
+        WHERE NOT is_checked_out AND age_ticks >= :max_age_ticks
+        ORDER BY cart_id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM carts c
+    USING expired e
+    WHERE c.cart_id = e.cart_id
+    """
+)
+
+# one batch of checked-out carts whose sale the analytics worker has applied, flattened into
+# cart_archive; every sub-statement reads the same snapshot, so the items are copied before
+# the cascade removes them
+ARCHIVE_CARTS_SQL = sqlalchemy.text(
+    """
+    WITH settled AS (
+        SELECT c.cart_id
+        FROM carts c
+        WHERE c.is_checked_out
+            AND EXISTS (SELECT 1 FROM sale_analytics s WHERE s.cart_id = c.cart_id)
+        ORDER BY c.cart_id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ), archived AS (
+        DELETE FROM carts c
+        USING settled s
+        WHERE c.cart_id = s.cart_id
+        RETURNING c.cart_id, c.customer_name, c.character_class, c.created_at
+    ), archived_items AS (
+        INSERT INTO cart_archive (cart_id, sku, quantity, customer_name, character_class, created_at)
+        SELECT a.cart_id, ci.sku, ci.quantity, a.customer_name, a.character_class, a.created_at
+        FROM archived a
+        JOIN cart_items ci ON ci.cart_id = a.cart_id
+    )
+    SELECT COUNT(*) FROM archived
+    """
+)
+
+UPSERT_CART_ITEM_SQL = sqlalchemy.text(
+    """
+    INSERT INTO cart_items (cart_id, sku, quantity)
+    VALUES (:cart_id, :sku, :quantity)
+    ON CONFLICT (cart_id, sku) DO UPDATE
+    SET quantity = cart_items.quantity + :quantity
+    """
+)
+
+LOCK_CART_SQL = sqlalchemy.text(
+    """
+    SELECT cart_id, character_class
+    FROM carts
+    WHERE cart_id = :cart_id
+    FOR UPDATE
+    """
+)
+
+CART_ITEMS_SQL = sqlalchemy.text(
+    """
+    SELECT
+        c.is_checked_out,
+        ci.sku,
+        COALESCE(ci.quantity, 0) as quantity,
+        p.price
+    FROM carts c
+    LEFT JOIN cart_items ci ON ci.cart_id = c.cart_id
+    LEFT JOIN potions p ON p.sku = ci.sku
+    WHERE c.cart_id = :cart_id
+    """
+)
+
+# items not covered by a live reservation of the cart's own that stock minus other carts'
+# live reservations can't cover; reserved items are sold without looking at stock again
+INSUFFICIENT_INVENTORY_SQL = sqlalchemy.text(
+    """
+    SELECT
+        ci.sku,
+        ci.quantity as requested_quantity,
+        COALESCE(b.balance, 0) - COALESCE(held.quantity, 0) as available_quantity
+    FROM cart_items ci
+    LEFT JOIN stock_reservations own
+        ON own.cart_id = ci.cart_id AND own.sku = ci.sku AND own.expires_at > CURRENT_TIMESTAMP
+    LEFT JOIN account_balances b ON b.account = 'sku:' || ci.sku
+    LEFT JOIN (
+        SELECT sku, SUM(quantity) AS quantity
+        FROM stock_reservations
+        WHERE cart_id <> :cart_id AND expires_at > CURRENT_TIMESTAMP
+        GROUP BY sku
+    ) held ON held.sku = ci.sku
+    WHERE ci.cart_id = :cart_id
+        AND (own.quantity IS NULL OR own.quantity < ci.quantity)
+        AND COALESCE(b.balance, 0) - COALESCE(held.quantity, 0) < ci.quantity
+    """
+)
+
+# update gold and potion ledger, check out cart, release its reservations, and queue the sale for analytics
+CHECKOUT_SQL = sqlalchemy.text(
+    """
+    WITH gold_update AS (
+        INSERT INTO gold_ledger
+        (order_id, gold_delta, transaction_type)
+        VALUES (:cart_id, :gold_delta, 'POTION_SALE')
+    ), cart_update AS (
+        UPDATE carts
+        SET is_checked_out = true
+        WHERE cart_id = :cart_id
+    ), potion_ledger_update AS (
+        INSERT INTO potion_ledger (order_id, line_item_id, sku, quantity_delta, transaction_type)
+        SELECT
+            :cart_id,
+            ROW_NUMBER() OVER () as line_item_id,
+            sku,
+            -quantity,
+            'POTION_SALE'
+        FROM cart_items
+        WHERE cart_id = :cart_id
+    ), reservation_release AS (
+        DELETE FROM stock_reservations
+        WHERE cart_id = :cart_id
+    ), sale_job AS (
+        INSERT INTO analytics_outbox (kind, payload)
+        VALUES ('sale', jsonb_build_object(
+            'cart_id', CAST(:cart_id AS integer),
+            'customer_class', CAST(:character_class AS text),
+            'total_gold', CAST(:gold_delta AS integer),
+            'potion_count', CAST(:potion_count AS integer)
+        ))
+    )
+    SELECT 1
+    """
+)
+
+ENQUEUE_ANALYTICS_SQL = sqlalchemy.text(
+    "INSERT INTO analytics_outbox (kind, payload) VALUES (:kind, CAST(:payload AS jsonb))"
+)
+
+# one worker applies the outbox at a time, so jobs land in the order they were queued
+ANALYTICS_LOCK_ID = 4303
+LOCK_ANALYTICS_SQL = sqlalchemy.text("SELECT pg_try_advisory_xact_lock(:lock_id)")
+
+PENDING_ANALYTICS_SQL = sqlalchemy.text(
+    """
+    SELECT job_id, kind, payload, created_at
+    FROM analytics_outbox
+    ORDER BY job_id
+    LIMIT :limit
+    """
+)
+
+# by id rather than up to the last one: a checkout that commits late can hold a lower job_id
+DELETE_ANALYTICS_SQL = sqlalchemy.text(
+    "DELETE FROM analytics_outbox WHERE job_id IN :job_ids"
+).bindparams(sqlalchemy.bindparam("job_ids", expanding=True))
+
+# a sale counts toward the tick that was current when it was queued, which is the latest
+# one applied so far since ticks go through the outbox too
+INSERT_SALE_ANALYTICS_SQL = sqlalchemy.text(
+    """
+    INSERT INTO sale_analytics
+    (cart_id, customer_class, hour_of_day, day_of_week, total_gold, potion_count, created_at)
+    SELECT
+        s.cart_id,
+        s.customer_class,
+        cur_time.hour_of_day,
+        cur_time.day_of_week,
+        s.total_gold,
+        s.potion_count,
+        s.created_at
+    FROM jsonb_to_recordset(CAST(:sales AS jsonb)) AS s(
+        cart_id integer, customer_class text, total_gold integer, potion_count integer, created_at timestamp
+    )
+    CROSS JOIN (
+        SELECT day_of_week, hour_of_day
+        FROM time_analytics
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) cur_time
+    """
+)
+
+# posts one journal transaction: the given postings, their world: twins, and the matching
+# account_balances updates, in account order so concurrent posters lock rows alike
+POST_JOURNAL_SQL = sqlalchemy.text(
+    """
+    WITH journal_transaction AS (
+        INSERT INTO journal_transactions (order_id, transaction_type)
+        VALUES (:order_id, :transaction_type)
+        RETURNING transaction_id
+    ), entries AS (
+        SELECT account, delta
+        FROM jsonb_to_recordset(CAST(:postings AS jsonb)) AS p(account text, delta integer)
+    ), posting_insert AS (
+        INSERT INTO journal_postings (transaction_id, account, delta)
+        SELECT transaction_id, account, delta
+        FROM journal_transaction, entries
+    )
+    INSERT INTO account_balances (account, balance)
+    SELECT account, delta
+    FROM entries
+    ORDER BY account
+    ON CONFLICT (account) DO UPDATE SET balance = account_balances.balance + EXCLUDED.balance
+    """
+)
+
+# claims (endpoint, order_id) inside the delivery's transaction; returns no row when an
+# earlier request holds it (a concurrent claim waits for the holder to commit or roll back)
+CLAIM_IDEMPOTENCY_KEY_SQL = sqlalchemy.text(
+    """
+    INSERT INTO idempotency_keys (endpoint, order_id)
+    VALUES (:endpoint, :order_id)
+    ON CONFLICT (endpoint, order_id) DO NOTHING
+    RETURNING order_id
+    """
+)
+
+# update capacity and subtract gold
+CAPACITY_DELIVERY_SQL = sqlalchemy.text(
+    """
+    WITH capacity_insert AS (
+        INSERT INTO capacity_order_ledger
+        (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
+        VALUES (:order_id, :potion_capacity_increase, :ml_capacity_increase, :gold_delta)
+    )
+    INSERT INTO gold_ledger
+    (order_id, gold_delta, transaction_type)
+    VALUES (:order_id, :gold_delta, 'INVENTORY_UPGRADE')
+    """
+)
+
+# get metrics from ledger tables for the previous tick until now(last 3 hours); visitors are
+# the carts opened today, live or archived, counted on their own rather than joined to every sale
+TICK_SALES_SQL = sqlalchemy.text(
+    """
+    SELECT
+        COUNT(DISTINCT gl.order_id) as total_sales,
+        COALESCE(SUM(gl.gold_delta), 0) as total_gold,
+        CASE WHEN COUNT(*) = 0 THEN 0 ELSE (
+            (SELECT COUNT(*) FROM carts WHERE created_at >= CURRENT_DATE)
+            + (SELECT COUNT(DISTINCT cart_id) FROM cart_archive WHERE created_at >= CURRENT_DATE)
+        ) END as visitor_count
+    FROM gold_ledger gl
+    WHERE DATE(gl.created_at) = CURRENT_DATE
+        AND gl.created_at >= NOW() - INTERVAL '3 hours'
+        AND gl.transaction_type = 'POTION_SALE'
+    """
+)
+
+# upsert time analytics for previous tick
+UPSERT_TIME_ANALYTICS_SQL = sqlalchemy.text(
+    """
+    INSERT INTO time_analytics (
+        day_of_week,
+        hour_of_day,
+        total_sales,
+        total_gold,
+        visitor_count
+    ) VALUES (:day, :hour_of_day, :total_sales, :total_gold, :visitor_count)
+    ON CONFLICT (day_of_week, hour_of_day) DO UPDATE SET
+        total_sales = :total_sales,
+        total_gold = :total_gold,
+        visitor_count = :visitor_count,
+        created_at = CURRENT_TIMESTAMP
+    """
+)
+
+# what admin.reset clears; one TRUNCATE is constant time and leaves no dead rows behind
+RESET_TABLES = (
+    "gold_ledger",
+    "potion_ledger",
+    "liquid_ledger",
+    "carts",
+    "cart_items",
+    "capacity_order_ledger",
+    "idempotency_keys",
+    "analytics_outbox",
+    "journal_postings",
+    "journal_transactions",
+    "account_balances",
+    "balance_checkpoints",
+    "ledger_verifier_state",
+    "stock_reservations",
+    "cart_archive",
+)
+RESET_SQL = sqlalchemy.text(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY")
+RESET_SEED_SQL = [
+    sqlalchemy.text(
+        """
+        INSERT INTO gold_ledger (order_id, gold_delta, transaction_type)
+        VALUES (-1, 100, 'GAME_RESET')
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO capacity_order_ledger
+        (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
+        VALUES (-1, 50, 10000, 0)
+        """
+    ),
+]
+
+# the full game state captured by a snapshot, referenced tables first
+SNAPSHOT_TABLES = (
+    "potions",
+    "gold_ledger",
+    "potion_ledger",
+    "liquid_ledger",
+    "capacity_order_ledger",
+    "journal_transactions",
+    "journal_postings",
+    "account_balances",
+    "balance_checkpoints",
+    "ledger_verifier_state",
+    "idempotency_keys",
+    "carts",
+    "cart_items",
+    "stock_reservations",
+    "cart_archive",
+    "analytics_outbox",
+    "sale_analytics",
+    "potion_analytics",
+    "time_analytics",
+    "potion_prices",
+)
+
+# one statement, so every table is read from the same MVCC snapshot
+CAPTURE_SNAPSHOT_SQL = sqlalchemy.text(
+    "INSERT INTO game_snapshot_tables (snapshot_name, table_name, rows)\n"
+    + "\nUNION ALL\n".join(
+        f"SELECT :name, '{table}', COALESCE((SELECT jsonb_agg(t) FROM {table} t), '[]'::jsonb)"
+        for table in SNAPSHOT_TABLES
+    )
+)
+
+# snapshots taken before the journal existed only hold the ledgers
+SNAPSHOT_HAS_JOURNAL_SQL = sqlalchemy.text(
+    "SELECT 1 FROM game_snapshot_tables WHERE snapshot_name = :name AND table_name = 'account_balances'"
+)
+
+# snapshots taken before idempotency_keys existed get the keys its migration backfilled,
+# so deliveries already in the restored ledgers stay deduplicated; portable for SQLite
+SNAPSHOT_HAS_IDEMPOTENCY_KEYS_SQL = sqlalchemy.text(
+    "SELECT 1 FROM game_snapshot_tables WHERE snapshot_name = :name AND table_name = 'idempotency_keys'"
+)
+BACKFILL_IDEMPOTENCY_KEYS_SQL = sqlalchemy.text(
+    """
+    INSERT INTO idempotency_keys (endpoint, order_id)
+    SELECT :barrels, order_id FROM liquid_ledger WHERE transaction_type = 'BARREL_DELIVERY'
+    UNION
+    SELECT :barrels, order_id FROM gold_ledger WHERE transaction_type = 'BARREL_PURCHASE'
+    UNION
+    SELECT :bottler, order_id FROM potion_ledger WHERE transaction_type = 'POTION_DELIVERY'
+    UNION
+    SELECT :bottler, order_id FROM liquid_ledger WHERE transaction_type = 'POTION_DELIVERY'
+    UNION
+    SELECT :inventory, order_id FROM capacity_order_ledger
+    """
+).bindparams(
+    barrels=BARREL_DELIVERY, bottler=POTION_DELIVERY, inventory=CAPACITY_DELIVERY
+)
+
+# columns added after snapshots could be taken, with the defaults older rows restore with
+SNAPSHOT_COLUMN_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "carts": {"age_ticks": 0},
+}
+
+SEQUENCE_COLUMNS_SQL = sqlalchemy.text(
+    """
+    SELECT table_name, column_name
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+        AND table_name = ANY(:tables)
+        AND (column_default LIKE 'nextval(%' OR is_identity = 'YES')
+    """
+)
+
+SEARCH_SORT_COLUMNS = {
+    "customer_name": "ci.customer_name",
+    "item_sku": "p.name",
+    "line_item_total": "g.gold_delta",
+    "timestamp": "g.created_at",
+}
+
+
+def journal_transactions_from_rows(rows) -> List[JournalTransaction]:
+    # rows come a posting at a time, grouped by transaction; one with no postings has a NULL account
+    transactions: Dict[int, JournalTransaction] = {}
+    for row in rows:
+        transaction = transactions.get(row.transaction_id)
+        if transaction is None:
+            transaction = transactions[row.transaction_id] = JournalTransaction(
+                row.transaction_id, row.order_id, row.transaction_type, {}
+            )
+        if row.account is not None:
+            transaction.postings[row.account] = row.delta
+    return list(transactions.values())
+
+
+def balances_from_row(row) -> Balances:
+    return Balances(
+        gold=row.gold,
+        red_ml=row.red_ml,
+        green_ml=row.green_ml,
+        blue_ml=row.blue_ml,
+        dark_ml=row.dark_ml,
+        number_of_potions=row.number_of_potions,
+        max_potion_capacity=row.max_potion_capacity,
+        max_barrel_capacity=row.max_barrel_capacity,
+    )
+
+
+def potion_stock_from_row(row) -> PotionStock:
+    return PotionStock(
+        sku=row.sku,
+        name=row.name,
+        price=row.price,
+        red_ml=row.red_ml,
+        green_ml=row.green_ml,
+        blue_ml=row.blue_ml,
+        dark_ml=row.dark_ml,
+        is_active=row.is_active,
+        quantity=row.quantity,
+        reserved=row.reserved,
+    )
+
+
+def build_search_query(
+    customer_name: str,
+    potion_sku: str,
+    sort_col: str,
+    sort_order: str,
+    offset: int,
+    limit: Optional[int],
+) -> Tuple[str, dict]:
+    query = """
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY {sort_col} {sort_order}) as line_item_id,
+            g.gold_delta as line_item_total,
+            ci.quantity as quantity,
+            g.created_at as timestamp,
+            p.name as item_sku,
+            ci.customer_name as customer_name,
+            COUNT(*) OVER() as total_count
+        FROM gold_ledger g
+        JOIN (
+            SELECT c.cart_id, c.customer_name, i.sku, i.quantity
+            FROM carts c
+            JOIN cart_items i ON i.cart_id = c.cart_id
+            UNION ALL
+            SELECT cart_id, customer_name, sku, quantity
+            FROM cart_archive
+        ) ci ON ci.cart_id = g.order_id
+        JOIN potions p ON p.sku = ci.sku
+        WHERE g.transaction_type = 'POTION_SALE'
+    """.format(
+        sort_col=SEARCH_SORT_COLUMNS[sort_col],
+        sort_order="asc" if sort_order == "asc" else "desc",
+    )
+
+    params = {}
+    if customer_name:
+        query += " AND ci.customer_name = :customer_name"
+        params["customer_name"] = customer_name
+
+    if potion_sku:
+        query += " AND p.name = :potion_sku"
+        params["potion_sku"] = potion_sku
+
+    if limit is not None:
+        query += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+
+    return query, params
+
+
+def sale_line_from_row(row) -> SaleLine:
+    return SaleLine(
+        line_item_id=row.line_item_id,
+        quantity=row.quantity,
+        item_sku=row.item_sku,
+        customer_name=row.customer_name,
+        line_item_total=row.line_item_total,
+        timestamp=row.timestamp,
+        total_count=row.total_count,
+    )
+
+
+def price_cart_items(cart_items, prices: Dict[str, int]) -> Tuple[int, int]:
+    """
+    Totals cart line items at prices, falling back to each potion's list price.
+    Returns (total_potions, total_gold).
+    """
+    total_potions_bought = sum(item.quantity for item in cart_items)
+    total_gold = sum(
+        item.quantity * prices.get(item.sku, item.price)
+        for item in cart_items
+        if item.sku is not None
+    )
+    return total_potions_bought, total_gold
+
+
+def time_analytics_params(day: str, hour: int, sales_data) -> dict:
+    return {
+        "day": day,
+        "hour_of_day": hour,
+        "total_sales": sales_data.total_sales,
+        "total_gold": float(sales_data.total_gold or 0),
+        "visitor_count": sales_data.visitor_count,
+    }
+
+
+# rebuilds the journal and balances from the four ledgers, for ledgers written without
+# posting (seeded benchmarks, databases and snapshots from before the journal existed);
+# portable so SQLite runs the same statements
+REBUILD_JOURNAL_SQL = [
+    sqlalchemy.text("DELETE FROM ledger_verifier_state"),
+    sqlalchemy.text("DELETE FROM balance_checkpoints"),
+    sqlalchemy.text("DELETE FROM journal_postings"),
+    sqlalchemy.text("DELETE FROM journal_transactions"),
+    sqlalchemy.text("DELETE FROM account_balances"),
+    sqlalchemy.text(
+        """
+        CREATE TEMPORARY TABLE journal_backfill AS
+        SELECT order_id,
+            CASE transaction_type WHEN 'BARREL_PURCHASE' THEN 'BARREL_DELIVERY' ELSE transaction_type END AS event,
+            'gold' AS account, gold_delta AS delta, created_at
+        FROM gold_ledger
+        UNION ALL
+        SELECT order_id, CASE transaction_type WHEN 'POTION_CREATION' THEN 'POTION_DELIVERY' ELSE transaction_type END,
+            'sku:' || sku, quantity_delta, created_at
+        FROM potion_ledger
+        """
+        + "".join(
+            f"""
+        UNION ALL
+        SELECT order_id, CASE transaction_type WHEN 'POTION_CREATION' THEN 'POTION_DELIVERY' ELSE transaction_type END,
+            '{account}', {color}_delta, created_at
+        FROM liquid_ledger
+        """
+            for color, account in ML_ACCOUNTS.items()
+        )
+        + """
+        UNION ALL
+        SELECT order_id, CASE WHEN order_id = -1 THEN 'GAME_RESET' ELSE 'INVENTORY_UPGRADE' END,
+            'capacity:potions', potion_capacity_increase, created_at
+        FROM capacity_order_ledger
+        UNION ALL
+        SELECT order_id, CASE WHEN order_id = -1 THEN 'GAME_RESET' ELSE 'INVENTORY_UPGRADE' END,
+            'capacity:ml', ml_capacity_increase, created_at
+        FROM capacity_order_ledger
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO journal_transactions (order_id, transaction_type, created_at)
+        SELECT order_id, event, MIN(created_at)
+        FROM journal_backfill
+        GROUP BY order_id, event
+        ORDER BY MIN(created_at), order_id
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO journal_postings (transaction_id, account, delta)
+        SELECT jt.transaction_id, b.account, b.delta
+        FROM (
+            SELECT order_id, event, account, SUM(delta) AS delta
+            FROM journal_backfill
+            GROUP BY order_id, event, account
+            HAVING SUM(delta) <> 0
+        ) b
+        JOIN journal_transactions jt ON jt.order_id = b.order_id AND jt.transaction_type = b.event
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO journal_postings (transaction_id, account, delta)
+        SELECT transaction_id, 'world:' || account, -delta
+        FROM journal_postings
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO account_balances (account, balance)
+        SELECT account, SUM(delta)
+        FROM journal_postings
+        GROUP BY account
+        """
+    ),
+    sqlalchemy.text("DROP TABLE journal_backfill"),
+]
+
+
+def checkpoint_balances_sql(settled_before: str) -> sqlalchemy.TextClause:
+    """
+    Adds the postings since the last checkpoint to it and stores the result as
+    a new checkpoint, up to the last transaction created before settled_before.
+    Transactions younger than that may still be in flight with a lower id than
+    one that has already committed, so they wait for the next checkpoint.
+    """
+    return sqlalchemy.text(
+        f"""
+        WITH previous AS (
+            SELECT COALESCE(MAX(transaction_id), 0) AS id
+            FROM balance_checkpoints
+        ), target AS (
+            SELECT MAX(transaction_id) AS id
+            FROM journal_transactions
+            WHERE transaction_id > (SELECT id FROM previous)
+                AND created_at <= {settled_before}
+        )
+        INSERT INTO balance_checkpoints (transaction_id, account, balance)
+        SELECT (SELECT id FROM target), account, SUM(delta)
+        FROM (
+            SELECT account, balance AS delta
+            FROM balance_checkpoints
+            WHERE transaction_id = (SELECT id FROM previous)
+            UNION ALL
+            SELECT account, delta
+            FROM journal_postings
+            WHERE transaction_id > (SELECT id FROM previous)
+                AND transaction_id <= (SELECT id FROM target)
+        ) deltas
+        WHERE (SELECT id FROM target) IS NOT NULL
+        GROUP BY account
+        """
+    )
+
+
+def journal_since_sql(settled_before: str) -> sqlalchemy.TextClause:
+    """
+    The next page of journal transactions with their postings, a row per
+    posting. The page ends before the first transaction created after
+    settled_before, for the same reason checkpoints do.
+    """
+    return sqlalchemy.text(
+        f"""
+        WITH horizon AS (
+            SELECT MIN(transaction_id) AS id
+            FROM journal_transactions
+            WHERE transaction_id > :after_id
+                AND created_at > {settled_before}
+        ), page AS (
+            SELECT transaction_id, order_id, transaction_type
+            FROM journal_transactions
+            WHERE transaction_id > :after_id
+                AND (transaction_id < (SELECT id FROM horizon) OR (SELECT id FROM horizon) IS NULL)
+            ORDER BY transaction_id
+            LIMIT :limit
+        )
+        SELECT page.transaction_id, page.order_id, page.transaction_type, p.account, p.delta
+        FROM page
+        LEFT JOIN journal_postings p ON p.transaction_id = page.transaction_id
+        ORDER BY page.transaction_id, p.account
+        """
+    )
+
+
+# transactions younger than this may still be in flight behind a higher id that committed
+SETTLED_BEFORE = "NOW() - INTERVAL '1 minute'"
+CHECKPOINT_BALANCES_SQL = checkpoint_balances_sql(SETTLED_BEFORE)
+JOURNAL_SINCE_SQL = journal_since_sql(SETTLED_BEFORE)
+
+# one statement, so account_balances and the postings agree on what has committed
+BALANCES_SINCE_SQL = sqlalchemy.text(
+    """
+    SELECT account, SUM(balance) AS balance, SUM(delta) AS delta
+    FROM (
+        SELECT account, balance, 0 AS delta
+        FROM account_balances
+        UNION ALL
+        SELECT account, 0, delta
+        FROM journal_postings
+        WHERE transaction_id > :after_id
+    ) b
+    GROUP BY account
+    """
+)
+
+LOAD_VERIFIER_STATE_SQL = sqlalchemy.text(
+    "SELECT transaction_id, digest, balances FROM ledger_verifier_state WHERE id = 1"
+)
+
+# compare-and-set on the watermark, so two runs racing from the same one can't both save,
+# and a run that straddles a reset can't bring back a watermark past the new journal
+SAVE_VERIFIER_STATE_SQL = sqlalchemy.text(
+    """
+    UPDATE ledger_verifier_state SET
+        transaction_id = :transaction_id,
+        digest = :digest,
+        balances = :balances,
+        verified_at = CURRENT_TIMESTAMP
+    WHERE id = 1 AND transaction_id = :previous_id
+    RETURNING id
+    """
+)
+INSERT_VERIFIER_STATE_SQL = sqlalchemy.text(
+    """
+    INSERT INTO ledger_verifier_state (id, transaction_id, digest, balances)
+    VALUES (1, :transaction_id, :digest, :balances)
+    ON CONFLICT (id) DO NOTHING
+    RETURNING id
+    """
+)
+
+
+def journal_params(
+    order_id: int, transaction_type: str, postings: Dict[str, int]
+) -> dict:
+    return {
+        "order_id": order_id,
+        "transaction_type": transaction_type,
+        "postings": json.dumps(journal_entries(postings)),
+    }
+
+
+def sale_postings(cart_items, total_gold: int) -> Dict[str, int]:
+    postings = {GOLD_ACCOUNT: total_gold}
+    for item in cart_items:
+        if item.sku is not None:
+            account = sku_account(item.sku)
+            postings[account] = postings.get(account, 0) - item.quantity
+    return postings
+
+
+def analytics_job(kind: str, **payload) -> dict:
+    return {"kind": kind, "payload": json.dumps(payload)}
+
+
+def idempotent(endpoint: str):
+    """
+    Runs a delivery in one transaction with the claim of its (endpoint, order_id)
+    key. The wrapped method gets the open connection after self. The wrapper
+    returns True once it has run, or False for a replayed order_id, without
+    reading or writing any ledger. Deliveries answer 204 with no body, so the
+    claimed key is all the stored response a replay needs.
+    """
+
+    def decorator(write):
+        @functools.wraps(write)
+        def wrapper(self, order_id: int, *args, **kwargs) -> bool:
+            def claim_and_write(connection) -> bool:
+                claimed = connection.execute(
+                    CLAIM_IDEMPOTENCY_KEY_SQL,
+                    {"endpoint": endpoint, "order_id": order_id},
+                ).first()
+                if claimed is None:
+                    return False
+                write(self, connection, order_id, *args, **kwargs)
+                return True
+
+            return self._transact(claim_and_write)
+
+        return wrapper
+
+    return decorator
+
+
+class PostgresStorage(Storage):
+    """
+    The production backend: append-only ledgers in Postgres, aggregated on read.
+    """
+
+    def __init__(
+        self,
+        engine,
+        read_engine: Optional[Callable[[bool], Any]] = None,
+        ledger_writer=None,
+    ):
+        self.engine = engine
+        # read_engine(fresh) routes read-only queries, e.g. to a replica (see database.read_engine)
+        self.read_engine = read_engine or (lambda fresh: engine)
+        # optional LedgerWriter that group-commits carts, checkouts and deliveries
+        self.ledger_writer = ledger_writer
+
+    def _transact(self, unit: Callable[[Any], Any]) -> Any:
+        """
+        Runs unit(connection) in a transaction and returns its result once committed.
+        """
+        if self.ledger_writer is not None:
+            return self.ledger_writer.submit(unit).result()
+        with self.engine.begin() as connection:
+            return unit(connection)
+
+    def _post(
+        self, connection, order_id: int, transaction_type: str, postings: Dict[str, int]
+    ):
+        """
+        Journals a business event and updates account_balances in the caller's transaction.
+        """
+        connection.execute(
+            POST_JOURNAL_SQL, journal_params(order_id, transaction_type, postings)
+        )
+
+    def rebuild_journal(self) -> None:
+        """
+        Re-derives the journal and account_balances from the ledgers.
+        """
+        with self.engine.begin() as connection:
+            for statement in REBUILD_JOURNAL_SQL:
+                connection.execute(statement)
+
+    def reset(self) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(RESET_SQL)
+            for statement in RESET_SEED_SQL:
+                connection.execute(statement)
+            self._post(connection, -1, "GAME_RESET", RESET_POSTINGS)
+
+    def add_potion(
+        self,
+        sku: str,
+        name: str,
+        price: int,
+        potion_type: List[int],
+        is_active: bool = True,
+    ) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potions (sku, name, price, red_ml, green_ml, blue_ml, dark_ml, is_active)
+                    VALUES (:sku, :name, :price, :red_ml, :green_ml, :blue_ml, :dark_ml, :is_active)
+                    ON CONFLICT (sku) DO UPDATE SET
+                        name = :name, price = :price, is_active = :is_active
+                    """
+                ),
+                {
+                    "sku": sku,
+                    "name": name,
+                    "price": price,
+                    "is_active": is_active,
+                    "red_ml": potion_type[0],
+                    "green_ml": potion_type[1],
+                    "blue_ml": potion_type[2],
+                    "dark_ml": potion_type[3],
+                },
+            )
+
+    def get_balances(self) -> Balances:
+        # plans and the audit must see the delivery that was just posted
+        with self.read_engine(True).begin() as connection:
+            return balances_from_row(connection.execute(BALANCES_SQL).one())
+
+    def get_balances_as_of(self, as_of: datetime) -> Optional[Balances]:
+        with self.read_engine(False).begin() as connection:
+            row = connection.execute(
+                BALANCES_AS_OF_SQL, {"as_of": self._as_of_param(as_of)}
+            ).one()
+        return balances_from_row(row) if row.transaction_id is not None else None
+
+    def _as_of_param(self, as_of: datetime) -> Any:
+        # created_at columns hold naive UTC
+        if as_of.tzinfo is not None:
+            as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+        return as_of
+
+    def get_potion_stock(self, active_only: bool = True) -> List[PotionStock]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                POTION_STOCK_SQL, {"active_only": active_only}
+            ).all()
+        return [potion_stock_from_row(row) for row in rows]
+
+    @idempotent(BARREL_DELIVERY)
+    def record_barrel_delivery(
+        self,
+        connection,
+        order_id: int,
+        gold_paid: int,
+        red_ml: int,
+        green_ml: int,
+        blue_ml: int,
+        dark_ml: int,
+    ) -> None:
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO liquid_ledger
+                (order_id, red_ml_delta, green_ml_delta, blue_ml_delta, dark_ml_delta, transaction_type)
+                VALUES (:order_id, :red_ml_delta, :green_ml_delta, :blue_ml_delta, :dark_ml_delta, 'BARREL_DELIVERY')
+                """
+            ),
+            {
+                "order_id": order_id,
+                "red_ml_delta": red_ml,
+                "green_ml_delta": green_ml,
+                "blue_ml_delta": blue_ml,
+                "dark_ml_delta": dark_ml,
+            },
+        )
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO gold_ledger
+                (order_id, gold_delta, transaction_type)
+                VALUES (:order_id, :gold_delta, 'BARREL_PURCHASE')
+                """
+            ),
+            # negative because we're paying
+            {"order_id": order_id, "gold_delta": -gold_paid},
+        )
+        self._post(
+            connection,
+            order_id,
+            "BARREL_DELIVERY",
+            {
+                GOLD_ACCOUNT: -gold_paid,
+                ML_ACCOUNTS["red_ml"]: round(red_ml),
+                ML_ACCOUNTS["green_ml"]: round(green_ml),
+                ML_ACCOUNTS["blue_ml"]: round(blue_ml),
+                ML_ACCOUNTS["dark_ml"]: round(dark_ml),
+            },
+        )
+
+    @idempotent(POTION_DELIVERY)
+    def record_potion_delivery(
+        self,
+        connection,
+        order_id: int,
+        potions: List[Tuple[List[int], int]],
+        ml_used: Dict[str, int],
+    ) -> None:
+        postings = {
+            ML_ACCOUNTS[color]: round(delta) for color, delta in ml_used.items()
+        }
+        for line_item_id, (potion_type, quantity) in enumerate(potions, start=1):
+            # grab corresponding potion sku
+            sku = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT sku
+                    FROM potions
+                    WHERE red_ml = :red_ml
+                    AND green_ml = :green_ml
+                    AND blue_ml = :blue_ml
+                    AND dark_ml = :dark_ml
+                    """
+                ),
+                {
+                    "red_ml": potion_type[0],
+                    "green_ml": potion_type[1],
+                    "blue_ml": potion_type[2],
+                    "dark_ml": potion_type[3],
+                },
+            ).scalar_one()
+
+            connection.execute(
+                sqlalchemy.text(
+                    """
+                    INSERT INTO potion_ledger
+                    (order_id, line_item_id, sku, quantity_delta, transaction_type)
+                    VALUES (:order_id, :line_item_id, :sku, :quantity_delta, 'POTION_DELIVERY')
+                    """
+                ),
+                {
+                    "order_id": order_id,
+                    "line_item_id": line_item_id,
+                    "sku": sku,
+                    "quantity_delta": quantity,
+                },
+            )
+            postings[sku_account(sku)] = postings.get(sku_account(sku), 0) + quantity
+
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO liquid_ledger
+                (order_id, red_ml_delta, green_ml_delta, blue_ml_delta, dark_ml_delta, transaction_type)
+                VALUES (:order_id, :red_ml_delta, :green_ml_delta, :blue_ml_delta, :dark_ml_delta, 'POTION_DELIVERY')
+                """
+            ),
+            {
+                "order_id": order_id,
+                "red_ml_delta": ml_used["red_ml"],
+                "green_ml_delta": ml_used["green_ml"],
+                "blue_ml_delta": ml_used["blue_ml"],
+                "dark_ml_delta": ml_used["dark_ml"],
+            },
+        )
+        self._post(connection, order_id, "POTION_DELIVERY", postings)
+
+    @idempotent(CAPACITY_DELIVERY)
+    def record_capacity_delivery(
+        self,
+        connection,
+        order_id: int,
+        potion_capacity_increase: int,
+        ml_capacity_increase: int,
+        gold_delta: int,
+    ) -> None:
+        connection.execute(
+            CAPACITY_DELIVERY_SQL,
+            {
+                "order_id": order_id,
+                "potion_capacity_increase": potion_capacity_increase,
+                "ml_capacity_increase": ml_capacity_increase,
+                "gold_delta": gold_delta,
+            },
+        )
+        self._post(
+            connection,
+            order_id,
+            "INVENTORY_UPGRADE",
+            capacity_postings(
+                potion_capacity_increase, ml_capacity_increase, gold_delta
+            ),
+        )
+
+    def create_cart(self, customer_name: str, character_class: str) -> int:
+        return self._transact(
+            lambda connection: connection.execute(
+                CREATE_CART_SQL,
+                {"customer_name": customer_name, "character_class": character_class},
+            ).scalar_one()
+        )
+
+    def set_cart_item(self, cart_id: int, sku: str, quantity: int, ttl: int) -> str:
+        # the cart and stock row locks order everything this touches, so read committed is enough
+        params = {"cart_id": cart_id, "sku": sku, "quantity": quantity, "ttl": ttl}
+        with self.engine.begin() as connection:
+            cart = connection.execute(LOCK_CART_FOR_ITEM_SQL, params).first()
+
+            if cart is None or cart.is_checked_out:
+                return ITEM_MISSING
+
+            connection.execute(LOCK_SKU_STOCK_SQL, params)
+            if connection.execute(RESERVE_STOCK_SQL, params).first() is None:
+                return ITEM_INSUFFICIENT
+
+            connection.execute(UPSERT_CART_ITEM_SQL, params)
+        return ITEM_RESERVED
+
+    def sweep_reservations(self) -> int:
+        with self.engine.begin() as connection:
+            return connection.execute(SWEEP_RESERVATIONS_SQL).rowcount
+
+    def reap_carts(self, max_age_ticks: int, limit: int) -> int:
+        with self.engine.begin() as connection:
+            return connection.execute(
+                REAP_CARTS_SQL, {"max_age_ticks": max_age_ticks, "limit": limit}
+            ).rowcount
+
+    def archive_carts(self, limit: int) -> int:
+        with self.engine.begin() as connection:
+            return connection.execute(ARCHIVE_CARTS_SQL, {"limit": limit}).scalar_one()
+
+    def checkout(self, cart_id: int, prices: Dict[str, int]) -> CheckoutOutcome:
+        return self._transact(
+            lambda connection: self._checkout(connection, cart_id, prices)
+        )
+
+    def _checkout(
+        self, connection, cart_id: int, prices: Dict[str, int]
+    ) -> CheckoutOutcome:
+        cart = connection.execute(LOCK_CART_SQL, {"cart_id": cart_id}).first()
+        if cart is None:
+            return CheckoutOutcome(CHECKOUT_MISSING)
+
+        cart_items = connection.execute(CART_ITEMS_SQL, {"cart_id": cart_id}).all()
+        total_potions_bought, total_gold = price_cart_items(cart_items, prices)
+
+        if total_potions_bought == 0:
+            return CheckoutOutcome(CHECKOUT_EMPTY)
+
+        if cart_items[0].is_checked_out:
+            return CheckoutOutcome(
+                CHECKOUT_ALREADY_DONE, total_potions_bought, total_gold
+            )
+
+        insufficient_inventory = connection.execute(
+            INSUFFICIENT_INVENTORY_SQL, {"cart_id": cart_id}
+        ).all()
+
+        if insufficient_inventory:
+            return CheckoutOutcome(CHECKOUT_INSUFFICIENT)
+
+        connection.execute(
+            CHECKOUT_SQL,
+            {
+                "cart_id": cart_id,
+                "gold_delta": total_gold,
+                "character_class": cart.character_class,
+                "potion_count": total_potions_bought,
+            },
+        )
+        self._post(
+            connection, cart_id, "POTION_SALE", sale_postings(cart_items, total_gold)
+        )
+        return CheckoutOutcome(CHECKOUT_OK, total_potions_bought, total_gold)
+
+    def search_orders(
+        self,
+        customer_name: str,
+        potion_sku: str,
+        sort_col: str,
+        sort_order: str,
+        offset: int,
+        limit: Optional[int],
+    ) -> List[SaleLine]:
+        query, params = build_search_query(
+            customer_name, potion_sku, sort_col, sort_order, offset, limit
+        )
+        with self.read_engine(False).begin() as connection:
+            rows = connection.execute(sqlalchemy.text(query), params).all()
+        return [sale_line_from_row(row) for row in rows]
+
+    def record_tick(self, day: str, hour: int) -> None:
+        with self.engine.begin() as connection:
+            self._roll_up_tick(connection, day, hour)
+
+    def _roll_up_tick(self, connection, day: str, hour: int):
+        sales_data = connection.execute(TICK_SALES_SQL).first()
+        connection.execute(
+            UPSERT_TIME_ANALYTICS_SQL, time_analytics_params(day, hour, sales_data)
+        )
+        connection.execute(AGE_OPEN_CARTS_SQL)
+
+    def _checkpoint_balances(self, connection):
+        connection.execute(CHECKPOINT_BALANCES_SQL)
+
+    def queue_tick(self, day: str, hour: int) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(
+                ENQUEUE_ANALYTICS_SQL, analytics_job(TICK_JOB, day=day, hour=hour)
+            )
+
+    def apply_analytics(self, limit: int) -> AnalyticsBatch:
+        with self.engine.begin() as connection:
+            if not connection.execute(
+                LOCK_ANALYTICS_SQL, {"lock_id": ANALYTICS_LOCK_ID}
+            ).scalar_one():
+                return AnalyticsBatch()
+            jobs = connection.execute(PENDING_ANALYTICS_SQL, {"limit": limit}).all()
+            return self._apply_jobs(
+                connection,
+                [(job.job_id, job.kind, job.payload, job.created_at) for job in jobs],
+            )
+
+    def _apply_jobs(
+        self, connection, jobs: List[Tuple[int, str, dict, Any]]
+    ) -> AnalyticsBatch:
+        """
+        jobs are (job_id, kind, payload, created_at) in job_id order. Sales up to
+        the first tick go in as one insert, then the tick is rolled up.
+        """
+        batch = AnalyticsBatch()
+        job_ids, sales = [], []
+        for job_id, kind, payload, created_at in jobs:
+            job_ids.append(job_id)
+            if kind == SALE_JOB:
+                sales.append({**payload, "created_at": created_at})
+            elif kind == TICK_JOB:
+                batch.tick = (payload["day"], payload["hour"])
+                break
+        if sales:
+            self._insert_sales(connection, sales)
+        if batch.tick is not None:
+            self._roll_up_tick(connection, *batch.tick)
+            self._checkpoint_balances(connection)
+        if job_ids:
+            connection.execute(DELETE_ANALYTICS_SQL, {"job_ids": job_ids})
+        batch.applied = len(job_ids)
+        return batch
+
+    def _insert_sales(self, connection, sales: List[dict]):
+        connection.execute(
+            INSERT_SALE_ANALYTICS_SQL, {"sales": json.dumps(sales, default=str)}
+        )
+
+    def get_pricing_inputs(self, day: str, hour: int) -> PricingInputs:
+        # reads the time_analytics row record_tick has just written
+        with self.read_engine(True).begin() as connection:
+            features = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT
+                        p.sku,
+                        p.price AS base_price,
+                        COALESCE(SUM(pl.quantity_delta), 0) AS stock,
+                        COALESCE(SUM(-pl.quantity_delta) FILTER (
+                            WHERE pl.transaction_type = 'POTION_SALE'
+                            AND pl.created_at >= NOW() - INTERVAL '24 hours'
+                        ), 0) AS sold_recent
+                    FROM potions p
+                    LEFT JOIN potion_ledger pl ON pl.sku = p.sku
+                    WHERE p.is_active = TRUE
+                    GROUP BY p.sku, p.price
+                    ORDER BY p.sku
+                    """
+                )
+            ).all()
+
+            # forecast: how busy this slot was last week relative to an average slot
+            forecast = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT
+                        COALESCE(AVG(total_sales) FILTER (
+                            WHERE day_of_week = :day AND hour_of_day = :hour
+                        ), 0) AS expected_sales,
+                        COALESCE(AVG(total_sales), 0) AS average_sales
+                    FROM time_analytics
+                    """
+                ),
+                {"day": day, "hour": hour},
+            ).one()
+
+        demand_factor = 1.0
+        if forecast.average_sales and forecast.expected_sales:
+            demand_factor = float(forecast.expected_sales) / float(
+                forecast.average_sales
+            )
+
+        return PricingInputs(
+            skus=[row.sku for row in features],
+            base_prices=[row.base_price for row in features],
+            stock=[row.stock for row in features],
+            sold_recent=[row.sold_recent for row in features],
+            demand_factor=demand_factor,
+        )
+
+    def save_prices(self, prices: Dict[str, int], versions_to_keep: int) -> int:
+        with self.engine.begin() as connection:
+            version = connection.execute(
+                sqlalchemy.text(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM potion_prices"
+                )
+            ).scalar_one()
+
+            if prices:
+                connection.execute(
+                    sqlalchemy.text(
+                        """
+                        INSERT INTO potion_prices (version, sku, price)
+                        VALUES (:version, :sku, :price)
+                        """
+                    ),
+                    [
+                        {"version": version, "sku": sku, "price": price}
+                        for sku, price in prices.items()
+                    ],
+                )
+
+            connection.execute(
+                sqlalchemy.text("DELETE FROM potion_prices WHERE version <= :oldest"),
+                {"oldest": version - versions_to_keep},
+            )
+        return version
+
+    def load_prices(self) -> Tuple[int, Dict[str, int]]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT version, sku, price
+                    FROM potion_prices
+                    WHERE version = (SELECT MAX(version) FROM potion_prices)
+                    """
+                )
+            ).all()
+        version = rows[0].version if rows else 0
+        return version, {row.sku: row.price for row in rows}
+
+    def create_snapshot(self, name: str) -> None:
+        with self.engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text("DELETE FROM game_snapshots WHERE name = :name"),
+                {"name": name},
+            )
+            connection.execute(
+                sqlalchemy.text("INSERT INTO game_snapshots (name) VALUES (:name)"),
+                {"name": name},
+            )
+            connection.execute(CAPTURE_SNAPSHOT_SQL, {"name": name})
+
+    def restore_snapshot(self, name: str) -> bool:
+        with self.engine.begin() as connection:
+            exists = connection.execute(
+                sqlalchemy.text(
+                    "SELECT 1 FROM game_snapshots WHERE name = :name FOR SHARE"
+                ),
+                {"name": name},
+            ).first()
+            if exists is None:
+                return False
+
+            connection.execute(
+                sqlalchemy.text(
+                    f"TRUNCATE {', '.join(SNAPSHOT_TABLES)} RESTART IDENTITY"
+                )
+            )
+            for table in SNAPSHOT_TABLES:
+                # each row is laid over its table's defaults, so keys an older snapshot lacks
+                # aren't restored as NULL
+                connection.execute(
+                    sqlalchemy.text(
+                        f"""
+                        INSERT INTO {table}
+                        SELECT * FROM jsonb_populate_recordset(
+                            NULL::{table},
+                            (SELECT jsonb_agg(CAST(:defaults AS jsonb) || saved.value)
+                             FROM game_snapshot_tables,
+                                 jsonb_array_elements(rows) AS saved(value)
+                             WHERE snapshot_name = :name AND table_name = '{table}')
+                        )
+                        """
+                    ),
+                    {
+                        "name": name,
+                        "defaults": json.dumps(SNAPSHOT_COLUMN_DEFAULTS.get(table, {})),
+                    },
+                )
+            if (
+                connection.execute(SNAPSHOT_HAS_JOURNAL_SQL, {"name": name}).first()
+                is None
+            ):
+                for statement in REBUILD_JOURNAL_SQL:
+                    connection.execute(statement)
+            if (
+                connection.execute(
+                    SNAPSHOT_HAS_IDEMPOTENCY_KEYS_SQL, {"name": name}
+                ).first()
+                is None
+            ):
+                connection.execute(BACKFILL_IDEMPOTENCY_KEYS_SQL)
+
+            # restored rows carry their own ids, so move each sequence past them
+            sequences = connection.execute(
+                SEQUENCE_COLUMNS_SQL, {"tables": list(SNAPSHOT_TABLES)}
+            ).all()
+            for table, column in sequences:
+                connection.execute(
+                    sqlalchemy.text(
+                        f"""
+                        SELECT setval(
+                            pg_get_serial_sequence(:table, :column),
+                            COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1,
+                            false
+                        )
+                        """
+                    ),
+                    {"table": table, "column": column},
+                )
+        return True
+
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                sqlalchemy.text(
+                    "SELECT name, created_at FROM game_snapshots ORDER BY created_at DESC"
+                )
+            ).all()
+        return [SnapshotInfo(name=row.name, created_at=row.created_at) for row in rows]
+
+    def delete_snapshot(self, name: str) -> bool:
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                sqlalchemy.text("DELETE FROM game_snapshots WHERE name = :name"),
+                {"name": name},
+            )
+        return result.rowcount > 0
+
+    def journal_since(self, after_id: int, limit: int) -> List[JournalTransaction]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                JOURNAL_SINCE_SQL, {"after_id": after_id, "limit": limit}
+            ).all()
+        return journal_transactions_from_rows(rows)
+
+    def balances_since(self, after_id: int) -> Tuple[Dict[str, int], Dict[str, int]]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(BALANCES_SINCE_SQL, {"after_id": after_id}).all()
+        return {row.account: row.balance for row in rows}, {
+            row.account: row.delta for row in rows
+        }
+
+    def load_verifier_state(self) -> VerifierState:
+        with self.engine.begin() as connection:
+            row = connection.execute(LOAD_VERIFIER_STATE_SQL).first()
+        if row is None:
+            return VerifierState()
+        return VerifierState(row.transaction_id, row.digest, json.loads(row.balances))
+
+    def save_verifier_state(self, state: VerifierState, previous_id: int) -> bool:
+        params = {
+            "transaction_id": state.transaction_id,
+            "digest": state.digest,
+            "balances": json.dumps(state.balances),
+            "previous_id": previous_id,
+        }
+        with self.engine.begin() as connection:
+            if connection.execute(SAVE_VERIFIER_STATE_SQL, params).first() is not None:
+                return True
+            # the first run starts from nothing stored
+            return (
+                previous_id == 0
+                and connection.execute(INSERT_VERIFIER_STATE_SQL, params).first()
+                is not None
+            )
@@ -0,0 +1,849 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import json
+import threading
+import sqlalchemy
+from src.storage.base import (
+    AnalyticsBatch,
+    CheckoutOutcome,
+    JournalTransaction,
+    PricingInputs,
+    SaleLine,
+    SnapshotInfo,
+    VerifierState,
+    CAPACITY_DELIVERY,
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    ITEM_INSUFFICIENT,
+    ITEM_MISSING,
+    ITEM_RESERVED,
+    RESET_POSTINGS,
+    TICK_JOB,
+    capacity_postings,
+    journal_entries,
+)
+from src.storage.postgres import (
+    BACKFILL_IDEMPOTENCY_KEYS_SQL,
+    CART_ITEMS_SQL,
+    CREATE_CART_SQL,
+    INSUFFICIENT_INVENTORY_SQL,
+    AGE_OPEN_CARTS_SQL,
+    PENDING_ANALYTICS_SQL,
+    REBUILD_JOURNAL_SQL,
+    RESET_SEED_SQL,
+    RESET_TABLES,
+    SNAPSHOT_COLUMN_DEFAULTS,
+    SNAPSHOT_TABLES,
+    SWEEP_RESERVATIONS_SQL,
+    UPSERT_CART_ITEM_SQL,
+    UPSERT_TIME_ANALYTICS_SQL,
+    PostgresStorage,
+    analytics_job,
+    idempotent,
+    build_search_query,
+    checkpoint_balances_sql,
+    journal_since_sql,
+    journal_transactions_from_rows,
+    price_cart_items,
+    reserve_stock_sql,
+    sale_postings,
+    time_analytics_params,
+)
+
+# mirrors the alembic schema closely enough for the queries in this package
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS potions (
+        id INTEGER PRIMARY KEY,
+        sku TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        price INTEGER NOT NULL DEFAULT 50,
+        red_ml INTEGER NOT NULL DEFAULT 0,
+        green_ml INTEGER NOT NULL DEFAULT 0,
+        blue_ml INTEGER NOT NULL DEFAULT 0,
+        dark_ml INTEGER NOT NULL DEFAULT 0,
+        is_active BOOLEAN NOT NULL DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS gold_ledger (
+        ledger_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        gold_delta INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS potion_ledger (
+        ledger_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        line_item_id INTEGER NOT NULL,
+        sku TEXT NOT NULL REFERENCES potions (sku),
+        quantity_delta INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (order_id, line_item_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS liquid_ledger (
+        ledger_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        red_ml_delta INTEGER NOT NULL DEFAULT 0,
+        green_ml_delta INTEGER NOT NULL DEFAULT 0,
+        blue_ml_delta INTEGER NOT NULL DEFAULT 0,
+        dark_ml_delta INTEGER NOT NULL DEFAULT 0,
+        transaction_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (order_id, transaction_type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS capacity_order_ledger (
+        ledger_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL UNIQUE,
+        potion_capacity_increase INTEGER NOT NULL DEFAULT 0,
+        ml_capacity_increase INTEGER NOT NULL DEFAULT 0,
+        gold_delta INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS carts (
+        cart_id INTEGER PRIMARY KEY,
+        customer_name TEXT,
+        character_class TEXT,
+        is_checked_out BOOLEAN NOT NULL DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        age_ticks INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_carts_created_at ON carts (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS cart_archive (
+        cart_id INTEGER NOT NULL,
+        sku TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        customer_name TEXT,
+        character_class TEXT,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (cart_id, sku)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_cart_archive_created_at ON cart_archive (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS cart_items (
+        cart_item_id INTEGER PRIMARY KEY,
+        cart_id INTEGER NOT NULL,
+        sku TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        UNIQUE (cart_id, sku)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sale_analytics (
+        transaction_id INTEGER PRIMARY KEY,
+        cart_id INTEGER,
+        customer_class TEXT,
+        hour_of_day INTEGER,
+        day_of_week TEXT,
+        total_gold INTEGER,
+        potion_count INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS time_analytics (
+        day_of_week TEXT NOT NULL,
+        hour_of_day INTEGER NOT NULL,
+        total_sales INTEGER NOT NULL DEFAULT 0,
+        total_gold REAL NOT NULL DEFAULT 0,
+        visitor_count INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (day_of_week, hour_of_day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS potion_prices (
+        version INTEGER NOT NULL,
+        sku TEXT NOT NULL REFERENCES potions (sku),
+        price INTEGER NOT NULL CHECK (price BETWEEN 1 AND 500),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (version, sku)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        endpoint TEXT NOT NULL,
+        order_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (endpoint, order_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS journal_transactions (
+        transaction_id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS journal_postings (
+        posting_id INTEGER PRIMARY KEY,
+        transaction_id INTEGER NOT NULL REFERENCES journal_transactions (transaction_id) ON DELETE CASCADE,
+        account TEXT NOT NULL,
+        delta INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_journal_postings_account ON journal_postings (account, transaction_id)",
+    "CREATE INDEX IF NOT EXISTS ix_journal_postings_transaction_id ON journal_postings (transaction_id)",
+    """
+    CREATE INDEX IF NOT EXISTS ix_journal_transactions_created_at
+    ON journal_transactions (created_at, transaction_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS balance_checkpoints (
+        transaction_id INTEGER NOT NULL,
+        account TEXT NOT NULL,
+        balance INTEGER NOT NULL,
+        PRIMARY KEY (transaction_id, account)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS account_balances (
+        account TEXT PRIMARY KEY,
+        balance INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ledger_verifier_state (
+        id INTEGER PRIMARY KEY,
+        transaction_id INTEGER NOT NULL,
+        digest TEXT NOT NULL,
+        balances TEXT NOT NULL,
+        verified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_reservations (
+        cart_id INTEGER NOT NULL REFERENCES carts (cart_id) ON DELETE CASCADE,
+        sku TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (cart_id, sku)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_stock_reservations_sku ON stock_reservations (sku, expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_reservations_expires_at ON stock_reservations (expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS analytics_outbox (
+        job_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS game_snapshots (
+        name TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS game_snapshot_tables (
+        snapshot_name TEXT NOT NULL REFERENCES game_snapshots (name) ON DELETE CASCADE,
+        table_name TEXT NOT NULL,
+        rows TEXT NOT NULL,
+        PRIMARY KEY (snapshot_name, table_name)
+    )
+    """,
+]
+
+# potion_analytics isn't mirrored here
+SQLITE_SNAPSHOT_TABLES = tuple(
+    table for table in SNAPSHOT_TABLES if table != "potion_analytics"
+)
+
+# SQLite has no data-modifying CTEs, so checkout runs as separate statements
+CHECKOUT_STATEMENTS = [
+    sqlalchemy.text(
+        """
+        INSERT INTO gold_ledger (order_id, gold_delta, transaction_type)
+        VALUES (:cart_id, :gold_delta, 'POTION_SALE')
+        """
+    ),
+    sqlalchemy.text("UPDATE carts SET is_checked_out = TRUE WHERE cart_id = :cart_id"),
+    sqlalchemy.text("DELETE FROM stock_reservations WHERE cart_id = :cart_id"),
+    sqlalchemy.text(
+        """
+        INSERT INTO potion_ledger (order_id, line_item_id, sku, quantity_delta, transaction_type)
+        SELECT :cart_id, ROW_NUMBER() OVER (), sku, -quantity, 'POTION_SALE'
+        FROM cart_items
+        WHERE cart_id = :cart_id
+        """
+    ),
+    sqlalchemy.text(
+        """
+        INSERT INTO analytics_outbox (kind, payload)
+        VALUES ('sale', json_object(
+            'cart_id', :cart_id,
+            'customer_class', :character_class,
+            'total_gold', :gold_delta,
+            'potion_count', :potion_count
+        ))
+        """
+    ),
+]
+
+ENQUEUE_ANALYTICS_SQL = sqlalchemy.text(
+    "INSERT INTO analytics_outbox (kind, payload) VALUES (:kind, :payload)"
+)
+
+# no jsonb_to_recordset or writable CTEs, so POST_JOURNAL_SQL runs as three statements
+INSERT_JOURNAL_TRANSACTION_SQL = sqlalchemy.text(
+    """
+    INSERT INTO journal_transactions (order_id, transaction_type)
+    VALUES (:order_id, :transaction_type)
+    RETURNING transaction_id
+    """
+)
+INSERT_JOURNAL_POSTING_SQL = sqlalchemy.text(
+    "INSERT INTO journal_postings (transaction_id, account, delta) VALUES (:transaction_id, :account, :delta)"
+)
+UPSERT_ACCOUNT_BALANCE_SQL = sqlalchemy.text(
+    """
+    INSERT INTO account_balances (account, balance)
+    VALUES (:account, :delta)
+    ON CONFLICT (account) DO UPDATE SET balance = account_balances.balance + excluded.balance
+    """
+)
+
+SETTLED_BEFORE = "DATETIME('now', '-1 minute')"
+CHECKPOINT_BALANCES_SQL = checkpoint_balances_sql(SETTLED_BEFORE)
+JOURNAL_SINCE_SQL = journal_since_sql(SETTLED_BEFORE)
+# no writable CTEs or DELETE ... USING, so the cart reaper deletes each table in turn; the
+# write lock keeps the selected carts the same from one statement to the next
+EXPIRED_CARTS = """
+    SELECT cart_id
+    FROM carts
+    WHERE NOT is_checked_out AND age_ticks >= :max_age_ticks
+    ORDER BY cart_id
+    LIMIT :limit
+"""
+REAP_CART_STATEMENTS = [
+    sqlalchemy.text(
+        f"DELETE FROM stock_reservations WHERE cart_id IN ({EXPIRED_CARTS})"
+    ),
+    sqlalchemy.text(f"DELETE FROM cart_items WHERE cart_id IN ({EXPIRED_CARTS})"),
+    sqlalchemy.text(f"DELETE FROM carts WHERE cart_id IN ({EXPIRED_CARTS})"),
+]
+SETTLED_CARTS = """
+    SELECT c.cart_id
+    FROM carts c
+    WHERE c.is_checked_out
+        AND EXISTS (SELECT 1 FROM sale_analytics s WHERE s.cart_id = c.cart_id)
+    ORDER BY c.cart_id
+    LIMIT :limit
+"""
+ARCHIVE_CART_STATEMENTS = [
+    sqlalchemy.text(
+        f"""
+        INSERT INTO cart_archive (cart_id, sku, quantity, customer_name, character_class, created_at)
+        SELECT c.cart_id, ci.sku, ci.quantity, c.customer_name, c.character_class, c.created_at
+        FROM carts c
+        JOIN cart_items ci ON ci.cart_id = c.cart_id
+        WHERE c.cart_id IN ({SETTLED_CARTS})
+        """
+    ),
+    sqlalchemy.text(f"DELETE FROM cart_items WHERE cart_id IN ({SETTLED_CARTS})"),
+    sqlalchemy.text(f"DELETE FROM carts WHERE cart_id IN ({SETTLED_CARTS})"),
+]
+
+# CURRENT_TIMESTAMP and DATETIME share a text format, so expiries compare as strings
+RESERVE_STOCK_SQL = reserve_stock_sql("DATETIME('now', '+' || :ttl || ' seconds')")
+
+INSERT_SALE_ANALYTICS_SQL = sqlalchemy.text(
+    """
+    INSERT INTO sale_analytics
+    (cart_id, customer_class, hour_of_day, day_of_week, total_gold, potion_count, created_at)
+    SELECT :cart_id, :customer_class, hour_of_day, day_of_week, :total_gold, :potion_count, :created_at
+    FROM (SELECT day_of_week, hour_of_day FROM time_analytics ORDER BY created_at DESC LIMIT 1)
+    """
+)
+
+
+class SqliteStorage(PostgresStorage):
+    """
+    A single-file database for local runs and simulations. Reuses the portable
+    Postgres statements and rewrites the ones that lean on FOR UPDATE, writable
+    CTEs or interval arithmetic. SQLite allows one writer at a time, so writes
+    are serialized with a lock instead of row locks.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(
+            sqlalchemy.create_engine(
+                f"sqlite:///{path}",
+                connect_args={"check_same_thread": False, "timeout": 30},
+            )
+        )
+        self._write_lock = threading.Lock()
+        with self.engine.begin() as connection:
+            for statement in SCHEMA:
+                connection.execute(sqlalchemy.text(statement))
+            # files from before the journal existed start with ledgers but no balances
+            unposted = connection.execute(
+                sqlalchemy.text(
+                    "SELECT NOT EXISTS (SELECT 1 FROM account_balances) AND EXISTS (SELECT 1 FROM gold_ledger)"
+                )
+            ).scalar_one()
+            if unposted:
+                for rebuild in REBUILD_JOURNAL_SQL:
+                    connection.execute(rebuild)
+            # nor do their carts have an age
+            columns = {
+                row.name
+                for row in connection.execute(
+                    sqlalchemy.text("PRAGMA table_info(carts)")
+                )
+            }
+            if "age_ticks" not in columns:
+                connection.execute(
+                    sqlalchemy.text(
+                        "ALTER TABLE carts ADD COLUMN age_ticks INTEGER NOT NULL DEFAULT 0"
+                    )
+                )
+
+    def _post(
+        self, connection, order_id: int, transaction_type: str, postings: Dict[str, int]
+    ):
+        transaction_id = connection.execute(
+            INSERT_JOURNAL_TRANSACTION_SQL,
+            {"order_id": order_id, "transaction_type": transaction_type},
+        ).scalar_one()
+        entries = sorted(journal_entries(postings), key=lambda entry: entry["account"])
+        if entries:
+            connection.execute(
+                INSERT_JOURNAL_POSTING_SQL,
+                [{"transaction_id": transaction_id, **entry} for entry in entries],
+            )
+            connection.execute(UPSERT_ACCOUNT_BALANCE_SQL, entries)
+
+    def _as_of_param(self, as_of: datetime) -> str:
+        # CURRENT_TIMESTAMP is stored as 'YYYY-MM-DD HH:MM:SS' text, compared as text
+        return super()._as_of_param(as_of).strftime("%Y-%m-%d %H:%M:%S")
+
+    def rebuild_journal(self) -> None:
+        with self._write_lock:
+            super().rebuild_journal()
+
+    def reset(self) -> None:
+        # no TRUNCATE here; rowid keys restart on their own once a table is empty
+        with self._write_lock, self.engine.begin() as connection:
+            for table in RESET_TABLES:
+                connection.execute(sqlalchemy.text(f"DELETE FROM {table}"))
+            for statement in RESET_SEED_SQL:
+                connection.execute(statement)
+            self._post(connection, -1, "GAME_RESET", RESET_POSTINGS)
+
+    def add_potion(self, *args, **kwargs) -> None:
+        with self._write_lock:
+            super().add_potion(*args, **kwargs)
+
+    def set_cart_item(self, cart_id: int, sku: str, quantity: int, ttl: int) -> str:
+        params = {"cart_id": cart_id, "sku": sku, "quantity": quantity, "ttl": ttl}
+        with self._write_lock, self.engine.begin() as connection:
+            cart = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT c.is_checked_out, p.sku
+                    FROM carts c
+                    JOIN potions p ON p.sku = :sku
+                    WHERE c.cart_id = :cart_id
+                    """
+                ),
+                params,
+            ).first()
+
+            if cart is None or cart.is_checked_out:
+                return ITEM_MISSING
+
+            if connection.execute(RESERVE_STOCK_SQL, params).first() is None:
+                return ITEM_INSUFFICIENT
+
+            connection.execute(UPSERT_CART_ITEM_SQL, params)
+        return ITEM_RESERVED
+
+    def sweep_reservations(self) -> int:
+        with self._write_lock, self.engine.begin() as connection:
+            return connection.execute(SWEEP_RESERVATIONS_SQL).rowcount
+
+    def reap_carts(self, max_age_ticks: int, limit: int) -> int:
+        with self._write_lock, self.engine.begin() as connection:
+            for statement in REAP_CART_STATEMENTS:
+                result = connection.execute(
+                    statement, {"max_age_ticks": max_age_ticks, "limit": limit}
+                )
+        return result.rowcount
+
+    def archive_carts(self, limit: int) -> int:
+        with self._write_lock, self.engine.begin() as connection:
+            for statement in ARCHIVE_CART_STATEMENTS:
+                result = connection.execute(statement, {"limit": limit})
+        return result.rowcount
+
+    def create_cart(self, customer_name: str, character_class: str) -> int:
+        with self._write_lock, self.engine.begin() as connection:
+            return connection.execute(
+                CREATE_CART_SQL,
+                {"customer_name": customer_name, "character_class": character_class},
+            ).scalar_one()
+
+    def checkout(self, cart_id: int, prices: Dict[str, int]) -> CheckoutOutcome:
+        with self._write_lock, self.engine.begin() as connection:
+            cart = connection.execute(
+                sqlalchemy.text(
+                    "SELECT cart_id, character_class FROM carts WHERE cart_id = :cart_id"
+                ),
+                {"cart_id": cart_id},
+            ).first()
+            if cart is None:
+                return CheckoutOutcome(CHECKOUT_MISSING)
+
+            cart_items = connection.execute(CART_ITEMS_SQL, {"cart_id": cart_id}).all()
+            total_potions_bought, total_gold = price_cart_items(cart_items, prices)
+
+            if total_potions_bought == 0:
+                return CheckoutOutcome(CHECKOUT_EMPTY)
+
+            if cart_items[0].is_checked_out:
+                return CheckoutOutcome(
+                    CHECKOUT_ALREADY_DONE, total_potions_bought, total_gold
+                )
+
+            if connection.execute(
+                INSUFFICIENT_INVENTORY_SQL, {"cart_id": cart_id}
+            ).all():
+                return CheckoutOutcome(CHECKOUT_INSUFFICIENT)
+
+            params = {
+                "cart_id": cart_id,
+                "gold_delta": total_gold,
+                "character_class": cart.character_class,
+                "potion_count": total_potions_bought,
+            }
+            for statement in CHECKOUT_STATEMENTS:
+                connection.execute(statement, params)
+            self._post(
+                connection,
+                cart_id,
+                "POTION_SALE",
+                sale_postings(cart_items, total_gold),
+            )
+        return CheckoutOutcome(CHECKOUT_OK, total_potions_bought, total_gold)
+
+    def record_barrel_delivery(self, *args, **kwargs) -> bool:
+        with self._write_lock:
+            return super().record_barrel_delivery(*args, **kwargs)
+
+    def record_potion_delivery(self, *args, **kwargs) -> bool:
+        with self._write_lock:
+            return super().record_potion_delivery(*args, **kwargs)
+
+    def record_capacity_delivery(self, *args, **kwargs) -> bool:
+        with self._write_lock:
+            return self._record_capacity_delivery(*args, **kwargs)
+
+    # no data-modifying CTEs in SQLite, so CAPACITY_DELIVERY_SQL runs as two inserts
+    @idempotent(CAPACITY_DELIVERY)
+    def _record_capacity_delivery(
+        self,
+        connection,
+        order_id: int,
+        potion_capacity_increase: int,
+        ml_capacity_increase: int,
+        gold_delta: int,
+    ) -> None:
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO capacity_order_ledger
+                (order_id, potion_capacity_increase, ml_capacity_increase, gold_delta)
+                VALUES (:order_id, :potion_capacity_increase, :ml_capacity_increase, :gold_delta)
+                """
+            ),
+            {
+                "order_id": order_id,
+                "potion_capacity_increase": potion_capacity_increase,
+                "ml_capacity_increase": ml_capacity_increase,
+                "gold_delta": gold_delta,
+            },
+        )
+        connection.execute(
+            sqlalchemy.text(
+                """
+                INSERT INTO gold_ledger (order_id, gold_delta, transaction_type)
+                VALUES (:order_id, :gold_delta, 'INVENTORY_UPGRADE')
+                """
+            ),
+            {"order_id": order_id, "gold_delta": gold_delta},
+        )
+        self._post(
+            connection,
+            order_id,
+            "INVENTORY_UPGRADE",
+            capacity_postings(
+                potion_capacity_increase, ml_capacity_increase, gold_delta
+            ),
+        )
+
+    def search_orders(
+        self,
+        customer_name: str,
+        potion_sku: str,
+        sort_col: str,
+        sort_order: str,
+        offset: int,
+        limit: Optional[int],
+    ) -> List[SaleLine]:
+        query, params = build_search_query(
+            customer_name, potion_sku, sort_col, sort_order, offset, limit
+        )
+        with self.engine.begin() as connection:
+            rows = connection.execute(sqlalchemy.text(query), params).all()
+        # SQLite hands timestamps back as text
+        return [
+            SaleLine(
+                line_item_id=row.line_item_id,
+                quantity=row.quantity,
+                item_sku=row.item_sku,
+                customer_name=row.customer_name,
+                line_item_total=row.line_item_total,
+                timestamp=datetime.fromisoformat(row.timestamp),
+                total_count=row.total_count,
+            )
+            for row in rows
+        ]
+
+    def record_tick(self, day: str, hour: int) -> None:
+        with self._write_lock:
+            super().record_tick(day, hour)
+
+    def _roll_up_tick(self, connection, day: str, hour: int):
+        sales_data = connection.execute(
+            sqlalchemy.text(
+                """
+                SELECT
+                    COUNT(DISTINCT gl.order_id) as total_sales,
+                    COALESCE(SUM(gl.gold_delta), 0) as total_gold,
+                    CASE WHEN COUNT(*) = 0 THEN 0 ELSE (
+                        (SELECT COUNT(*) FROM carts WHERE created_at >= DATE('now'))
+                        + (SELECT COUNT(DISTINCT cart_id) FROM cart_archive WHERE created_at >= DATE('now'))
+                    ) END as visitor_count
+                FROM gold_ledger gl
+                WHERE DATE(gl.created_at) = DATE('now')
+                    AND gl.created_at >= DATETIME('now', '-3 hours')
+                    AND gl.transaction_type = 'POTION_SALE'
+                """
+            )
+        ).first()
+        connection.execute(
+            UPSERT_TIME_ANALYTICS_SQL, time_analytics_params(day, hour, sales_data)
+        )
+        connection.execute(AGE_OPEN_CARTS_SQL)
+
+    def _checkpoint_balances(self, connection):
+        connection.execute(CHECKPOINT_BALANCES_SQL)
+
+    def queue_tick(self, day: str, hour: int) -> None:
+        with self._write_lock, self.engine.begin() as connection:
+            connection.execute(
+                ENQUEUE_ANALYTICS_SQL, analytics_job(TICK_JOB, day=day, hour=hour)
+            )
+
+    def apply_analytics(self, limit: int) -> AnalyticsBatch:
+        # no advisory locks here; the write lock keeps appliers apart, as it does every other write
+        with self._write_lock, self.engine.begin() as connection:
+            jobs = connection.execute(PENDING_ANALYTICS_SQL, {"limit": limit}).all()
+            return self._apply_jobs(
+                connection,
+                [
+                    (job.job_id, job.kind, json.loads(job.payload), job.created_at)
+                    for job in jobs
+                ],
+            )
+
+    def _insert_sales(self, connection, sales: List[dict]):
+        connection.execute(INSERT_SALE_ANALYTICS_SQL, sales)
+
+    def get_pricing_inputs(self, day: str, hour: int) -> PricingInputs:
+        with self.engine.begin() as connection:
+            features = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT
+                        p.sku,
+                        p.price AS base_price,
+                        COALESCE(SUM(pl.quantity_delta), 0) AS stock,
+                        COALESCE(SUM(-pl.quantity_delta) FILTER (
+                            WHERE pl.transaction_type = 'POTION_SALE'
+                            AND pl.created_at >= DATETIME('now', '-24 hours')
+                        ), 0) AS sold_recent
+                    FROM potions p
+                    LEFT JOIN potion_ledger pl ON pl.sku = p.sku
+                    WHERE p.is_active = TRUE
+                    GROUP BY p.sku, p.price
+                    ORDER BY p.sku
+                    """
+                )
+            ).all()
+            forecast = connection.execute(
+                sqlalchemy.text(
+                    """
+                    SELECT
+                        COALESCE(AVG(total_sales) FILTER (
+                            WHERE day_of_week = :day AND hour_of_day = :hour
+                        ), 0) AS expected_sales,
+                        COALESCE(AVG(total_sales), 0) AS average_sales
+                    FROM time_analytics
+                    """
+                ),
+                {"day": day, "hour": hour},
+            ).one()
+
+        demand_factor = 1.0
+        if forecast.average_sales and forecast.expected_sales:
+            demand_factor = float(forecast.expected_sales) / float(
+                forecast.average_sales
+            )
+
+        return PricingInputs(
+            skus=[row.sku for row in features],
+            base_prices=[row.base_price for row in features],
+            stock=[row.stock for row in features],
+            sold_recent=[row.sold_recent for row in features],
+            demand_factor=demand_factor,
+        )
+
+    def save_prices(self, prices: Dict[str, int], versions_to_keep: int) -> int:
+        with self._write_lock:
+            return super().save_prices(prices, versions_to_keep)
+
+    def create_snapshot(self, name: str) -> None:
+        # no jsonb_agg, so rows are copied through Python; fine at simulation sizes
+        with self._write_lock, self.engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text(
+                    "DELETE FROM game_snapshot_tables WHERE snapshot_name = :name"
+                ),
+                {"name": name},
+            )
+            connection.execute(
+                sqlalchemy.text("DELETE FROM game_snapshots WHERE name = :name"),
+                {"name": name},
+            )
+            connection.execute(
+                sqlalchemy.text("INSERT INTO game_snapshots (name) VALUES (:name)"),
+                {"name": name},
+            )
+            for table in SQLITE_SNAPSHOT_TABLES:
+                rows = (
+                    connection.execute(sqlalchemy.text(f"SELECT * FROM {table}"))
+                    .mappings()
+                    .all()
+                )
+                connection.execute(
+                    sqlalchemy.text(
+                        """
+                        INSERT INTO game_snapshot_tables (snapshot_name, table_name, rows)
+                        VALUES (:name, :table, :rows)
+                        """
+                    ),
+                    {
+                        "name": name,
+                        "table": table,
+                        "rows": json.dumps([dict(row) for row in rows], default=str),
+                    },
+                )
+
+    def restore_snapshot(self, name: str) -> bool:
+        with self._write_lock, self.engine.begin() as connection:
+            stored = dict(
+                connection.execute(
+                    sqlalchemy.text(
+                        "SELECT table_name, rows FROM game_snapshot_tables WHERE snapshot_name = :name"
+                    ),
+                    {"name": name},
+                ).all()
+            )
+            if not stored:
+                return False
+
+            for table in reversed(SQLITE_SNAPSHOT_TABLES):
+                connection.execute(sqlalchemy.text(f"DELETE FROM {table}"))
+            for table in SQLITE_SNAPSHOT_TABLES:
+                defaults = SNAPSHOT_COLUMN_DEFAULTS.get(table, {})
+                rows = [
+                    {**defaults, **row} for row in json.loads(stored.get(table, "[]"))
+                ]
+                if rows:
+                    columns = list(rows[0])
+                    connection.execute(
+                        sqlalchemy.text(
+                            f"INSERT INTO {table} ({', '.join(columns)}) "
+                            f"VALUES ({', '.join(':' + column for column in columns)})"
+                        ),
+                        rows,
+                    )
+            if "account_balances" not in stored:
+                for statement in REBUILD_JOURNAL_SQL:
+                    connection.execute(statement)
+            if "idempotency_keys" not in stored:
+                connection.execute(BACKFILL_IDEMPOTENCY_KEYS_SQL)
+        return True
+
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                sqlalchemy.text(
+                    "SELECT name, created_at FROM game_snapshots ORDER BY created_at DESC"
+                )
+            ).all()
+        return [
+            SnapshotInfo(
+                name=row.name, created_at=datetime.fromisoformat(row.created_at)
+            )
+            for row in rows
+        ]
+
+    def delete_snapshot(self, name: str) -> bool:
+        with self._write_lock, self.engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text(
+                    "DELETE FROM game_snapshot_tables WHERE snapshot_name = :name"
+                ),
+                {"name": name},
+            )
+            result = connection.execute(
+                sqlalchemy.text("DELETE FROM game_snapshots WHERE name = :name"),
+                {"name": name},
+            )
+        return result.rowcount > 0
+
+    def journal_since(self, after_id: int, limit: int) -> List[JournalTransaction]:
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                JOURNAL_SINCE_SQL, {"after_id": after_id, "limit": limit}
+            ).all()
+        return journal_transactions_from_rows(rows)
+
+    def save_verifier_state(self, state: VerifierState, previous_id: int) -> bool:
+        with self._write_lock:
+            return super().save_verifier_state(state, previous_id)
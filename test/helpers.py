@@ -0,0 +1,21 @@
+import time
+
+RED = [100, 0, 0, 0]
+GREEN = [0, 100, 0, 0]
+
+
+def stock_red(storage, quantity: int, order_id: int = 1000):
+    """Buys and bottles quantity red potions."""
+    storage.record_barrel_delivery(order_id, 10, quantity * 100, 0, 0, 0)
+    storage.record_potion_delivery(
+        order_id + 1,
+        [(RED, quantity)],
+        {"red_ml": -quantity * 100, "green_ml": 0, "blue_ml": 0, "dark_ml": 0},
+    )
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.001)
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from src.admission import (
+    BACKGROUND,
+    CHECKOUT,
+    DEFAULT,
+    AdmissionController,
+    AdmissionMiddleware,
+    parse_limits,
+)
+
+
+def controller(max_concurrency=2, limits=None, queues=None, timeout=1.0):
+    return AdmissionController(
+        max_concurrency,
+        limits or {},
+        queues or {CHECKOUT: 4, DEFAULT: 4, BACKGROUND: 4},
+        timeout,
+    )
+
+
+def test_parse_limits():
+    assert parse_limits(" checkout=15, background=2,") == {
+        "checkout": 15,
+        "background": 2,
+    }
+    with pytest.raises(ValueError):
+        parse_limits("search=1")
+
+
+def test_class_limit_caps_its_own_requests():
+    async def main():
+        gate = controller(
+            max_concurrency=4, limits={BACKGROUND: 1}, queues={BACKGROUND: 0}
+        )
+        assert await gate.acquire(BACKGROUND) is None
+        assert await gate.acquire(BACKGROUND) == "queue_full"
+        # other classes still have room under the overall cap
+        assert await gate.acquire(DEFAULT) is None
+
+    asyncio.run(main())
+
+
+def test_waiters_time_out():
+    async def main():
+        gate = controller(max_concurrency=1, timeout=0.01)
+        assert await gate.acquire(DEFAULT) is None
+        assert await gate.acquire(DEFAULT) == "timeout"
+        assert gate.stats[DEFAULT].rejected_timeout == 1
+        assert not gate.waiters[DEFAULT]
+
+    asyncio.run(main())
+
+
+def test_freed_slots_go_to_checkout_first():
+    async def main():
+        gate = controller(max_concurrency=1)
+        assert await gate.acquire(DEFAULT) is None
+        order = []
+
+        async def wait(name):
+            assert await gate.acquire(name) is None
+            order.append(name)
+            gate.release(name)
+
+        background = asyncio.create_task(wait(BACKGROUND))
+        default = asyncio.create_task(wait(DEFAULT))
+        checkout = asyncio.create_task(wait(CHECKOUT))
+        await asyncio.sleep(0)
+        gate.release(DEFAULT)
+        await asyncio.gather(background, default, checkout)
+        assert order == [CHECKOUT, DEFAULT, BACKGROUND]
+        assert gate.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_middleware_answers_503_with_retry_after():
+    async def main():
+        gate = controller(max_concurrency=1, queues={DEFAULT: 0})
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope["path"])
+
+        middleware = AdmissionMiddleware(app, gate, retry_after=3)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/catalog/", "headers": []}
+        assert await gate.acquire(DEFAULT) is None
+        await middleware(scope, None, send)
+        assert calls == []
+        assert sent[0]["status"] == 503
+        assert (b"retry-after", b"3") in sent[0]["headers"]
+
+        # exempt paths skip the queue
+        await middleware({**scope, "path": "/metrics"}, None, send)
+        assert calls == ["/metrics"]
+
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+from src import analytics
+from src.storage import get_storage
+from test.helpers import stock_red
+
+
+def sell(storage, name: str):
+    cart_id = storage.create_cart(name, "Wizard")
+    storage.set_cart_item(cart_id, "RED", 1, 300)
+    storage.checkout(cart_id, {})
+
+
+def test_apply_stops_after_each_tick(storage):
+    stock_red(storage, 3)
+    sell(storage, "alice")
+    storage.queue_tick("Edgeday", 2)
+    sell(storage, "bob")
+    sell(storage, "carol")
+    storage.queue_tick("Edgeday", 4)
+
+    first = storage.apply_analytics(100)
+    assert (first.applied, first.tick) == (2, ("Edgeday", 2))
+    # the limit caps a batch even before its tick
+    partial = storage.apply_analytics(1)
+    assert (partial.applied, partial.tick) == (1, None)
+    second = storage.apply_analytics(100)
+    assert (second.applied, second.tick) == (2, ("Edgeday", 4))
+    assert storage.apply_analytics(100).applied == 0
+
+
+def test_ticks_feed_the_pricing_demand_factor(storage):
+    stock_red(storage, 3)
+    storage.queue_tick("Edgeday", 0)
+    storage.apply_analytics(100)
+    sell(storage, "alice")
+    sell(storage, "bob")
+    storage.queue_tick("Edgeday", 2)
+    storage.apply_analytics(100)
+
+    # two sales at Edgeday 2 against an average of one per tick
+    inputs = storage.get_pricing_inputs("Edgeday", 2)
+    assert sorted(inputs.skus) == ["GREEN", "RED"]
+    assert inputs.demand_factor == 2.0
+    assert dict(zip(inputs.skus, inputs.sold_recent))["RED"] == 2
+
+
+def test_a_tick_drains_the_queue_and_reprices(client):
+    shop = get_storage()
+    stock_red(shop, 2)
+    version = shop.load_prices()[0]
+    sell(shop, "alice")
+    assert (
+        client.post(
+            "/info/current_time", json={"day": "Edgeday", "hour": 2}
+        ).status_code
+        == 204
+    )
+
+    # without the lifespan worker the tick's background task drains inline
+    assert analytics.drain() == 0
+    assert shop.apply_analytics(100).applied == 0
+    assert shop.load_prices()[0] > version
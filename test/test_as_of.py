@@ -0,0 +1,50 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def tick(storage, hour: int):
+    storage.queue_tick("Edgeday", hour)
+    while storage.apply_analytics(100).applied:
+        pass
+
+
+def test_balances_as_of_read_checkpoints_and_later_postings(storage):
+    assert storage.get_balances_as_of(datetime(2000, 1, 1)) is None
+
+    storage.record_barrel_delivery(1, 10, 500, 0, 0, 0)
+    tick(storage, 0)
+    storage.record_barrel_delivery(2, 10, 500, 0, 0, 0)
+    # journal timestamps may be whole seconds, so leave one between the two halves
+    time.sleep(1.1)
+    middle = datetime.now(timezone.utc)
+    time.sleep(1.1)
+    storage.record_barrel_delivery(3, 10, 500, 0, 0, 0)
+    tick(storage, 2)
+    storage.record_capacity_delivery(4, 0, 10000, -1000)
+
+    then = storage.get_balances_as_of(middle)
+    assert (then.gold, then.red_ml) == (80, 1000)
+    # naive timestamps are UTC
+    assert storage.get_balances_as_of(middle.replace(tzinfo=None)) == then
+
+    now = storage.get_balances_as_of(datetime.now(timezone.utc) + timedelta(minutes=1))
+    assert now == storage.get_balances()
+    assert (now.gold, now.max_barrel_capacity) == (70 - 1000, 20000)
+
+
+def test_as_of_routes(client):
+    past = client.get(
+        "/inventory/audit/as_of", params={"timestamp": "2000-01-01T00:00:00Z"}
+    )
+    assert past.status_code == 404
+
+    future = (datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat()
+    assert client.get(
+        "/inventory/audit/as_of", params={"timestamp": future}
+    ).json() == {
+        "number_of_potions": 0,
+        "ml_in_barrels": 0,
+        "gold": 100,
+    }
+    balances = client.get("/admin/balances/as_of", params={"timestamp": future}).json()
+    assert (balances["gold"], balances["max_potion_capacity"]) == (100, 50)
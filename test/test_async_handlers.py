@@ -0,0 +1,83 @@
+"""
+The DB_ASYNC handlers run their SQL on an AsyncEngine. There is no Postgres in
+the test run, so these swap in an engine that records each statement and
+answers the idempotency claim, and check what the handler sends.
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src import database as db
+from src.api import inventory
+from src.storage import postgres
+
+
+class Result:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class RecordingEngine:
+    def __init__(self, claimed: bool):
+        self.claimed = claimed
+        self.statements: list = []
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+
+    async def execute(self, statement, params=None):
+        self.statements.append((statement, params))
+        if statement is postgres.CLAIM_IDEMPOTENCY_KEY_SQL:
+            return Result(("claimed",) if self.claimed else None)
+        return Result(None)
+
+
+def deliver(monkeypatch, claimed: bool) -> RecordingEngine:
+    engine = RecordingEngine(claimed)
+    monkeypatch.setattr(db, "async_engine", engine, raising=False)
+    plan = inventory.CapacityPlan(potion_capacity=1, ml_capacity=2)
+    asyncio.run(inventory.deliver_capacity_plan_async(plan, 42))
+    return engine
+
+
+def test_async_capacity_delivery_posts_its_journal(monkeypatch):
+    engine = deliver(monkeypatch, claimed=True)
+    statements = [statement for statement, _ in engine.statements]
+    assert statements == [
+        postgres.CLAIM_IDEMPOTENCY_KEY_SQL,
+        postgres.CAPACITY_DELIVERY_SQL,
+        postgres.POST_JOURNAL_SQL,
+    ]
+
+    journal = engine.statements[2][1]
+    assert (journal["order_id"], journal["transaction_type"]) == (
+        42,
+        "INVENTORY_UPGRADE",
+    )
+    postings = {
+        entry["account"]: entry["delta"] for entry in json.loads(journal["postings"])
+    }
+    assert postings["gold"] == -3000
+    assert postings["capacity:potions"] == 50
+    assert postings["capacity:ml"] == 20000
+    assert postings["world:gold"] == 3000
+
+
+def test_async_capacity_delivery_replay_writes_nothing(monkeypatch):
+    engine = deliver(monkeypatch, claimed=False)
+    assert [statement for statement, _ in engine.statements] == [
+        postgres.CLAIM_IDEMPOTENCY_KEY_SQL
+    ]
+
+
+@pytest.mark.parametrize("potion_capacity", [-1, 11])
+def test_capacity_plan_bounds(potion_capacity):
+    with pytest.raises(ValueError):
+        inventory.CapacityPlan(potion_capacity=potion_capacity, ml_capacity=0)
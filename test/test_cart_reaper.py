@@ -0,0 +1,60 @@
+from src import cart_reaper, config
+from src.storage import ITEM_RESERVED, get_storage
+from test.helpers import stock_red
+
+
+def tick(storage, hour: int):
+    storage.queue_tick("Edgeday", hour)
+    while storage.apply_analytics(100).applied:
+        pass
+
+
+def test_open_carts_expire_after_their_ticks(storage):
+    stock_red(storage, 2)
+    old = storage.create_cart("alice", "Wizard")
+    storage.set_cart_item(old, "RED", 2, 300)
+    tick(storage, 0)
+    young = storage.create_cart("bob", "Rogue")
+    tick(storage, 1)
+
+    assert storage.reap_carts(2, 100) == 1
+    assert storage.reap_carts(2, 100) == 0
+    # alice's reservation went with her cart
+    assert storage.set_cart_item(young, "RED", 2, 300) == ITEM_RESERVED
+
+
+def test_settled_carts_are_archived_and_still_searchable(storage):
+    stock_red(storage, 3)
+    # sales are rolled up into the current tick, so there has to be one
+    tick(storage, 0)
+    for name in ("alice", "bob", "carol"):
+        cart_id = storage.create_cart(name, "Wizard")
+        storage.set_cart_item(cart_id, "RED", 1, 300)
+        storage.checkout(cart_id, {})
+    # a sale is only archived once the analytics worker has rolled it up
+    assert storage.archive_carts(100) == 0
+    tick(storage, 1)
+
+    assert storage.archive_carts(2) == 2
+    assert storage.archive_carts(2) == 1
+    lines = storage.search_orders("", "", "customer_name", "asc", 0, None)
+    assert [line.customer_name for line in lines] == ["alice", "bob", "carol"]
+
+
+def test_reap_runs_every_batch_and_counts(client, monkeypatch):
+    settings = config.get_settings()
+    monkeypatch.setattr(settings, "CART_TTL_TICKS", 1)
+    monkeypatch.setattr(settings, "CART_REAPER_BATCH_SIZE", 2)
+    shop = get_storage()
+    stock_red(shop, 1)
+    tick(shop, 0)
+    sold = shop.create_cart("alice", "Wizard")
+    shop.set_cart_item(sold, "RED", 1, 300)
+    shop.checkout(sold, {})
+    for name in ("bob", "carol", "dave"):
+        shop.create_cart(name, "Rogue")
+    tick(shop, 1)
+
+    assert cart_reaper.reap() == {"expired": 3, "archived": 1}
+    assert cart_reaper.reap() == {"expired": 0, "archived": 0}
+    assert "cart_reaper_expired_total" in cart_reaper.render()
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+
+import pytest
+
+from src import database as db
+from src import cache, profiler
+from src.storage import get_storage
+
+
+class FakeEngine:
+    """Answers every statement with one scalar and counts them."""
+
+    def __init__(self, scalar):
+        self.scalar = scalar
+        self.statements = 0
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement, params=None):
+        self.statements += 1
+        return self
+
+    def scalar_one(self):
+        return self.scalar
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    primary, replica = FakeEngine("0/16B3748"), FakeEngine(True)
+    monkeypatch.setattr(db, "get_engine", lambda: primary)
+    monkeypatch.setattr(db, "get_replica_engine", lambda: replica)
+    return primary, replica
+
+
+@contextmanager
+def request():
+    token = profiler._current.set(profiler.RequestProfile(route="/inventory/audit"))
+    try:
+        yield
+    finally:
+        profiler._current.reset(token)
+
+
+def test_without_a_replica_fresh_reads_skip_the_lsn_check(monkeypatch, engines):
+    primary, replica = engines
+    monkeypatch.setattr(db, "replica_url", None)
+    assert db.read_engine(fresh=True) is primary
+    assert (primary.statements, replica.statements) == (0, 0)
+
+
+def test_fresh_reads_ask_the_primary_once_per_request(monkeypatch, engines):
+    primary, replica = engines
+    monkeypatch.setattr(db, "replica_url", "postgresql+psycopg://replica")
+    with request():
+        assert db.read_engine(fresh=True) is replica
+        assert db.read_engine(fresh=True) is replica
+    assert (primary.statements, replica.statements) == (1, 2)
+
+    with request():
+        db.read_engine(fresh=True)
+    assert primary.statements == 2
+
+
+def test_a_lagging_replica_sends_fresh_reads_to_the_primary(monkeypatch, engines):
+    primary, replica = engines
+    replica.scalar = False
+    monkeypatch.setattr(db, "replica_url", "postgresql+psycopg://replica")
+    with request():
+        assert db.read_engine(fresh=True) is primary
+    # stale-tolerant reads go to the replica regardless
+    assert db.read_engine() is replica
+
+
+def test_the_audit_sees_another_workers_delivery_with_caching_on(client, monkeypatch):
+    monkeypatch.setattr(cache, "_enabled", True)
+    try:
+        assert client.get("/inventory/audit").json()["gold"] == 100
+        # as if another worker committed it and its NOTIFY hasn't arrived yet
+        get_storage().record_barrel_delivery(1, 60, 500, 0, 0, 0)
+        assert client.get("/inventory/audit").json() == {
+            "number_of_potions": 0,
+            "ml_in_barrels": 500,
+            "gold": 40,
+        }
+    finally:
+        cache.invalidate(*cache.ALL)
@@ -0,0 +1,53 @@
+from test.helpers import RED
+
+SMALL_RED = {
+    "sku": "SMALL_RED_BARREL",
+    "ml_per_barrel": 500,
+    "potion_type": [1, 0, 0, 0],
+    "price": 100,
+    "quantity": 1,
+}
+NO_ML = {"red_ml": 0, "green_ml": 0, "blue_ml": 0, "dark_ml": 0}
+
+
+def test_replayed_deliveries_are_recorded_once(storage):
+    assert storage.record_barrel_delivery(1, 60, 500, 0, 0, 0)
+    assert not storage.record_barrel_delivery(1, 60, 500, 0, 0, 0)
+    assert storage.record_potion_delivery(2, [(RED, 2)], {**NO_ML, "red_ml": -200})
+    assert not storage.record_potion_delivery(2, [(RED, 2)], {**NO_ML, "red_ml": -200})
+    assert storage.record_capacity_delivery(3, 50, 0, -1000)
+    assert not storage.record_capacity_delivery(3, 50, 0, -1000)
+
+    balances = storage.get_balances()
+    assert (balances.gold, balances.red_ml) == (40 - 1000, 300)
+    assert balances.number_of_potions == 2
+    assert balances.max_potion_capacity == 100
+
+
+def test_order_ids_are_scoped_per_endpoint(storage):
+    # the exchange numbers each endpoint's orders on its own, so one id may recur
+    assert storage.record_barrel_delivery(7, 10, 100, 0, 0, 0)
+    assert storage.record_potion_delivery(7, [(RED, 1)], {**NO_ML, "red_ml": -100})
+    assert storage.record_capacity_delivery(7, 0, 0, 0)
+
+
+def test_deliver_endpoints_replay_without_effect(client):
+    for _ in range(2):
+        assert client.post("/barrels/deliver/1", json=[SMALL_RED]).status_code == 204
+        assert (
+            client.post(
+                "/bottler/deliver/2", json=[{"potion_type": RED, "quantity": 3}]
+            ).status_code
+            == 204
+        )
+        assert (
+            client.post(
+                "/inventory/deliver/3", json={"potion_capacity": 0, "ml_capacity": 0}
+            ).status_code
+            == 204
+        )
+    assert client.get("/inventory/audit").json() == {
+        "number_of_potions": 3,
+        "ml_in_barrels": 200,
+        "gold": 0,
+    }
@@ -0,0 +1,67 @@
+from src import integrity
+from src.storage import JournalTransaction, get_storage
+from src.storage.memory import MemoryStorage
+from test.helpers import RED, stock_red
+
+RECIPES = {"RED": RED}
+
+
+def bottling(postings: dict) -> JournalTransaction:
+    return JournalTransaction(7, 2, "POTION_DELIVERY", postings)
+
+
+def rules(transaction: JournalTransaction, balances: dict) -> list:
+    return [v.rule for v in integrity.check_transaction(transaction, balances, RECIPES)]
+
+
+def test_a_sound_bottling_passes_and_moves_balances():
+    balances = {"ml:red": 300}
+    transaction = bottling(
+        {"ml:red": -200, "world:ml:red": 200, "sku:RED": 2, "world:sku:RED": -2}
+    )
+    assert rules(transaction, balances) == []
+    assert (balances["ml:red"], balances["sku:RED"]) == (100, 2)
+
+
+def test_broken_transactions_are_flagged():
+    unbalanced = bottling(
+        {"ml:red": -200, "world:ml:red": 100, "sku:RED": 2, "world:sku:RED": -2}
+    )
+    assert "unbalanced" in rules(unbalanced, {"ml:red": 300})
+
+    overdrawn = bottling(
+        {"ml:red": -200, "world:ml:red": 200, "sku:RED": 2, "world:sku:RED": -2}
+    )
+    assert "negative_balance" in rules(overdrawn, {"ml:red": 100})
+
+    short = bottling(
+        {"ml:red": -100, "world:ml:red": 100, "sku:RED": 2, "world:sku:RED": -2}
+    )
+    assert "unmatched_bottling" in rules(short, {"ml:red": 300})
+
+
+def test_verify_is_incremental_and_catches_drift(client):
+    shop = get_storage()
+    assert isinstance(shop, MemoryStorage)
+    stock_red(shop, 2)
+
+    first = integrity.verify()
+    assert first.violations == []
+    assert first.checked > 0
+    # nothing new since the watermark
+    assert integrity.verify().checked == 0
+
+    shop.record_capacity_delivery(9, 50, 0, -1000)
+    assert integrity.verify().checked == 1
+
+    shop._account_balances["gold"] += 7
+    drift = integrity.verify()
+    assert [v.rule for v in drift.violations] == ["balance_drift"]
+
+
+def test_verify_route_full_run(client):
+    stock_red(get_storage(), 1)
+    client.post("/admin/verify_ledger")
+    report = client.post("/admin/verify_ledger", params={"full": True}).json()
+    assert report["violations"] == []
+    assert report["checked"] == report["transaction_id"] > 0
@@ -0,0 +1,58 @@
+from src.storage import get_storage
+from src.storage.base import journal_entries
+from test.helpers import stock_red
+
+
+def test_journal_entries_balance_each_posting_with_its_world_twin():
+    entries = journal_entries({"gold": -60, "ml:red": 500, "ml:green": 0})
+    assert entries == [
+        {"account": "gold", "delta": -60},
+        {"account": "ml:red", "delta": 500},
+        {"account": "world:gold", "delta": 60},
+        {"account": "world:ml:red", "delta": -500},
+    ]
+
+
+def test_account_balances_match_the_journal(storage):
+    stock_red(storage, 3)
+    storage.record_capacity_delivery(5, 1, 0, -1000)
+    cart_id = storage.create_cart("alice", "Wizard")
+    storage.set_cart_item(cart_id, "RED", 2, 300)
+    storage.checkout(cart_id, {})
+
+    balances, journal = storage.balances_since(0)
+    assert balances == journal
+    assert balances["gold"] == 100 - 10 - 1000 + 100
+    assert balances["sku:RED"] == 1
+    # every posting, the reset's seed included, is cancelled by its world: twin
+    for account, balance in balances.items():
+        if not account.startswith("world:"):
+            assert balances.get("world:" + account, 0) == -balance
+
+
+def test_fractional_barrels_post_whole_ml(client, monkeypatch):
+    shop = get_storage()
+    received = []
+    deliver = shop.record_barrel_delivery
+
+    def record(*args, **kwargs):
+        received.append(kwargs)
+        return deliver(*args, **kwargs)
+
+    # the memory backend rounds for itself, so check what the route hands over too
+    monkeypatch.setattr(shop, "record_barrel_delivery", record)
+    mixed = {
+        "sku": "MEDIUM_MIXED_BARREL",
+        "ml_per_barrel": 2500,
+        "potion_type": [0.3, 0.3, 0.4, 0.0],
+        "price": 80,
+        "quantity": 1,
+    }
+    assert client.post("/barrels/deliver/1", json=[mixed]).status_code == 204
+
+    assert all(type(value) is int for value in received[0].values())
+    [transaction] = [
+        t for t in shop.journal_since(0, 100) if t.transaction_type == "BARREL_DELIVERY"
+    ]
+    assert all(type(delta) is int for delta in transaction.postings.values())
+    assert transaction.postings["ml:red"] == 750
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+import sqlalchemy
+
+from src.storage import ledger_writer
+from src.storage.ledger_writer import LedgerWriter
+
+
+class LockRace(Exception):
+    """Stands in for psycopg's DeadlockDetected, which carries its SQLSTATE."""
+
+    sqlstate = "40P01"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(
+        f"sqlite:///{tmp_path / 'writer.db'}",
+        connect_args={"check_same_thread": False},
+    )
+
+    # pysqlite opens transactions itself and can't nest them; let SQLAlchemy issue BEGIN
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def no_driver_transactions(dbapi_connection, record):
+        dbapi_connection.isolation_level = None
+
+    @sqlalchemy.event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE sales (id INTEGER PRIMARY KEY)")
+    return engine
+
+
+@pytest.fixture
+def writer(engine):
+    writer = LedgerWriter(engine, window=0.05, max_batch=64)
+    yield writer
+    writer.stop()
+
+
+def insert(sale_id: int):
+    def unit(connection):
+        connection.exec_driver_sql(f"INSERT INTO sales (id) VALUES ({sale_id})")
+        return sale_id
+
+    return unit
+
+
+def sales(engine) -> list:
+    with engine.begin() as connection:
+        return [
+            row[0]
+            for row in connection.exec_driver_sql("SELECT id FROM sales ORDER BY id")
+        ]
+
+
+def test_units_in_a_window_share_one_commit(engine, writer):
+    batches = ledger_writer._counts.batches
+    futures = [writer.submit(insert(n)) for n in range(5)]
+    assert [future.result(5) for future in futures] == list(range(5))
+    assert ledger_writer._counts.batches == batches + 1
+    assert sales(engine) == list(range(5))
+
+
+def test_a_failing_unit_rolls_back_only_itself(engine, writer):
+    def fail(connection):
+        connection.exec_driver_sql("INSERT INTO sales (id) VALUES (99)")
+        raise ValueError("bad cart")
+
+    first, failed, last = (
+        writer.submit(insert(1)),
+        writer.submit(fail),
+        writer.submit(insert(2)),
+    )
+    assert first.result(5) == 1
+    with pytest.raises(ValueError, match="bad cart"):
+        failed.result(5)
+    assert last.result(5) == 2
+    assert sales(engine) == [1, 2]
+
+
+def test_a_unit_that_loses_a_lock_race_runs_again_alone(engine, writer):
+    attempts = []
+    batch_done = threading.Event()
+
+    def racy(connection):
+        attempts.append(batch_done.is_set())
+        if len(attempts) == 1:
+            raise LockRace()
+        connection.exec_driver_sql("INSERT INTO sales (id) VALUES (7)")
+        return 7
+
+    def last(connection):
+        connection.exec_driver_sql("INSERT INTO sales (id) VALUES (8)")
+        batch_done.set()
+        return 8
+
+    retries = ledger_writer._counts.retries
+    futures = [writer.submit(insert(6)), writer.submit(racy), writer.submit(last)]
+    assert [future.result(5) for future in futures] == [6, 7, 8]
+    # the retry ran after the rest of its batch, not in the middle of it
+    assert attempts == [False, True]
+    assert ledger_writer._counts.retries == retries + 1
+    assert sales(engine) == [6, 7, 8]
+
+
+def test_retries_give_up_after_a_few_attempts(writer):
+    def always_racing(connection):
+        raise LockRace()
+
+    with pytest.raises(LockRace):
+        writer.submit(always_racing).result(5)
@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from src import config, planner
+from src.api.barrels import Barrel, create_barrel_plan
+from src.api.bottler import create_bottle_plan, improve_bottle_plan
+from src.storage import PotionStock
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Settings with the plan search off, so plans are the greedy ones."""
+    settings = config.get_settings()
+    monkeypatch.setattr(settings, "PLANNER_WORKERS", 0)
+    return settings
+
+
+def barrel(sku: str, potion_type: list, price: int, quantity: int = 10) -> Barrel:
+    return Barrel(
+        sku=sku,
+        ml_per_barrel=500,
+        potion_type=potion_type,
+        price=price,
+        quantity=quantity,
+    )
+
+
+CATALOG = [
+    barrel("SMALL_RED_BARREL", [1, 0, 0, 0], 100),
+    barrel("SMALL_DARK_BARREL", [0, 0, 0, 1], 120),
+    barrel("JUNK_RED_BARREL", [1, 0, 0, 0], 1),
+]
+
+
+def plan(gold: int, capacity: int = 10000) -> dict:
+    orders = create_barrel_plan(gold, capacity, 0, 0, 0, 0, CATALOG)
+    return {order.sku: order.quantity for order in orders}
+
+
+def test_barrel_plan_buys_nothing_by_default(settings):
+    assert plan(10000) == {}
+
+
+def test_barrel_planner_stays_within_gold_and_capacity(settings, monkeypatch):
+    monkeypatch.setattr(settings, "BARREL_PLANNER", True)
+    bought = plan(500)
+    assert "JUNK_RED_BARREL" not in bought
+    assert bought
+    spent = bought.get("SMALL_RED_BARREL", 0) * 100
+    assert spent + bought.get("SMALL_DARK_BARREL", 0) * 120 <= 500
+
+    # 1000 ml of room holds two barrels, however much gold there is
+    assert sum(plan(10000, capacity=1000).values()) <= 2
+
+
+def potion(sku: str, red_ml: int, blue_ml: int) -> PotionStock:
+    return PotionStock(sku, sku.lower(), 50, red_ml, 0, blue_ml, 0, True, 0)
+
+
+# red alone can make either, but purple goes twice as far on it
+POTIONS = [potion("RED", 100, 0), potion("PURPLE", 50, 50)]
+
+
+def bottle(potions: list = POTIONS) -> list:
+    greedy = create_bottle_plan(400, 0, 1000, 0, 50, [], 0, potions)
+    return improve_bottle_plan(greedy, [400, 0, 1000, 0], 50, [], 0, potions)
+
+
+def quantities(plan: list) -> dict:
+    return {tuple(mix.potion_type): mix.quantity for mix in plan}
+
+
+def test_bottle_plan_for_an_empty_catalog_is_empty(settings):
+    assert bottle([]) == []
+
+
+def test_bottle_plan_falls_back_to_greedy_without_workers(settings):
+    # the greedy plan spends all the red on the first potion it reaches
+    assert quantities(bottle()) == {(100, 0, 0, 0): 4}
+
+
+def test_bottle_plan_falls_back_to_greedy_when_the_search_is_late(
+    settings, monkeypatch
+):
+    class NeverAnswers:
+        def submit(self, *args):
+            return Future()
+
+    monkeypatch.setattr(settings, "BOTTLE_PLAN_DEADLINE_MS", 50)
+    monkeypatch.setattr(planner, "start_pool", lambda: NeverAnswers())
+    stats = planner._stats.get("bottler", planner.PlannerStats())
+    fallbacks = stats.fallbacks
+    assert quantities(bottle()) == {(100, 0, 0, 0): 4}
+    assert planner._stats["bottler"].fallbacks == fallbacks + 1
+
+
+def test_bottle_search_evens_out_within_bounds_and_capacity(settings, monkeypatch):
+    def search_here(problem, initial, deadline_ms):
+        result = planner.search(problem, initial, time.monotonic() + 0.2, seed=1)
+        assert all(0 <= q <= bound for q, bound in zip(result.plan, problem.bounds))
+        return result.plan
+
+    monkeypatch.setattr(planner, "solve", search_here)
+    plan = quantities(bottle())
+    red = plan.get((100, 0, 0, 0), 0) * 100 + plan.get((50, 0, 50, 0), 0) * 50
+    assert red <= 400
+    assert sum(plan.values()) <= 50
+    # sharing the red out bottles more, and more evenly, than greedy's 4 reds
+    assert plan[(50, 0, 50, 0)] > 4
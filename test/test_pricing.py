@@ -0,0 +1,43 @@
+from src import pricing
+from src.storage import PricingInputs, get_storage
+from test.helpers import stock_red
+
+
+def prices(sold: list, stock: list, demand: float = 1.0, base: int = 100) -> list:
+    inputs = PricingInputs(
+        skus=[f"SKU{n}" for n in range(len(sold))],
+        base_prices=[base] * len(sold),
+        stock=stock,
+        sold_recent=sold,
+        demand_factor=demand,
+    )
+    return pricing.compute_prices(inputs)
+
+
+def test_sell_through_marks_up_fast_movers_and_down_slow_ones():
+    # sold out, half sold, nothing sold, and nothing to go on
+    assert prices([10, 5, 0, 0], [0, 5, 10, 0]) == [120, 100, 80, 80]
+
+
+def test_demand_shifts_every_price_within_the_clamp():
+    assert prices([5, 0], [5, 10], demand=1.5) == [110, 90]
+    # demand is clamped to 0.5-1.5 and the multiplier to 0.75-1.25
+    assert prices([10, 0], [0, 10], demand=3.0) == [125, 90]
+    assert prices([10, 0], [0, 10], demand=0.1) == [110, 75]
+
+
+def test_prices_stay_inside_the_catalog_bounds():
+    assert prices([10], [0], base=450) == [pricing.MAX_PRICE]
+    assert prices([0], [10], base=0) == [pricing.MIN_PRICE]
+
+
+def test_refresh_prices_swaps_the_snapshot_get_price_reads(client, monkeypatch):
+    # start from, and leave behind, no loaded table
+    monkeypatch.setattr(pricing, "_snapshot", None)
+    assert pricing.get_price("RED", 50) == 50
+
+    stock_red(get_storage(), 10)
+    snapshot = pricing.refresh_prices("Edgeday", 0)
+    assert snapshot.prices["RED"] == 40
+    assert pricing.get_price("RED", 50) == 40
+    assert pricing.get_snapshot().version == snapshot.version
@@ -0,0 +1,71 @@
+from src.storage import CHECKOUT_OK, ITEM_INSUFFICIENT, ITEM_RESERVED, get_storage
+from test.helpers import stock_red
+
+
+def red(storage):
+    return next(stock for stock in storage.get_potion_stock() if stock.sku == "RED")
+
+
+def test_a_reservation_holds_stock_from_other_carts(storage):
+    stock_red(storage, 3)
+    alice = storage.create_cart("alice", "Wizard")
+    bob = storage.create_cart("bob", "Rogue")
+
+    assert storage.set_cart_item(alice, "RED", 2, 300) == ITEM_RESERVED
+    assert (red(storage).quantity, red(storage).available) == (3, 1)
+    assert storage.set_cart_item(bob, "RED", 2, 300) == ITEM_INSUFFICIENT
+    # a cart's own reservation doesn't count against it when it asks for more
+    assert storage.set_cart_item(alice, "RED", 1, 300) == ITEM_RESERVED
+    assert red(storage).available == 0
+
+
+def test_expired_reservations_free_their_stock_and_are_swept(storage):
+    stock_red(storage, 2)
+    alice = storage.create_cart("alice", "Wizard")
+    assert storage.set_cart_item(alice, "RED", 2, 0) == ITEM_RESERVED
+    assert red(storage).available == 2
+
+    bob = storage.create_cart("bob", "Rogue")
+    assert storage.set_cart_item(bob, "RED", 2, 300) == ITEM_RESERVED
+    assert storage.sweep_reservations() == 1
+    assert storage.sweep_reservations() == 0
+    assert red(storage).available == 0
+
+
+def test_checkout_consumes_its_reservation(storage):
+    stock_red(storage, 2)
+    alice = storage.create_cart("alice", "Wizard")
+    storage.set_cart_item(alice, "RED", 2, 300)
+
+    assert storage.checkout(alice, {}).status == CHECKOUT_OK
+    assert (red(storage).quantity, red(storage).reserved) == (0, 0)
+    # nothing is left behind for the sweep
+    assert storage.sweep_reservations() == 0
+
+
+def test_set_item_quantity_route_answers_404_and_409(client):
+    stock_red(get_storage(), 1)
+    cart_id = client.post(
+        "/carts/",
+        json={
+            "customer_id": "1",
+            "customer_name": "alice",
+            "character_class": "Wizard",
+            "level": 3,
+        },
+    ).json()["cart_id"]
+
+    def add(cart: int, quantity: int):
+        return client.post(f"/carts/{cart}/items/RED", json={"quantity": quantity})
+
+    assert add(cart_id, 1).status_code == 204
+    conflict = add(cart_id, 1)
+    assert (conflict.status_code, conflict.json()["detail"]) == (
+        409,
+        "Not enough stock",
+    )
+    assert add(cart_id + 1, 1).status_code == 404
+
+    documented = client.get("/openapi.json").json()["paths"]
+    responses = documented["/carts/{cart_id}/items/{item_sku}"]["post"]["responses"]
+    assert responses["409"]["description"] == "Not enough stock"
@@ -0,0 +1,21 @@
+from src.storage import get_storage
+
+SMALL_RED = {
+    "sku": "SMALL_RED_BARREL",
+    "ml_per_barrel": 500,
+    "potion_type": [1, 0, 0, 0],
+    "price": 100,
+    "quantity": 1,
+}
+
+
+def test_json_body_parses_the_raw_list(client):
+    response = client.post("/barrels/deliver/1", json=[SMALL_RED, SMALL_RED])
+    assert response.status_code == 204
+    assert get_storage().get_balances().red_ml == 1000
+
+
+def test_json_body_reports_errors_like_fastapi(client):
+    response = client.post("/barrels/deliver/1", json=[{**SMALL_RED, "price": "free"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 0, "price"]
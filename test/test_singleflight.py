@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.singleflight import Group
+from test.helpers import wait_until
+
+
+def test_concurrent_callers_share_one_load():
+    group = Group()
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def load():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return "catalog"
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(group.do, "catalog", load)
+        started.wait(5)
+        followers = [pool.submit(group.do, "catalog", load) for _ in range(3)]
+        # followers are counted as they join, before the leader finishes
+        wait_until(lambda: group.counts()["catalog"].calls == 4)
+        release.set()
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert results == ["catalog"] * 4
+    assert len(loads) == 1
+    assert group.counts()["catalog"].shared == 3
+
+
+def test_followers_get_the_leaders_error():
+    group = Group()
+    started, release = threading.Event(), threading.Event()
+
+    def load():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("database down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(group.do, "stock", load)
+        started.wait(5)
+        follower = pool.submit(group.do, "stock", load)
+        wait_until(lambda: group.counts()["stock"].calls == 2)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="database down"):
+                future.result(5)
+
+
+def test_calls_after_a_load_finishes_load_again():
+    group = Group()
+    values = iter([1, 2])
+    assert group.do("balances", lambda: next(values)) == 1
+    assert group.do("balances", lambda: next(values)) == 2
+
+
+def test_forget_starts_a_new_load_for_later_callers():
+    group = Group()
+    release = threading.Event()
+    started = threading.Event()
+
+    def stale():
+        started.set()
+        release.wait(5)
+        return "before write"
+
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(group.do, "balances", stale)
+        started.wait(5)
+        group.forget("balances")
+        assert group.do("balances", lambda: "after write") == "after write"
+        release.set()
+        assert leader.result(5) == "before write"
+
+
+def test_async_callers_share_one_task():
+    group = Group()
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return "catalog"
+
+    async def main():
+        return await asyncio.gather(
+            *(group.do_async("catalog", load) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == ["catalog"] * 5
+    assert len(loads) == 1
+    assert group.counts()["catalog"].shared == 4
@@ -0,0 +1,118 @@
+import json
+
+import sqlalchemy
+
+from src.storage import CHECKOUT_OK
+from src.storage.sqlite import SqliteStorage
+from test.helpers import stock_red
+
+
+def test_restore_rewinds_ledgers_carts_and_prices(storage):
+    stock_red(storage, 3)
+    storage.save_prices({"RED": 55}, versions_to_keep=5)
+    storage.create_snapshot("before_sale")
+
+    cart_id = storage.create_cart("alice", "Wizard")
+    storage.set_cart_item(cart_id, "RED", 2, 300)
+    assert storage.checkout(cart_id, {}).status == CHECKOUT_OK
+    storage.save_prices({"RED": 70}, versions_to_keep=5)
+
+    assert storage.restore_snapshot("before_sale")
+    balances = storage.get_balances()
+    assert (balances.gold, balances.number_of_potions) == (90, 3)
+    assert storage.load_prices()[1] == {"RED": 55}
+    assert storage.search_orders("", "", "timestamp", "desc", 0, None) == []
+    # the journal and its balances are rewound together
+    assert storage.balances_since(0)[0]["gold"] == 90
+
+
+def test_snapshots_are_listed_replaced_and_deleted(storage):
+    storage.create_snapshot("a")
+    storage.create_snapshot("b")
+    storage.create_snapshot("a")
+    assert sorted(s.name for s in storage.list_snapshots()) == ["a", "b"]
+    assert storage.delete_snapshot("a")
+    assert not storage.delete_snapshot("a")
+    assert not storage.restore_snapshot("a")
+    assert [s.name for s in storage.list_snapshots()] == ["b"]
+
+
+def test_snapshot_routes(client):
+    assert client.post("/admin/snapshots/start").status_code == 204
+    client.post(
+        "/barrels/deliver/1",
+        json=[
+            {
+                "sku": "SMALL_RED_BARREL",
+                "ml_per_barrel": 500,
+                "potion_type": [1, 0, 0, 0],
+                "price": 100,
+                "quantity": 1,
+            }
+        ],
+    )
+    assert client.get("/inventory/audit").json()["gold"] == 0
+
+    assert client.post("/admin/snapshots/start/restore").status_code == 204
+    assert client.get("/inventory/audit").json()["gold"] == 100
+    assert client.post("/admin/snapshots/missing/restore").status_code == 404
+    assert client.post("/admin/snapshots/bad.name").status_code == 422
+
+
+def strip_from_snapshot(storage, name: str, table: str, column: str):
+    """Makes a snapshot look like one taken before column was added."""
+    with storage.engine.begin() as connection:
+        rows = connection.execute(
+            sqlalchemy.text(
+                "SELECT rows FROM game_snapshot_tables"
+                " WHERE snapshot_name = :name AND table_name = :table"
+            ),
+            {"name": name, "table": table},
+        ).scalar_one()
+        old_rows = [
+            {key: value for key, value in row.items() if key != column}
+            for row in json.loads(rows)
+        ]
+        connection.execute(
+            sqlalchemy.text(
+                "UPDATE game_snapshot_tables SET rows = :rows"
+                " WHERE snapshot_name = :name AND table_name = :table"
+            ),
+            {"rows": json.dumps(old_rows), "name": name, "table": table},
+        )
+
+
+def test_restore_fills_columns_older_snapshots_lack(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "shop.db"))
+    storage.reset()
+    storage.create_cart("alice", "Wizard")
+    storage.create_snapshot("old")
+    strip_from_snapshot(storage, "old", "carts", "age_ticks")
+
+    assert storage.restore_snapshot("old")
+    assert storage.reap_carts(1, 100) == 0
+    storage.queue_tick("Edgeday", 0)
+    storage.apply_analytics(100)
+    assert storage.reap_carts(1, 100) == 1
+
+
+def test_restoring_a_snapshot_without_idempotency_keys_keeps_deliveries_deduplicated(
+    tmp_path,
+):
+    storage = SqliteStorage(str(tmp_path / "shop.db"))
+    storage.reset()
+    assert storage.record_barrel_delivery(7, 60, 500, 0, 0, 0)
+    storage.create_snapshot("old")
+    # snapshots from before the table existed have no entry for it
+    with storage.engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                "DELETE FROM game_snapshot_tables"
+                " WHERE snapshot_name = 'old' AND table_name = 'idempotency_keys'"
+            )
+        )
+
+    assert storage.restore_snapshot("old")
+    assert not storage.record_barrel_delivery(7, 60, 500, 0, 0, 0)
+    assert storage.get_balances().red_ml == 500
+    assert storage.record_barrel_delivery(8, 60, 500, 0, 0, 0)
@@ -0,0 +1,88 @@
+from src.storage import (
+    CHECKOUT_ALREADY_DONE,
+    CHECKOUT_EMPTY,
+    CHECKOUT_INSUFFICIENT,
+    CHECKOUT_MISSING,
+    CHECKOUT_OK,
+    ITEM_RESERVED,
+)
+from test.helpers import RED, stock_red
+
+
+def test_reset_seeds_gold_and_capacity(storage):
+    balances = storage.get_balances()
+    assert balances.gold == 100
+    assert balances.ml_in_barrels == 0
+    assert balances.number_of_potions == 0
+    assert balances.max_potion_capacity == 50
+    assert balances.max_barrel_capacity == 10000
+
+
+def test_deliveries_move_gold_ml_and_potions(storage):
+    assert storage.record_barrel_delivery(1, 60, 500, 0, 0, 0)
+    assert storage.record_potion_delivery(
+        2, [(RED, 3)], {"red_ml": -300, "green_ml": 0, "blue_ml": 0, "dark_ml": 0}
+    )
+    assert storage.record_capacity_delivery(3, 50, 0, -1000)
+
+    balances = storage.get_balances()
+    assert (balances.gold, balances.red_ml, balances.number_of_potions) == (
+        40 - 1000,
+        200,
+        3,
+    )
+    assert balances.max_potion_capacity == 100
+    assert {stock.sku: stock.quantity for stock in storage.get_potion_stock()} == {
+        "RED": 3,
+        "GREEN": 0,
+    }
+
+
+def test_checkout_outcomes(storage):
+    stock_red(storage, 2)
+    assert storage.checkout(999, {}).status == CHECKOUT_MISSING
+
+    cart_id = storage.create_cart("alice", "Wizard")
+    assert storage.checkout(cart_id, {}).status == CHECKOUT_EMPTY
+
+    assert storage.set_cart_item(cart_id, "RED", 2, 300) == ITEM_RESERVED
+    outcome = storage.checkout(cart_id, {"RED": 45})
+    assert (outcome.status, outcome.total_potions_bought, outcome.total_gold_paid) == (
+        CHECKOUT_OK,
+        2,
+        90,
+    )
+    # a retried checkout reports the sale again instead of charging twice
+    assert storage.checkout(cart_id, {"RED": 45}).status == CHECKOUT_ALREADY_DONE
+    assert storage.get_balances().gold == 100 - 10 + 90
+
+
+def test_checkout_refuses_more_than_stock(storage):
+    stock_red(storage, 1)
+    cart_id = storage.create_cart("alice", "Wizard")
+    storage.set_cart_item(cart_id, "RED", 1, 0)
+    # the zero-second reservation has lapsed, so the stock is sold to another cart first
+    other = storage.create_cart("bob", "Rogue")
+    storage.set_cart_item(other, "RED", 1, 300)
+    assert storage.checkout(other, {}).status == CHECKOUT_OK
+    assert storage.checkout(cart_id, {}).status == CHECKOUT_INSUFFICIENT
+
+
+def test_search_orders_filters_and_sorts(storage):
+    stock_red(storage, 5)
+    for name, quantity in (("alice", 1), ("bob", 3)):
+        cart_id = storage.create_cart(name, "Wizard")
+        storage.set_cart_item(cart_id, "RED", quantity, 300)
+        storage.checkout(cart_id, {})
+
+    lines = storage.search_orders("", "", "line_item_total", "desc", 0, None)
+    assert [
+        (line.customer_name, line.quantity, line.line_item_total) for line in lines
+    ] == [
+        ("bob", 3, 150),
+        ("alice", 1, 50),
+    ]
+    assert lines[0].total_count == 2
+
+    lines = storage.search_orders("alice", "red potion", "timestamp", "asc", 0, 10)
+    assert [line.customer_name for line in lines] == ["alice"]